@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Backtesting of weight schemes on a matrix of historical returns. Many
+strategies (static weights or schedules of weights changing over time) are
+simulated together: there is one loop over time and holdings of all
+strategies are updated with matrix operations in every step. Strategies are
+rebalanced at the start of a period (before its returns are known) and pay
+proportional transaction costs on the traded value
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def rebalance_steps(index, rebalance):
+    """Returns a boolean array marking periods in which portfolios are
+    rebalanced.
+
+    Params:
+        index: DatetimeIndex
+            dates of returns
+        rebalance: None, int or str
+            None - never (buy and hold)
+            int - every rebalance periods
+            str - first period of every calendar period, e.g. 'W', 'M', 'Q',
+                  'Y' (pandas period frequencies)"""
+    steps = np.zeros(len(index), dtype=bool)
+    if rebalance is None or not len(index):
+        return steps
+    if isinstance(rebalance, int):
+        steps[::rebalance] = True
+        return steps
+    periods = index.to_period(rebalance)
+    steps[1:] = periods[1:] != periods[:-1]
+    return steps
+
+def _strategies(weights, symbols, index):
+    """Transforms weights into a list of names, a (S x N) matrix of static
+    weights (NaN rows for scheduled strategies) and a dict {step: [(strategy,
+    weights)]} of scheduled changes"""
+    if isinstance(weights, dict):
+        items = list(weights.items())
+    elif isinstance(weights, pd.DataFrame) and not isinstance(weights.index, pd.DatetimeIndex):
+        items = [(name, row.values) for name, row in weights.iterrows()]
+    elif isinstance(weights, pd.DataFrame):
+        items = [('schedule', weights)]
+    else:
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.ndim == 1:
+            items = [('portfolio', weights)]
+        else:
+            items = list(enumerate(weights))
+    names = [name for name, _ in items]
+    static = np.full((len(items), len(symbols)), np.nan)
+    events = {}
+    for s, (_, w) in enumerate(items):
+        if isinstance(w, pd.DataFrame):
+            w = w.reindex(columns=symbols).fillna(0)
+            # weights decided on a date are used from the first period on or after it
+            steps = index.searchsorted(w.index)
+            for step, row in zip(steps, w.values):
+                if step < len(index):
+                    events.setdefault(step, []).append((s, row))
+        else:
+            static[s] = np.asarray(w, dtype=np.float64)
+    return names, static, events
+
+
+class BacktestResult():
+    """Results of a backtest: equity curves (value of 1 invested at the start),
+    period returns, turnover and costs of every strategy"""
+
+    def __init__(self, equity, returns, turnover, costs, periods, risk_free):
+        self.equity = equity
+        self.returns = returns
+        self.turnover = turnover
+        self.costs = costs
+        self.periods = periods
+        self.risk_free = risk_free
+
+    @property
+    def drawdowns(self):
+        """Drawdowns of equity curves (fractions of the previous peak)"""
+        return self.equity / self.equity.cummax() - 1
+
+    def summary(self):
+        """Returns a DataFrame (strategies x metrics) with total and annualized
+        return, annualized volatility, Sharpe ratio, maximum drawdown, mean
+        annual turnover and total costs"""
+        n_years = len(self.returns) / self.periods
+        volatility = self.returns.std() * np.sqrt(self.periods)
+        summ = pd.DataFrame(index=self.equity.columns)
+        summ['total_return'] = self.equity.iloc[-1] - 1
+        summ['ann_return'] = self.equity.iloc[-1] ** (1 / n_years) - 1
+        summ['ann_volatility'] = volatility
+        excess = self.returns.mean() * self.periods - self.risk_free
+        summ['sharpe'] = excess / volatility
+        summ['max_drawdown'] = -self.drawdowns.min()
+        summ['ann_turnover'] = self.turnover.sum() / n_years
+        summ['total_costs'] = self.costs.sum()
+        return summ
+
+
+def backtest(returns, weights, rebalance='M', cost=0.001, periods=252, risk_free=0):
+    """Simulates strategies on historical returns.
+
+    Params:
+        returns: DataFrame
+            (T x N) log returns of assets, missing returns are treated as 0
+        weights: array, DataFrame or dict
+            - weights of assets (N) - one static strategy
+            - (S x N) array or DataFrame with strategies in rows - static
+              strategies
+            - DataFrame indexed by dates with assets in columns - schedule
+              of weights, e.g. from re-running an optimizer
+            - dict {name: weights or schedule}
+            a strategy holds cash until its first weights are known
+        rebalance: None, int or str
+            when weights are restored to targets (see rebalance_steps),
+            scheduled strategies are also rebalanced on every change
+        cost: float
+            transaction cost as a fraction of traded value
+        periods: int
+            number of periods per year (252 for daily returns, 12 for monthly)
+        risk_free: float
+            annual risk free rate used in Sharpe ratios
+
+    Returns a BacktestResult"""
+    index = returns.index
+    simple = np.expm1(np.nan_to_num(np.asarray(returns, dtype=np.float64)))
+    names, targets, events = _strategies(weights, list(returns.columns), index)
+    n_strategies = len(names)
+    calendar = rebalance_steps(index, rebalance)
+    # weights of assets held by every strategy (fractions of its value)
+    holdings = np.zeros((n_strategies, simple.shape[1]))
+    started = np.zeros(n_strategies, dtype=bool)
+    value = np.ones(n_strategies)
+    equity = np.empty((len(index), n_strategies))
+    period_returns = np.empty((len(index), n_strategies))
+    turnover = np.zeros((len(index), n_strategies))
+    costs = np.zeros((len(index), n_strategies))
+    for t in range(len(index)):
+        trade = np.zeros(n_strategies, dtype=bool)
+        for s, row in events.get(t, []):
+            targets[s] = row
+            trade[s] = True
+        # static strategies start in the first period
+        trade |= ~started & ~np.isnan(targets).any(axis=1)
+        if calendar[t]:
+            trade |= started
+        if trade.any():
+            traded = np.abs(targets[trade] - holdings[trade]).sum(axis=1)
+            turnover[t, trade] = traded
+            costs[t, trade] = traded * cost
+            holdings[trade] = targets[trade]
+            started |= trade
+        growth = holdings @ simple[t]
+        gross = 1 + growth
+        # weights drift with prices, cash (1 - sum of weights) earns nothing
+        holdings = holdings * (1 + simple[t]) / gross[:, None]
+        period_returns[t] = gross * (1 - costs[t]) - 1
+        value *= 1 + period_returns[t]
+        equity[t] = value
+    frame = lambda values: pd.DataFrame(values, index=index, columns=names)
+    return BacktestResult(frame(equity), frame(period_returns), frame(turnover),
+                          frame(costs), periods, risk_free)
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Correlation matrix of the whole universe of stored symbols. Correlations are
+pairwise-complete (every pair uses the dates on which both symbols have
+returns, so symbols listed at different times can be compared) and are
+calculated with matrix products of blocks of symbols in a pool of threads
+(numpy releases the GIL in matrix products). The N x N result is saved in a
+memory-mapped .npy file with a json file of symbols and settings, lookups of
+the most (or least) correlated symbols read it without recalculation.
+Directory of files is set by the PORTFOLIO_CORRELATION_DIR environment
+variable (correlations next to the database by default)
+"""
+
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from data.storage import DB_DIR, list_price_symbols
+from analysis.panel import ReturnsPanel
+
+
+CORRELATION_DIR = os.environ.get('PORTFOLIO_CORRELATION_DIR',
+                                 os.path.join(DB_DIR, 'correlations'))
+
+
+def pairwise_correlation(x_i, mask_i, x_j, mask_j, min_periods=2):
+    """Returns pairwise-complete correlations between columns of two blocks
+    of returns. x are returns with missing values replaced by 0 and mask are
+    1 where returns exist and 0 elsewhere (both T x n). Sums over common dates
+    of every pair come from products with the other block's mask. Pairs with
+    less than min_periods common dates are NaN"""
+    n = mask_i.T @ mask_j
+    sum_i = x_i.T @ mask_j
+    sum_j = mask_i.T @ x_j
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = x_i.T @ x_j - sum_i * sum_j / n
+        var_i = (x_i**2).T @ mask_j - sum_i**2 / n
+        var_j = mask_i.T @ x_j**2 - sum_j**2 / n
+        corr = cov / np.sqrt(var_i * var_j)
+    corr[n < min_periods] = np.nan
+    return np.clip(corr, -1, 1, out=corr)
+
+
+class UniverseCorrelation():
+    """Correlation matrix of many symbols persisted in files:
+        <path>/<name>.npy - N x N matrix (memory-mapped when loaded)
+        <path>/<name>.json - symbols and settings of the calculation
+
+    Example:
+        corr = UniverseCorrelation('daily').compute()
+        corr.top('PZU', 10)
+        corr.top_pairs(20, least=True)"""
+
+    def __init__(self, name='daily', path=CORRELATION_DIR):
+        self.name = name
+        self.path = path
+        self.matrix = None
+        self.symbols = None
+        self.settings = None
+
+    def _files(self):
+        base = os.path.join(self.path, self.name)
+        return base + '.npy', base + '.json'
+
+    def compute(self, symbols=None, monthly=False, min_periods=None, dtype=np.float32,
+                block_size=256, workers=None):
+        """Calculates the correlation matrix of all (or given) symbols and saves
+        it in files.
+
+        Params:
+            monthly: bool
+                use monthly instead of daily returns
+            min_periods: int
+                minimum number of common dates of a pair (60 days or 24 months
+                by default), correlations of other pairs are NaN
+            dtype: numpy type
+                float32 (half the memory and faster) or float64
+            block_size: int
+                number of symbols in a block, a pair of blocks is one task
+            workers: int
+                number of threads (all cores by default)"""
+        if symbols is None:
+            symbols = list_price_symbols()
+        if min_periods is None:
+            min_periods = 24 if monthly else 60
+        panel = ReturnsPanel.load(symbols, missing='pairwise')
+        values = panel.monthly_values if monthly else panel.values
+        mask = ~np.isnan(values)
+        # correlations don't depend on the mean, centered returns lose less
+        # precision in float32 sums
+        centered = values - np.nanmean(values, axis=0)
+        x = np.where(mask, centered, 0).astype(dtype)
+        mask = mask.astype(dtype)
+        n_symbols = len(symbols)
+        os.makedirs(self.path, exist_ok=True)
+        matrix_file, meta_file = self._files()
+        matrix = np.lib.format.open_memmap(matrix_file + '.tmp', mode='w+', dtype=dtype,
+                                           shape=(n_symbols, n_symbols))
+        blocks = [slice(start, min(start+block_size, n_symbols))
+                  for start in range(0, n_symbols, block_size)]
+
+        def fill(pair):
+            block_i, block_j = pair
+            corr = pairwise_correlation(x[:, block_i], mask[:, block_i], x[:, block_j],
+                                        mask[:, block_j], min_periods)
+            if block_i == block_j:
+                # exactly 1 instead of rounding errors of float32
+                diagonal = np.diagonal(corr).copy()
+                np.fill_diagonal(corr, np.where(np.isnan(diagonal), np.nan, 1))
+            matrix[block_i, block_j] = corr
+            matrix[block_j, block_i] = corr.T
+
+        pairs = [(blocks[i], blocks[j]) for i in range(len(blocks)) for j in range(i, len(blocks))]
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            list(pool.map(fill, pairs))
+        matrix.flush()
+        del matrix
+        os.replace(matrix_file + '.tmp', matrix_file)
+        index = panel.monthly_index if monthly else panel.index
+        settings = {'monthly': monthly, 'min_periods': min_periods,
+                    'dtype': np.dtype(dtype).name,
+                    'last_date': index[-1].strftime('%Y-%m-%d') if len(index) else None}
+        with open(meta_file, 'w') as f:
+            json.dump({'symbols': list(symbols), 'settings': settings}, f)
+        return self.load()
+
+    def load(self):
+        """Opens the saved matrix (memory-mapped, read-only)"""
+        matrix_file, meta_file = self._files()
+        with open(meta_file) as f:
+            meta = json.load(f)
+        self.symbols = meta['symbols']
+        self.settings = meta['settings']
+        self.matrix = np.load(matrix_file, mmap_mode='r')
+        self._positions = {symbol: i for i, symbol in enumerate(self.symbols)}
+        return self
+
+    def frame(self, symbols=None):
+        """Returns the correlation matrix (or its part for given symbols) as a
+        DataFrame"""
+        if symbols is None:
+            return pd.DataFrame(np.asarray(self.matrix), index=self.symbols,
+                                columns=self.symbols)
+        positions = [self._positions[symbol] for symbol in symbols]
+        return pd.DataFrame(self.matrix[np.ix_(positions, positions)], index=symbols,
+                            columns=symbols)
+
+    def top(self, symbol, k=10, least=False):
+        """Returns a Series of k symbols most (or least) correlated with a given
+        symbol. Only one row of the matrix is read"""
+        position = self._positions[symbol]
+        row = np.array(self.matrix[position], dtype=np.float64)
+        row[position] = np.nan
+        order = np.argsort(np.where(np.isnan(row), np.inf, row if least else -row))
+        order = order[:min(k, int((~np.isnan(row)).sum()))]
+        return pd.Series(row[order], index=[self.symbols[i] for i in order], name=symbol)
+
+    def top_pairs(self, k=20, least=False, block_size=512):
+        """Returns a DataFrame of k pairs of different symbols with the highest
+        (or lowest) correlations. Rows of the matrix are read in blocks and
+        only the best k pairs of every block are kept"""
+        n_symbols = len(self.symbols)
+        candidates = []
+        for start in range(0, n_symbols, block_size):
+            block = np.array(self.matrix[start:start+block_size], dtype=np.float64)
+            rows = np.arange(start, start+len(block))[:, None]
+            # every pair once - only the upper triangle without the diagonal
+            block[np.arange(n_symbols)[None, :] <= rows] = np.nan
+            scores = np.where(np.isnan(block), np.inf, block if least else -block).ravel()
+            best = np.argpartition(scores, min(k, len(scores)-1))[:k]
+            best = best[np.isfinite(scores[best])]
+            for flat in best:
+                i, j = divmod(flat, n_symbols)
+                candidates.append((self.symbols[start+i], self.symbols[j], block[i, j]))
+        pairs = pd.DataFrame(candidates, columns=['symbol_1', 'symbol_2', 'correlation'])
+        pairs = pairs.sort_values('correlation', ascending=least).head(k)
+        return pairs.reset_index(drop=True)
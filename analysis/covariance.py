@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Estimators of mean returns and covariance matrices and a provider that
+memoizes them. Besides the sample covariance there are estimators that stay
+well conditioned when there are few observations per asset (36 months of 40
+stocks make the sample covariance singular):
+    ledoit_wolf - sample covariance shrunk towards a scaled identity matrix
+    ewma - exponentially weighted covariance (RiskMetrics)
+    factor - statistical factor model from principal components
+"""
+
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+def cholesky_factor(cov):
+    """Returns a lower triangular L such that L @ L.T equals the covariance
+    matrix. Matrices which are not positive definite (e.g. with perfectly
+    correlated assets) are factorized with an eigendecomposition with
+    negative eigenvalues set to zero"""
+    cov = np.atleast_2d(cov)
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        values, vectors = np.linalg.eigh(cov)
+        return vectors * np.sqrt(np.clip(values, 0, None))
+
+def sample_covariance(values):
+    """Sample covariance matrix of rows of observations"""
+    return np.atleast_2d(np.cov(values, rowvar=False))
+
+def ledoit_wolf_covariance(values):
+    """Ledoit-Wolf (2004) estimator: a combination of the sample covariance S
+    and mu * I (mu is the mean variance) with the shrinkage intensity that
+    minimizes the expected squared error. Returns the matrix and the
+    intensity"""
+    n_obs = len(values)
+    centered = values - values.mean(axis=0)
+    sample = centered.T @ centered / n_obs
+    mu = np.trace(sample) / sample.shape[0]
+    target = mu * np.eye(sample.shape[0])
+    distance = ((sample - target)**2).sum()
+    # mean squared distance of single observations' cross products from S:
+    # sum over t of ||x x' - S||^2 = sum of ||x||^4 - T * ||S||^2
+    spread = ((centered**2).sum(axis=1)**2).sum() - n_obs * (sample**2).sum()
+    spread = min(spread / n_obs**2, distance)
+    shrinkage = spread / distance if distance > 0 else 1.0
+    return shrinkage * target + (1 - shrinkage) * sample, shrinkage
+
+def ewma_covariance(values, lam=0.94):
+    """Exponentially weighted covariance matrix, weight of an observation k
+    periods before the last one is proportional to lam**k"""
+    weights = lam ** np.arange(len(values)-1, -1, -1, dtype=np.float64)
+    weights /= weights.sum()
+    centered = values - weights @ values
+    return (centered * weights[:, None]).T @ centered / (1 - (weights**2).sum())
+
+def factor_covariance(values, n_factors=3):
+    """Covariance matrix of a statistical factor model: exposures to the
+    n_factors largest principal components of the sample covariance plus
+    idiosyncratic variances (diagonal) that keep the sample variances"""
+    sample = sample_covariance(values)
+    n_factors = min(n_factors, len(sample))
+    eigenvalues, eigenvectors = np.linalg.eigh(sample)
+    exposures = eigenvectors[:, -n_factors:] * np.sqrt(np.clip(eigenvalues[-n_factors:], 0, None))
+    common = exposures @ exposures.T
+    residual = np.clip(np.diag(sample) - np.diag(common), 1e-12, None)
+    return common + np.diag(residual)
+
+ESTIMATORS = {
+    'sample': lambda values: sample_covariance(values),
+    'ledoit_wolf': lambda values: ledoit_wolf_covariance(values)[0],
+    'ewma': ewma_covariance,
+    'factor': factor_covariance,
+}
+
+
+class CovarianceEstimate():
+    """Mean returns and a covariance matrix of symbols with lazily calculated
+    (and then kept) correlation matrix and Cholesky factor"""
+
+    def __init__(self, symbols, mean, cov, estimator, n_obs):
+        self.symbols = list(symbols)
+        self.mean = mean
+        self.cov = cov
+        self.estimator = estimator
+        self.n_obs = n_obs
+        self._cholesky = None
+        self._corr = None
+
+    @property
+    def cholesky(self):
+        if self._cholesky is None:
+            self._cholesky = cholesky_factor(self.cov)
+        return self._cholesky
+
+    @property
+    def corr(self):
+        if self._corr is None:
+            std = np.sqrt(np.diag(self.cov))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self._corr = self.cov / np.outer(std, std)
+        return self._corr
+
+    def frame(self, corr=False):
+        """Covariance (or correlation) matrix as a DataFrame"""
+        return pd.DataFrame(self.corr if corr else self.cov, index=self.symbols,
+                            columns=self.symbols)
+
+
+class CovarianceProvider():
+    """Computes and memoizes estimates for windows of a ReturnsPanel. Estimates
+    are keyed by (symbols, window and its end, estimator and its parameters,
+    frequency, missing data policy, version of the panel's data) and the least
+    recently used ones are removed when there are more than maxsize of them"""
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self._estimates = OrderedDict()
+
+    def clear(self):
+        self._estimates.clear()
+
+    def estimate(self, panel, window=36, estimator='sample', monthly=True, end=None,
+                 **params):
+        """Returns a CovarianceEstimate of the last window months (or days if
+        monthly is False) of a ReturnsPanel before the row end (all rows by
+        default). With the 'pairwise' policy the sample estimator uses all
+        pairs of observations, other estimators use dates when all symbols
+        have returns. Params are passed to the estimator (e.g. lam for
+        'ewma', n_factors for 'factor')"""
+        if estimator not in ESTIMATORS:
+            raise ValueError("Unknown covariance estimator: {}".format(estimator))
+        values = panel.monthly_values if monthly else panel.values
+        values = values[:end]
+        key = (tuple(panel.symbols), window, len(values), estimator,
+               tuple(sorted(params.items())), monthly, panel.missing, panel.version)
+        if key in self._estimates:
+            self._estimates.move_to_end(key)
+            return self._estimates[key]
+        if window is not None:
+            values = values[-window:]
+        complete = values[~np.isnan(values).any(axis=1)]
+        if estimator == 'sample' and len(complete) < len(values):
+            mean, cov = panel.stats(window, monthly, end)
+            cov = np.atleast_2d(cov)
+        else:
+            mean = complete.mean(axis=0)
+            cov = ESTIMATORS[estimator](complete, **params)
+        estimate = CovarianceEstimate(panel.symbols, mean, cov, estimator, len(complete))
+        self._estimates[key] = estimate
+        if len(self._estimates) > self.maxsize:
+            self._estimates.popitem(last=False)
+        return estimate
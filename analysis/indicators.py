@@ -0,0 +1,443 @@
+# -*- coding: utf-8 -*-
+"""
+Technical indicators of whole panels of prices (one column per symbol):
+simple and exponential moving averages, RSI, MACD, Bollinger bands, average
+true range and rolling beta against the market index. All columns are
+calculated together - exponential averages are recursive linear filters
+(scipy.signal.lfilter) and moving windows differences of cumulative sums.
+
+IndicatorSet keeps the state of every indicator after a calculation (last
+values of recursions and circular buffers of the last window rows), so a
+new day of prices is added with O(1) work per symbol instead of calculating
+the whole history again. The state can be saved and loaded between runs
+"""
+
+import pickle
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+from data.cache import read_price_data_for_symbols
+from data.storage import list_price_symbols
+from analysis.rolling import as_matrix, incomplete_windows
+
+
+def _first_valid_filled(values):
+    """Returns values with NaN before the first valid value of every column
+    replaced by that value (so that recursions start from it) and a mask of
+    the replaced rows"""
+    if not len(values):
+        return values, np.zeros(values.shape, dtype=bool)
+    valid = ~np.isnan(values)
+    first = np.where(valid.any(axis=0), valid.argmax(axis=0), len(values))
+    leading = np.arange(len(values))[:, None] < first
+    start = values[np.minimum(first, len(values)-1), np.arange(values.shape[1])]
+    return np.where(leading, start, values), leading
+
+def _recursive_average(values, alpha):
+    """Exponential average y[t] = alpha * x[t] + (1 - alpha) * y[t-1] of every
+    column starting from its first valid value (like pandas ewm with
+    adjust=False), NaN before it"""
+    filled, leading = _first_valid_filled(values)
+    if not len(values):
+        return filled
+    average = lfilter([alpha], [1, alpha - 1], filled, axis=0,
+                      zi=(1 - alpha) * filled[:1])[0]
+    average[leading] = np.nan
+    return average
+
+def _rolling_sum(values, window):
+    """Sums of windows of values, NaN for the first window-1 rows and for
+    windows with missing values"""
+    missing = np.isnan(values)
+    sums = np.cumsum(np.where(missing, 0, values), axis=0)
+    sums[window:] -= sums[:-window].copy()
+    sums[incomplete_windows(missing, window)] = np.nan
+    return sums
+
+def _log_returns(prices):
+    returns = np.full(prices.shape, np.nan)
+    returns[1:] = np.diff(np.log(prices), axis=0)
+    return returns
+
+def _beta_inputs(prices, market):
+    """Inputs of beta (see _aligned_returns) from prices of assets (T x N)
+    and of the market (T)"""
+    return _aligned_returns(_log_returns(prices), _log_returns(market[:, None]))
+
+def _aligned_returns(returns, market):
+    """Returns of assets, of the market and their products with NaN where
+    either of them is missing, so that all sums of a window use the same
+    dates"""
+    market = np.broadcast_to(market, returns.shape)
+    missing = np.isnan(returns) | np.isnan(market)
+    asset = np.where(missing, np.nan, returns)
+    market = np.where(missing, np.nan, market)
+    return asset, market, asset * market, market**2
+
+def _beta(window, asset, market, product, market_sq):
+    """Beta from sums of a window"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (product - asset * market / window) / (market_sq - market**2 / window)
+
+def _rsi(gains, losses):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 * gains / (gains + losses)
+
+def _rsi_averages(values, window):
+    """Wilder's averages (alpha = 1 / window) of gains and losses of prices"""
+    changes = np.full(values.shape, np.nan)
+    changes[1:] = np.diff(values, axis=0)
+    return (_recursive_average(np.maximum(changes, 0), 1 / window),
+            _recursive_average(np.maximum(-changes, 0), 1 / window))
+
+def _macd_averages(values, fast, slow, signal):
+    """Fast and slow EMAs of prices and the signal line (EMA of their
+    difference)"""
+    fast = _recursive_average(values, 2 / (fast + 1))
+    slow = _recursive_average(values, 2 / (slow + 1))
+    return fast, slow, _recursive_average(fast - slow, 2 / (signal + 1))
+
+def _bollinger_sums(values, window):
+    """Returns the first valid value of every column (a row), values centered
+    on it (to avoid cancellation) and window sums of centered values and of
+    their squares"""
+    shift = _first_valid_filled(values)[0][:1]
+    centered = values - shift
+    return shift, centered, _rolling_sum(centered, window), _rolling_sum(centered**2, window)
+
+def _bands(sums, squares, shift, window, width):
+    """Middle, upper and lower Bollinger band from sums of a window of
+    centered values"""
+    middle = sums / window
+    std = np.sqrt(np.maximum(squares - sums * middle, 0) / (window - 1))
+    middle = middle + shift
+    return [middle, middle + width * std, middle - width * std]
+
+def _true_range(high, low, previous_close):
+    return np.fmax(high - low, np.fmax(np.abs(high - previous_close),
+                                       np.abs(low - previous_close)))
+
+
+def sma(data, window):
+    """Simple moving average of every column, NaN for windows with missing
+    values"""
+    values, wrap = as_matrix(data)
+    return wrap(_rolling_sum(values, window) / window)
+
+def ema(data, span):
+    """Exponential moving average with alpha = 2 / (span + 1) of every column
+    starting from its first valid value"""
+    values, wrap = as_matrix(data)
+    return wrap(_recursive_average(values, 2 / (span + 1)))
+
+def rsi(data, window=14):
+    """Relative strength index of prices of every column: 100 * G / (G + L)
+    where G and L are Wilder's averages (alpha = 1 / window) of gains and
+    losses"""
+    values, wrap = as_matrix(data)
+    return wrap(_rsi(*_rsi_averages(values, window)))
+
+def macd(data, fast=12, slow=26, signal=9):
+    """Returns MACD (difference of fast and slow EMAs), its signal line (EMA of
+    MACD) and the histogram (MACD - signal) of every column"""
+    values, wrap = as_matrix(data)
+    fast, slow, signal_line = _macd_averages(values, fast, slow, signal)
+    line = fast - slow
+    return wrap(line), wrap(signal_line), wrap(line - signal_line)
+
+def bollinger_bands(data, window=20, width=2):
+    """Returns the middle (simple moving average), upper and lower Bollinger
+    band of every column, bands are width sample standard deviations of the
+    window from the middle"""
+    values, wrap = as_matrix(data)
+    shift, _, sums, squares = _bollinger_sums(values, window)
+    return tuple(wrap(band) for band in _bands(sums, squares, shift, window, width))
+
+def average_true_range(high, low, close, window=14):
+    """Wilder's average (alpha = 1 / window) of the true range: the largest of
+    high - low and distances of high and low from the previous close"""
+    close, wrap = as_matrix(close)
+    previous = np.full(close.shape, np.nan)
+    previous[1:] = close[:-1]
+    true_range = _true_range(as_matrix(high)[0], as_matrix(low)[0], previous)
+    return wrap(_recursive_average(true_range, 1 / window))
+
+def rolling_beta(data, market, window=252):
+    """Beta of log returns of every column of prices against log returns of
+    market prices (e.g. WIG) in rolling windows of window returns"""
+    values, wrap = as_matrix(data)
+    inputs = _beta_inputs(values, np.asarray(market, dtype=np.float64))
+    return wrap(_beta(window, *[_rolling_sum(x, window) for x in inputs]))
+
+
+class _RollingSums():
+    """Sums of the last window rows of a stream of rows (NaN where any of them
+    is missing). Rows are kept in a circular buffer, sums are updated with the
+    row entering and the one leaving the window and recalculated from the
+    buffer every refresh rows to stop rounding errors from adding up"""
+
+    def __init__(self, history, window, refresh=1000):
+        self.window = window
+        self.refresh = refresh
+        self.buffer = np.full((window, history.shape[1]), np.nan)
+        rows = history[-window:]
+        self.buffer[window-len(rows):] = rows
+        # position of the oldest row
+        self.position = 0
+        self._recalculate()
+
+    def _recalculate(self):
+        missing = np.isnan(self.buffer)
+        self.sums = np.where(missing, 0, self.buffer).sum(axis=0)
+        self.missing = missing.sum(axis=0)
+        self.pushed = 0
+
+    def push(self, row):
+        """Adds a row and returns sums of the window ending with it"""
+        old = self.buffer[self.position].copy()
+        self.buffer[self.position] = row
+        self.position = (self.position + 1) % self.window
+        self.pushed += 1
+        if self.pushed >= self.refresh:
+            self._recalculate()
+        else:
+            self.sums += np.nan_to_num(row) - np.nan_to_num(old)
+            self.missing += np.isnan(row).astype(int) - np.isnan(old)
+        return np.where(self.missing > 0, np.nan, self.sums)
+
+
+class IndicatorSet():
+    """Indicators of many symbols calculated together and kept up to date
+    incrementally.
+
+    Params:
+        sma_windows: list of int
+            windows of simple moving averages of close prices
+        ema_spans: list of int
+            spans of exponential moving averages of close prices
+        rsi_window: int
+        macd_spans: tuple
+            (fast, slow, signal) spans of MACD
+        bollinger: tuple
+            (window, width) of Bollinger bands
+        atr_window: int
+        beta_window: int
+            number of returns in windows of beta against the market
+        refresh: int
+            moving window sums are recalculated every refresh updates
+
+    Missing prices of days without trading are filled with the last close:
+    close is carried forward and high and low are set to it, so such days
+    have no price change and no range. Prices before the first price of a
+    symbol stay NaN - its indicators start at its first price and the first
+    window-1 values of moving windows are NaN.
+
+    Example:
+        indicators = IndicatorSet.load()
+        # every evening, with prices of the new day (Series indexed by symbol)
+        indicators.update(date, high, low, close, market_close)
+        indicators.latest()"""
+
+    def __init__(self, sma_windows=(20, 50, 200), ema_spans=(20,), rsi_window=14,
+                 macd_spans=(12, 26, 9), bollinger=(20, 2), atr_window=14,
+                 beta_window=252, refresh=1000):
+        self.sma_windows = tuple(sma_windows)
+        self.ema_spans = tuple(ema_spans)
+        self.rsi_window = rsi_window
+        self.macd_spans = tuple(macd_spans)
+        self.bollinger = tuple(bollinger)
+        self.atr_window = atr_window
+        self.beta_window = beta_window
+        self.refresh = refresh
+        self.symbols = None
+        self.date = None
+        self.values = None
+
+    def names(self, market=True):
+        """Names of indicators in the order of results"""
+        names = ['sma_{}'.format(w) for w in self.sma_windows]
+        names += ['ema_{}'.format(s) for s in self.ema_spans]
+        names += ['rsi_{}'.format(self.rsi_window), 'macd', 'macd_signal', 'macd_hist',
+                  'bb_middle', 'bb_upper', 'bb_lower', 'atr_{}'.format(self.atr_window)]
+        if market:
+            names.append('beta_{}'.format(self.beta_window))
+        return names
+
+    @staticmethod
+    def _fill(high, low, close):
+        """Filling policy for missing prices (see the class description)"""
+        close = pd.DataFrame(close).ffill().values
+        high = np.where(np.isnan(high), close, high)
+        low = np.where(np.isnan(low), close, low)
+        return high, low, close
+
+    def compute(self, high, low, close, market=None):
+        """Calculates indicators for the whole history and keeps the state
+        needed for updates.
+
+        Params:
+            high, low, close: DataFrame
+                (T x N) prices indexed by date with one column per symbol
+            market: Series
+                close prices of the market index (e.g. WIG), without it beta
+                is not calculated
+
+        Returns a DataFrame indexed by date with (indicator, symbol) columns"""
+        self.symbols = list(close.columns)
+        index = close.index
+        high, low, close_values = self._fill(high.reindex_like(close).values.astype(np.float64),
+                                             low.reindex_like(close).values.astype(np.float64),
+                                             close.values.astype(np.float64))
+        results = [sma(close_values, w) for w in self.sma_windows]
+        emas = [ema(close_values, s) for s in self.ema_spans]
+        results += emas
+        gains, losses = _rsi_averages(close_values, self.rsi_window)
+        fast, slow, signal = _macd_averages(close_values, *self.macd_spans)
+        results += [_rsi(gains, losses), fast - slow, signal, fast - slow - signal]
+        shift, centered, sums, squares = _bollinger_sums(close_values, self.bollinger[0])
+        results += _bands(sums, squares, shift, *self.bollinger)
+        atr = average_true_range(high, low, close_values, self.atr_window)
+        results.append(atr)
+        if market is not None:
+            market = market.reindex(index.union(market.index)).ffill().reindex(index)
+            market_close = market.values.astype(np.float64)
+            inputs = _beta_inputs(close_values, market_close)
+            results.append(_beta(self.beta_window,
+                                 *[_rolling_sum(x, self.beta_window) for x in inputs]))
+        # state for updates
+        last = lambda values: values[-1] if len(values) else np.full(len(self.symbols), np.nan)
+        self._state = {
+            'close': last(close_values), 'emas': [last(e) for e in emas],
+            'gains': last(gains), 'losses': last(losses), 'fast': last(fast),
+            'slow': last(slow), 'signal': last(signal), 'atr': last(atr),
+            'shift': shift[0] if len(shift) else np.full(len(self.symbols), np.nan),
+            'market': market_close[-1] if market is not None and len(index) else np.nan}
+        self._windows = {'sma': [_RollingSums(close_values, w, self.refresh)
+                                 for w in self.sma_windows],
+                         'bollinger': _RollingSums(np.hstack([centered, centered**2]),
+                                                   self.bollinger[0], self.refresh)}
+        if market is not None:
+            self._windows['beta'] = _RollingSums(np.hstack(inputs), self.beta_window,
+                                                 self.refresh)
+        self.market = market is not None
+        self.date = index[-1] if len(index) else None
+        self._columns = pd.MultiIndex.from_product([self.names(self.market), self.symbols],
+                                                   names=['indicator', 'symbol'])
+        frame = pd.DataFrame(np.hstack(results), index=index, columns=self._columns)
+        self.values = frame.iloc[-1] if len(index) else None
+        return frame
+
+    def _alphas(self):
+        fast, slow, signal = self.macd_spans
+        alphas = {'ema_{}'.format(s): 2 / (s + 1) for s in self.ema_spans}
+        alphas.update({'rsi': 1 / self.rsi_window, 'fast': 2 / (fast + 1),
+                       'slow': 2 / (slow + 1), 'signal': 2 / (signal + 1),
+                       'atr': 1 / self.atr_window})
+        return alphas
+
+    def update(self, date, high, low, close, market=None):
+        """Adds prices of a new day and returns the indicators of that day (a
+        Series with the same (indicator, symbol) index as columns of compute,
+        use .unstack('indicator') for a symbols x indicators table). Costs
+        O(1) per symbol.
+
+        Params:
+            date: Timestamp
+                date of prices, must be later than the last date
+            high, low, close: Series
+                prices indexed by symbol, symbols without prices (or missing
+                in the Series) are filled like in compute
+            market: float
+                close of the market index, required if compute got market
+                prices"""
+        if self.symbols is None:
+            raise ValueError("Indicators have to be computed before updates")
+        date = pd.Timestamp(date)
+        if self.date is not None and date <= self.date:
+            raise ValueError("Prices of {} are not newer than {}".format(
+                date.date(), self.date.date()))
+        if self.market and market is None:
+            raise ValueError("Market close is required to update beta")
+        state = self._state
+        prices = [pd.Series(p).reindex(self.symbols).values.astype(np.float64)
+                  for p in (high, low, close)]
+        close = np.where(np.isnan(prices[2]), state['close'], prices[2])
+        high = np.where(np.isnan(prices[0]), close, prices[0])
+        low = np.where(np.isnan(prices[1]), close, prices[1])
+        alphas = self._alphas()
+
+        def average(key, x, alpha):
+            """One step of a recursive average started by the first value"""
+            previous = state[key]
+            state[key] = np.where(np.isnan(previous), x, alpha * x + (1 - alpha) * previous)
+            return state[key]
+
+        results = [window.push(close) / w
+                   for window, w in zip(self._windows['sma'], self.sma_windows)]
+        for i, span in enumerate(self.ema_spans):
+            previous = state['emas'][i]
+            alpha = alphas['ema_{}'.format(span)]
+            state['emas'][i] = np.where(np.isnan(previous), close,
+                                        alpha * close + (1 - alpha) * previous)
+            results.append(state['emas'][i])
+        change = close - state['close']
+        gains = average('gains', np.maximum(change, 0), alphas['rsi'])
+        losses = average('losses', np.maximum(-change, 0), alphas['rsi'])
+        line = average('fast', close, alphas['fast']) - average('slow', close, alphas['slow'])
+        signal = average('signal', line, alphas['signal'])
+        results += [_rsi(gains, losses), line, signal, line - signal]
+        # symbols with the first price start the centering of bands
+        state['shift'] = np.where(np.isnan(state['shift']), close, state['shift'])
+        centered = close - state['shift']
+        sums = self._windows['bollinger'].push(np.r_[centered, centered**2])
+        results += _bands(*np.split(sums, 2), state['shift'], *self.bollinger)
+        results.append(average('atr', _true_range(high, low, state['close']), alphas['atr']))
+        if self.market:
+            returns = np.log(close / state['close'])
+            market_return = np.log(market / state['market'])
+            inputs = _aligned_returns(returns[None, :], market_return)
+            sums = self._windows['beta'].push(np.hstack(inputs)[0])
+            results.append(_beta(self.beta_window, *np.split(sums, 4)))
+            state['market'] = market
+        state['close'] = close
+        self.date = date
+        self.values = pd.Series(np.concatenate(results), index=self._columns, name=date)
+        return self.values
+
+    def latest(self):
+        """Returns the last values of indicators as a DataFrame (symbols x
+        indicators)"""
+        return self.values.unstack('indicator')[self.names(self.market)]
+
+    def save(self, path):
+        """Saves settings and state (without the history) in a pickle file"""
+        state = {key: value for key, value in self.__dict__.items() if key != 'history'}
+        with open(path, 'wb') as f:
+            pickle.dump(state, f)
+
+    @classmethod
+    def restore(cls, path):
+        """Loads indicators saved with the save method"""
+        indicators = cls()
+        with open(path, 'rb') as f:
+            indicators.__dict__.update(pickle.load(f))
+        return indicators
+
+    @classmethod
+    def load(cls, symbols=None, market='WIG', use_cache=True, **params):
+        """Reads prices of all (or given) symbols and of the market index from
+        the price cache, aligns them on the union of dates and computes
+        indicators. The DataFrame of the whole history is kept in the history
+        attribute"""
+        if symbols is None:
+            symbols = [s for s in list_price_symbols() if s != market]
+        names = list(symbols) + ([market] if market is not None else [])
+        data = read_price_data_for_symbols(names, use_cache)
+        prices = {column: pd.concat({symbol: data[symbol][column] for symbol in symbols},
+                                    axis=1, join='outer', sort=True)
+                  for column in ('high', 'low', 'close')}
+        indicators = cls(**params)
+        indicators.history = indicators.compute(
+            prices['high'], prices['low'], prices['close'],
+            data[market]['close'] if market is not None else None)
+        return indicators
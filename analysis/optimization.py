@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Mean-variance optimization functions (minimum variance, maximum return/risk,
+target return and the efficient frontier) solved with scipy's SLSQP with
+analytic gradients. All functions work on single-period mean returns and
+a variance-covariance matrix and return weights as 1-D numpy arrays
+"""
+
+import numpy as np
+from scipy.optimize import minimize
+
+
+def weight_bounds(bounds, symbols):
+    """Transforms bounds into a list of (low, high) tuples, one for every symbol.
+
+    Params:
+        bounds: tuple, list or dict
+            if tuple (low, high) - the same bounds for all symbols
+            if list of tuples - bounds in the order of symbols
+            if dict {symbol: (low, high)} - bounds for given symbols, the rest
+            is long-only (0, 1)"""
+    if isinstance(bounds, dict):
+        return [tuple(bounds.get(symbol, (0, 1))) for symbol in symbols]
+    if len(bounds) == 2 and np.isscalar(bounds[0]):
+        return [tuple(bounds)] * len(symbols)
+    if len(bounds) != len(symbols):
+        raise ValueError("{} bounds given for {} symbols".format(len(bounds), len(symbols)))
+    return [tuple(b) for b in bounds]
+
+def _initial_weights(bounds):
+    """Returns feasible weights that sum up to 1 and respect the bounds"""
+    low = np.array([b[0] for b in bounds], dtype=np.float64)
+    high = np.array([b[1] for b in bounds], dtype=np.float64)
+    if low.sum() > 1 or high.sum() < 1:
+        raise ValueError("Weights cannot sum up to 1 within the given bounds")
+    # spread what is left above the lower bounds proportionally to the free room
+    room = high - low
+    if room.sum() == 0:
+        return low
+    return low + room * (1 - low.sum()) / room.sum()
+
+def _solve(objective, x0, bounds, constraints):
+    res = minimize(objective, x0, jac=True, method='SLSQP', bounds=bounds,
+                   constraints=constraints, options={'maxiter': 500, 'ftol': 1e-12})
+    if not res.success:
+        raise ValueError("Optimization failed: {}".format(res.message))
+    return res.x
+
+def _variance(cov_matrix):
+    def objective(w):
+        cw = cov_matrix @ w
+        return w @ cw, 2 * cw
+    return objective
+
+_budget = {'type': 'eq', 'fun': lambda w: w.sum() - 1, 'jac': lambda w: np.ones_like(w)}
+
+def min_variance_weights(mean_returns, cov_matrix, bounds, x0=None):
+    """Returns weights of the minimum variance portfolio"""
+    if x0 is None:
+        x0 = _initial_weights(bounds)
+    return _solve(_variance(np.asarray(cov_matrix)), x0, bounds, [_budget])
+
+def max_return_weights(mean_returns, bounds):
+    """Returns weights of the portfolio with the highest expected return that
+    can be reached within the bounds (greedy solution of the linear program)"""
+    weights = np.array([b[0] for b in bounds], dtype=np.float64)
+    left = 1 - weights.sum()
+    # fill the best stocks up to their upper bounds first
+    for i in np.argsort(mean_returns)[::-1]:
+        add = min(bounds[i][1] - weights[i], left)
+        weights[i] += add
+        left -= add
+    return weights
+
+def max_sharpe_weights(mean_returns, cov_matrix, bounds, risk_free=0, x0=None):
+    """Returns weights of the portfolio with the highest (expected return -
+    risk free rate) / standard deviation ratio"""
+    mean_returns = np.asarray(mean_returns)
+    cov_matrix = np.asarray(cov_matrix)
+    if x0 is None:
+        x0 = _initial_weights(bounds)
+
+    def objective(w):
+        cw = cov_matrix @ w
+        std = np.sqrt(w @ cw)
+        excess = w @ mean_returns - risk_free
+        # gradient of -excess/std
+        grad = -(mean_returns / std - excess * cw / std**3)
+        return -excess / std, grad
+
+    return _solve(objective, x0, bounds, [_budget])
+
+def target_return_weights(mean_returns, cov_matrix, target, bounds, x0=None):
+    """Returns weights of the minimum variance portfolio with the expected
+    return equal to target"""
+    mean_returns = np.asarray(mean_returns)
+    if x0 is None:
+        x0 = _initial_weights(bounds)
+    target_constraint = {'type': 'eq', 'fun': lambda w: w @ mean_returns - target,
+                         'jac': lambda w: mean_returns}
+    return _solve(_variance(np.asarray(cov_matrix)), x0, bounds,
+                  [_budget, target_constraint])
+
+def efficient_frontier(mean_returns, cov_matrix, bounds, n_points=50):
+    """Returns a (n_points x n_assets) matrix of weights of portfolios on the
+    efficient frontier, from the minimum variance to the maximum return
+    portfolio. Every point is warm-started from the previous solution"""
+    mean_returns = np.asarray(mean_returns)
+    w_min = min_variance_weights(mean_returns, cov_matrix, bounds)
+    w_max = max_return_weights(mean_returns, bounds)
+    targets = np.linspace(w_min @ mean_returns, w_max @ mean_returns, n_points)
+    frontier = np.empty((n_points, len(mean_returns)))
+    frontier[0] = w_min
+    frontier[-1] = w_max
+    x0 = w_min
+    for i in range(1, n_points-1):
+        x0 = target_return_weights(mean_returns, cov_matrix, targets[i], bounds, x0)
+        frontier[i] = x0
+    return frontier
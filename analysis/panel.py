@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Panel of daily and monthly log returns of many symbols stored as contiguous
+float64 (T x N) matrices with a date index. Prices of all symbols are loaded
+together and aligned with a single outer join, missing data are handled with
+an explicit policy
+"""
+
+import hashlib
+import numpy as np
+import pandas as pd
+from data.cache import read_price_data_for_symbols
+from data.storage import get_storage, read_price_panel, check_price_symbols
+
+
+MISSING_POLICIES = ('drop', 'ffill', 'pairwise')
+
+
+def _monthly_sums(values, index):
+    """Sums daily returns in calendar months. Returns a matrix of monthly
+    returns (NaN where a symbol has no returns in a month) and an index of
+    first days of months"""
+    months = index.to_period('M')
+    starts = np.flatnonzero(np.r_[True, months[1:] != months[:-1]]) if len(index) else []
+    if not len(starts):
+        return np.empty((0, values.shape[1])), pd.DatetimeIndex([], name=index.name)
+    missing = np.isnan(values)
+    sums = np.add.reduceat(np.where(missing, 0, values), starts, axis=0)
+    counts = np.add.reduceat(~missing, starts, axis=0)
+    sums[counts == 0] = np.nan
+    return sums, pd.DatetimeIndex(months[starts].to_timestamp(), name=index.name)
+
+
+class ReturnsPanel():
+    """Log returns of many symbols aligned on common dates.
+
+    Params:
+        prices: DataFrame
+            prices (one column per symbol) indexed by date, NaN where a symbol
+            has no price
+        missing: str
+            'drop' - only dates with prices of all symbols are used, returns
+                     span the dropped days
+            'ffill' - missing prices are filled with the last known price so
+                      days without trading have zero returns, dates before
+                      the first price of any symbol are dropped
+            'pairwise' - returns are calculated for every symbol on its own
+                         trading days and are NaN on other dates, statistics
+                         use all available pairs of observations
+
+    Attributes values and monthly_values are C-contiguous (T x N) float64
+    matrices, index and monthly_index their dates. version is a hash of the
+    returns which changes whenever any of them (not only the last date) does"""
+
+    def __init__(self, prices, missing='drop'):
+        if missing not in MISSING_POLICIES:
+            raise ValueError("Unknown missing data policy: {}".format(missing))
+        self.symbols = list(prices.columns)
+        self.missing = missing
+        self.prices = prices
+        if missing == 'drop':
+            prices = prices.dropna()
+        log_prices = np.log(prices.values.astype(np.float64))
+        if missing in ('ffill', 'pairwise'):
+            # the last known price of every symbol
+            log_prices = pd.DataFrame(log_prices).ffill().values
+        values = np.diff(log_prices, axis=0)
+        index = prices.index[1:]
+        if missing == 'pairwise':
+            values[np.isnan(prices.values[1:])] = np.nan
+        elif missing == 'ffill':
+            complete = ~np.isnan(values).any(axis=1)
+            values, index = values[complete], index[complete]
+        self.values = np.ascontiguousarray(values)
+        self.index = index
+        monthly_values, self.monthly_index = _monthly_sums(self.values, self.index)
+        self.monthly_values = np.ascontiguousarray(monthly_values)
+        self._version = None
+
+    @property
+    def version(self):
+        """Hash of symbols, dates and values of returns, calculated once"""
+        if self._version is None:
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update("\0".join(self.symbols).encode('utf-8'))
+            digest.update(self.index.asi8.tobytes())
+            digest.update(self.values.tobytes())
+            self._version = digest.hexdigest()
+        return self._version
+
+    @classmethod
+    def load(cls, symbols, missing='drop', use_cache=True, column='close'):
+        """Reads prices of all symbols and aligns them with one outer join.
+        Prices are read with one query from the consolidated prices table if
+        it exists (see data.storage.migrate_to_consolidated_prices) or if
+        use_cache is False, otherwise from the price cache (see data.cache).
+        Raises ValueError if any symbol has no prices"""
+        symbols = list(symbols)
+        storage = get_storage('price_data')
+        if storage.table_exists('prices') or not use_cache:
+            return cls(read_price_panel(symbols, column=column), missing)
+        check_price_symbols(symbols)
+        data = read_price_data_for_symbols(symbols, use_cache)
+        prices = pd.concat({symbol: data[symbol][column] for symbol in symbols}, axis=1,
+                           join='outer', sort=True)
+        prices.index.name = 'date'
+        return cls(prices, missing)
+
+    @property
+    def returns(self):
+        """Daily returns as a DataFrame sharing memory with values"""
+        return pd.DataFrame(self.values, index=self.index, columns=self.symbols, copy=False)
+
+    @property
+    def monthly_returns(self):
+        """Monthly returns as a DataFrame sharing memory with monthly_values"""
+        return pd.DataFrame(self.monthly_values, index=self.monthly_index,
+                            columns=self.symbols, copy=False)
+
+    def symbol_returns(self):
+        """Returns a dict {symbol: Series} of returns of every symbol on its
+        own trading days, the first return is 0 (same as PriceSeries)"""
+        returns = {}
+        for symbol in self.symbols:
+            close = self.prices[symbol].dropna()
+            returns[symbol] = np.log(close.pct_change()+1).fillna(0)
+        return returns
+
+    def stats(self, periods=None, monthly=True, end=None):
+        """Returns the vector of mean returns and the variance-covariance matrix
+        of the last periods months (or days if monthly is False) before the
+        row end (all rows by default). With the pairwise policy every
+        covariance uses all dates on which both symbols have returns"""
+        values = self.monthly_values if monthly else self.values
+        values = values[:end]
+        if periods is not None:
+            values = values[-periods:]
+        if self.missing == 'pairwise' and np.isnan(values).any():
+            return np.nanmean(values, axis=0), pd.DataFrame(values).cov().values
+        return values.mean(axis=0), np.cov(values, rowvar=False)
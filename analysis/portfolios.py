@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Functions that generate and evaluate portfolios in batches using matrix
+operations instead of building them one by one
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def random_weights(n_portfolios, n_assets, rng=None):
+    """Returns a (n_portfolios x n_assets) matrix of randomly generated weights.
+    Every row sums up to 1"""
+    if rng is None:
+        rng = np.random.default_rng()
+    nums = rng.random((n_portfolios, n_assets))
+    return nums / nums.sum(axis=1, keepdims=True)
+
+def portfolio_stats(weights, mean_returns, cov_matrix):
+    """Calculates expected returns and standard deviations of all portfolios
+    at once. Weights is a (n_portfolios x n_assets) matrix, mean returns
+    a vector of n_assets and cov_matrix a (n_assets x n_assets) matrix"""
+    weights = np.atleast_2d(weights)
+    means = weights @ mean_returns
+    # row-wise w * C * w.T without building the n_portfolios^2 product
+    variances = np.einsum('ij,ij->i', weights @ cov_matrix, weights)
+    return means, np.sqrt(np.maximum(variances, 0))
+
+def random_portfolios(mean_returns, cov_matrix, n_portfolios=10000, max_std=0.6,
+                      periods=12, chunk_size=100000, max_draws=None, seed=None,
+                      symbols=None):
+    """Generates a given number of randomly weighted portfolios and returns
+    a DataFrame with their annualized expected return, standard deviation,
+    return/risk ratio and weights (one column per asset).
+
+    Portfolios with annualized std above max_std are rejected and redrawn in
+    vectorized batches of chunk_size rows. Weights are stored as float32 so
+    that millions of portfolios fit in memory.
+
+    Parameters:
+        mean_returns: array-like
+            mean return of every asset for a single period (e.g. month)
+        cov_matrix: array-like
+            variance-covariance matrix of the returns for a single period
+        periods: int
+            number of periods in a year used to annualize the statistics
+        max_draws: int
+            maximum number of weight vectors drawn before giving up, defaults
+            to 100 times the number of portfolios
+        seed: int
+            seed of the random number generator"""
+    mean_returns = np.asarray(mean_returns, dtype=np.float64)
+    cov_matrix = np.asarray(cov_matrix, dtype=np.float64)
+    n_assets = len(mean_returns)
+    if symbols is None:
+        symbols = ['w{}'.format(i) for i in range(n_assets)]
+    if max_draws is None:
+        max_draws = 100 * n_portfolios
+    rng = np.random.default_rng(seed)
+    # preallocate the output so accepted rows are written in place
+    means = np.empty(n_portfolios)
+    stds = np.empty(n_portfolios)
+    weights = np.empty((n_portfolios, n_assets), dtype=np.float32)
+    filled = 0
+    drawn = 0
+    while filled < n_portfolios:
+        if drawn >= max_draws:
+            raise ValueError("Only {} of {} portfolios have std below {} after {} draws"
+                             .format(filled, n_portfolios, max_std, drawn))
+        size = min(chunk_size, max_draws - drawn)
+        w = random_weights(size, n_assets, rng)
+        drawn += size
+        mu, std = portfolio_stats(w, mean_returns, cov_matrix)
+        mu = mu * periods
+        std = std * np.sqrt(periods)
+        # reject portfolios with too high risk to reduce outliers
+        accepted = std <= max_std if max_std is not None else np.ones(size, dtype=bool)
+        n_new = min(int(accepted.sum()), n_portfolios - filled)
+        idx = np.flatnonzero(accepted)[:n_new]
+        means[filled:filled+n_new] = mu[idx]
+        stds[filled:filled+n_new] = std[idx]
+        weights[filled:filled+n_new] = w[idx]
+        filled += n_new
+    return portfolios_frame(weights, means, stds, symbols)
+
+def portfolios_frame(weights, means, stds, symbols):
+    """Creates a DataFrame with expected return, std, return/risk ratio and
+    weights (one column per symbol) of portfolios"""
+    portfolios = pd.DataFrame(weights, columns=list(symbols))
+    portfolios.insert(0, 'return/risk', means / stds)
+    portfolios.insert(0, 'std', stds)
+    portfolios.insert(0, 'return', means)
+    return portfolios
+
+def best_portfolio(portfolios):
+    """Returns the row of a random_portfolios DataFrame with the highest
+    return/risk ratio"""
+    return portfolios.iloc[int(np.argmax(portfolios['return/risk'].values))]
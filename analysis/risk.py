@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Value at risk and conditional value at risk (expected shortfall) of returns
+of many symbols at once. Measures are calculated over the whole sample or
+over rolling windows of every symbol's own observations:
+    historical - empirical quantile and mean of the worst returns
+    parametric - normal distribution with the sample mean and std
+    cornish_fisher - normal quantile adjusted for skewness and kurtosis
+Both measures are reported as positive losses (fractions of log returns).
+
+Returns of all symbols are packed into one matrix aligned to their last
+observation, rolling moments come from cumulative sums and the worst
+returns of rolling windows from running lists of the smallest values of
+blocks of rows, so there are no loops over symbols or windows in python
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+
+METHODS = ('historical', 'parametric', 'cornish_fisher')
+
+# maximum number of elements of arrays of the smallest returns in windows
+# kept at once by historical measures
+CHUNK_ELEMENTS = 30000000
+
+
+def _as_frame(returns):
+    if isinstance(returns, pd.Series):
+        return returns.to_frame(returns.name if returns.name is not None else 'return')
+    return returns
+
+def _pack(values):
+    """Moves valid values of every column to the bottom of the column (in the
+    original order), so that rolling windows contain consecutive
+    observations of a symbol even if it has gaps. Returns the packed matrix
+    (NaN at the top), a mask of valid values and their numbers per column"""
+    valid = ~np.isnan(values)
+    counts = valid.sum(axis=0)
+    packed = np.full(values.shape, np.nan)
+    for j in range(values.shape[1]):
+        packed[len(values)-counts[j]:, j] = values[valid[:, j], j]
+    return packed, valid, counts
+
+def _unpack(packed_results, valid, counts):
+    """Inverse of _pack for results of rolling windows (same shape as the
+    packed matrix). Returns NaN for dates without a return"""
+    results = np.full(packed_results.shape, np.nan)
+    length = len(valid)
+    for j in range(valid.shape[1]):
+        results[valid[:, j], j] = packed_results[length-counts[j]:, j]
+    return results
+
+def _tail_count(level, n):
+    """Number of the worst observations in the tail of a given level"""
+    return np.maximum(np.ceil((1 - level) * n).astype(int), 1)
+
+def _rolling_moments(packed, counts, window):
+    """Rolling mean, std, skewness and excess kurtosis (bias corrected like
+    pandas) of windows ending at every row of a packed matrix. Windows that
+    include padding are NaN"""
+    length = len(packed)
+    filled = np.nan_to_num(packed)
+    shift = filled.sum(axis=0) / np.maximum(counts, 1)
+    centered = np.where(np.isnan(packed), 0, filled - shift)
+    prefix = np.zeros((4, length+1, packed.shape[1]))
+    for k in range(4):
+        np.cumsum(centered**(k+1), axis=0, out=prefix[k, 1:])
+    s1, s2, s3, s4 = prefix[:, window:] - prefix[:, :-window]
+    n = float(window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = s1 / n
+        m2 = np.maximum(s2 - s1 * mean, 0)
+        m3 = s3 - 3 * mean * s2 + 2 * n * mean**3
+        m4 = s4 - 4 * mean * s3 + 6 * mean**2 * s2 - 3 * n * mean**4
+        std = np.sqrt(m2 / (n - 1))
+        skew = np.where(m2 == 0, 0, n * np.sqrt(n - 1) / (n - 2) * m3 / m2**1.5)
+        kurt = np.where(m2 == 0, 0, (n + 1) * n * (n - 1) * m4 / ((n - 2) * (n - 3) * m2**2)
+                        - 3 * (n - 1)**2 / ((n - 2) * (n - 3)))
+    # windows starting in the padding
+    incomplete = np.arange(window-1, length)[:, None] < length - counts + window - 1
+    stats = []
+    for stat in (mean + shift, std, skew, kurt):
+        full = np.full(packed.shape, np.nan)
+        full[window-1:] = np.where(incomplete, np.nan, stat)
+        stats.append(full)
+    return stats
+
+def _parametric(mean, std, skew, kurt, level, method):
+    """VaR and CVaR of the normal distribution or of the Cornish-Fisher
+    expansion. CVaR of the expansion is the mean of adjusted quantiles over
+    the tail, it uses moments of the normal distribution truncated at the
+    tail quantile u:
+        E[Z|Z<u] = -phi(u)/p, E[Z^2|Z<u] = 1 - u*phi(u)/p,
+        E[Z^3|Z<u] = -(u^2 + 2)*phi(u)/p"""
+    p = 1 - level
+    u = norm.ppf(p)
+    density = norm.pdf(u)
+    if method == 'parametric':
+        return -(mean + u * std), -(mean - std * density / p)
+    def adjusted(z, z2, z3):
+        return (z + (z2 - 1) * skew / 6 + (z3 - 3 * z) * kurt / 24
+                - (2 * z3 - 5 * z) * skew**2 / 36)
+    var = -(mean + std * adjusted(u, u**2, u**3))
+    m1 = -density / p
+    m2 = 1 - u * density / p
+    m3 = -(u**2 + 2) * density / p
+    cvar = -(mean + std * adjusted(m1, m2, m3))
+    return var, cvar
+
+def _insert(smallest, values):
+    """Inserts values (one per row) into rows of sorted arrays of the k
+    smallest values seen so far, the largest ones drop out"""
+    previous = np.empty_like(smallest)
+    previous[:, 0] = -np.inf
+    previous[:, 1:] = smallest[:, :-1]
+    values = values[:, None]
+    return np.where(values < smallest, np.maximum(values, previous), smallest)
+
+def _rolling_smallest(packed, window, k):
+    """Returns a (T x N x k) array with the k smallest values (sorted) of
+    windows ending at every row (rows before window-1 are meaningless).
+    Time is split into blocks of window rows, so every window is a suffix of
+    one block joined with a prefix of the next one. The k smallest values of
+    all prefixes and suffixes are updated in two scans and merged, which
+    costs O(T * N * k) instead of O(T * N * window)"""
+    length, n_symbols = packed.shape
+    values = np.where(np.isnan(packed), np.inf, packed)
+    empty = np.full((n_symbols, k), np.inf)
+    prefix = np.empty((length, n_symbols, k))
+    suffix = np.empty((length, n_symbols, k))
+    smallest = empty
+    for t in range(length):
+        smallest = _insert(empty if t % window == 0 else smallest, values[t])
+        prefix[t] = smallest
+    for t in range(length-1, -1, -1):
+        smallest = _insert(empty if t % window == window - 1 or t == length - 1
+                           else smallest, values[t])
+        suffix[t] = smallest
+    ends = np.arange(window-1, length)
+    starts = ends - window + 1
+    result = np.empty((length, n_symbols, k))
+    # windows that are whole blocks
+    aligned = starts % window == 0
+    result[ends[aligned]] = prefix[ends[aligned]]
+    merged = np.concatenate([suffix[starts[~aligned]], prefix[ends[~aligned]]], axis=-1)
+    result[ends[~aligned]] = np.sort(merged, axis=-1)[..., :k]
+    return result
+
+def _historical_rolling(packed, window, levels):
+    """Rolling historical VaR and CVaR of a packed matrix for all levels.
+    Symbols are processed in chunks so that memory use is bounded by
+    CHUNK_ELEMENTS"""
+    length, n_symbols = packed.shape
+    ks = _tail_count(np.asarray(levels), window)
+    var = np.full((len(levels),) + packed.shape, np.nan)
+    cvar = np.full((len(levels),) + packed.shape, np.nan)
+    if length < window:
+        return var, cvar
+    chunk = max(CHUNK_ELEMENTS // (length * ks.max() * 3), 1)
+    with np.errstate(invalid='ignore'):
+        for start in range(0, n_symbols, chunk):
+            columns = slice(start, start+chunk)
+            smallest = _rolling_smallest(packed[:, columns], window, ks.max())
+            for i, k in enumerate(ks):
+                var[i, window-1:, columns] = -smallest[window-1:, :, k-1]
+                cvar[i, window-1:, columns] = -smallest[window-1:, :, :k].mean(axis=-1)
+    return var, cvar
+
+def _frame(results, levels, index, columns):
+    """Builds a DataFrame with (measure, level, symbol) columns from dicts of
+    {measure: list of (dates x symbols) matrices per level}"""
+    blocks = []
+    keys = []
+    for measure, matrices in results.items():
+        for level, matrix in zip(levels, matrices):
+            blocks.append(matrix)
+            keys += [(measure, level, symbol) for symbol in columns]
+    return pd.DataFrame(np.hstack(blocks), index=index,
+                        columns=pd.MultiIndex.from_tuples(keys, names=['measure', 'level', 'symbol']))
+
+def rolling_var_cvar(returns, window=252, levels=(0.95, 0.99), method='historical'):
+    """Returns VaR and CVaR of every symbol in rolling windows of its last
+    window returns (missing values are skipped, not counted).
+
+    Params:
+        returns: Series or DataFrame
+            log returns (one column per symbol), e.g. PriceSeries.data['log_return']
+            or PortfolioOptimizer.returns
+        window: int
+            number of observations in a window
+        levels: list of float
+            confidence levels
+        method: str
+            'historical', 'parametric' or 'cornish_fisher'
+
+    Returns a DataFrame indexed by date with (measure, level, symbol) columns,
+    measure is 'VaR' or 'CVaR'"""
+    if method not in METHODS:
+        raise ValueError("Unknown risk method: {}".format(method))
+    frame = _as_frame(returns)
+    packed, valid, counts = _pack(frame.values.astype(np.float64))
+    if method == 'historical':
+        var, cvar = _historical_rolling(packed, window, levels)
+        # windows including padding
+        rows = np.arange(len(packed))[:, None]
+        incomplete = rows < len(packed) - counts + window - 1
+        var[:, incomplete] = np.nan
+        cvar[:, incomplete] = np.nan
+    else:
+        moments = _rolling_moments(packed, counts, window)
+        var, cvar = zip(*[_parametric(*moments, level, method) for level in levels])
+    results = {'VaR': [_unpack(m, valid, counts) for m in var],
+               'CVaR': [_unpack(m, valid, counts) for m in cvar]}
+    return _frame(results, levels, frame.index, frame.columns)
+
+def var_cvar(returns, levels=(0.95, 0.99), method='historical'):
+    """Returns VaR and CVaR of every symbol over the whole sample (missing
+    values are skipped) as a DataFrame indexed by symbol with (measure, level)
+    columns. See rolling_var_cvar for parameters"""
+    if method not in METHODS:
+        raise ValueError("Unknown risk method: {}".format(method))
+    frame = _as_frame(returns)
+    values = frame.values.astype(np.float64)
+    counts = (~np.isnan(values)).sum(axis=0)
+    summ = {}
+    if method == 'historical':
+        # NaNs are sorted to the end of every column
+        ordered = np.sort(values, axis=0)
+        for level in levels:
+            ks = _tail_count(level, counts)
+            rows = np.arange(len(values))[:, None] < ks
+            summ[('VaR', level)] = -ordered[ks-1, np.arange(len(counts))]
+            summ[('CVaR', level)] = -np.where(rows, ordered, 0).sum(axis=0) / ks
+    else:
+        mean = np.nanmean(values, axis=0)
+        frame_stats = pd.DataFrame(values)
+        moments = (mean, np.nanstd(values, axis=0, ddof=1),
+                   frame_stats.skew().values, frame_stats.kurt().values)
+        for level in levels:
+            var, cvar = _parametric(*moments, level, method)
+            summ[('VaR', level)] = var
+            summ[('CVaR', level)] = cvar
+    columns = [(measure, level) for measure in ('VaR', 'CVaR') for level in levels]
+    result = pd.DataFrame({column: summ[column] for column in columns}, index=frame.columns)
+    result.columns.names = ['measure', 'level']
+    return result
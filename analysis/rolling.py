@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Rolling statistics of whole panels of returns (one column per symbol). They
+are calculated with linear filters (scipy.signal.lfilter) that run along the
+time axis of all columns at once, weighted windows are FIR filters and
+exponential ones are recursive updates, so there are no python callbacks per
+window. Functions accept numpy arrays, Series and DataFrames and return the
+same type
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+
+def decay_weights(window, decay='lin', lam=0.94):
+    """Returns weights of observations in a window from the oldest to the
+    newest, they sum up to 1.
+
+    Params:
+        window: int
+            number of observations
+        decay: str or array
+            'lin' - weights grow linearly (1, 2, ..., window)
+            'exp' - weights grow exponentially (lam**(window-1), ..., lam, 1)
+            an array of window weights can be given instead
+        lam: float
+            decay factor of exponential weights"""
+    if isinstance(decay, str):
+        if decay == 'lin':
+            weights = np.arange(1, window+1, dtype=np.float64)
+        elif decay == 'exp':
+            weights = lam ** np.arange(window-1, -1, -1, dtype=np.float64)
+        else:
+            raise ValueError("Unknown decay: {}".format(decay))
+    else:
+        weights = np.asarray(decay, dtype=np.float64)
+        if len(weights) != window:
+            raise ValueError("Number of weights differs from the window")
+    return weights / weights.sum()
+
+def as_matrix(data):
+    """Returns a 2d float64 array of data and a function that converts a
+    result back into the type of data"""
+    if isinstance(data, pd.DataFrame):
+        wrap = lambda values: pd.DataFrame(values, index=data.index, columns=data.columns)
+    elif isinstance(data, pd.Series):
+        wrap = lambda values: pd.Series(values[:, 0], index=data.index, name=data.name)
+    else:
+        ndim = np.ndim(data)
+        wrap = lambda values: values[:, 0] if ndim == 1 else values
+    values = np.asarray(data, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    return values, wrap
+
+def incomplete_windows(missing, window):
+    """Returns a mask of windows that don't have window observations: the
+    first window-1 rows and windows containing missing values"""
+    counts = np.cumsum(missing, axis=0)
+    counts[window:] -= counts[:-window].copy()
+    mask = counts > 0
+    mask[:window-1] = True
+    return mask
+
+def _weighted_sum(values, weights, decay, lam):
+    """Sums of values in windows multiplied by weights. Exponential weights
+    are calculated with a recursive (infinite) average
+        y[t] = lam * y[t-1] + w[-1] * x[t]
+    from which the part older than the window is subtracted
+        s[t] = y[t] - lam**window * y[t-window]
+    other weights with a direct convolution"""
+    window = len(weights)
+    if isinstance(decay, str) and decay == 'exp':
+        total = lfilter([weights[-1]], [1, -lam], values, axis=0)
+        total[window:] -= lam**window * total[:-window]
+        return total
+    return lfilter(weights[::-1], [1], values, axis=0)
+
+def weighted_rolling_mean(data, window, decay='lin', lam=0.94):
+    """Returns weighted moving averages of every column. Windows with missing
+    values (and the first window-1 rows) are NaN. See decay_weights for
+    weighting schemes"""
+    values, wrap = as_matrix(data)
+    weights = decay_weights(window, decay, lam)
+    missing = np.isnan(values)
+    mean = _weighted_sum(np.where(missing, 0, values), weights, decay, lam)
+    mean[incomplete_windows(missing, window)] = np.nan
+    return wrap(mean)
+
+def weighted_rolling_std(data, window, decay='lin', lam=0.94):
+    """Returns weighted moving standard deviations of every column:
+        sqrt(sum(w * (x - m)**2) / (1 - sum(w**2)))
+    where m is the weighted mean and w are weights that sum up to 1. The
+    denominator makes the variance unbiased (equal to the sample variance
+    when all weights are equal)"""
+    values, wrap = as_matrix(data)
+    weights = decay_weights(window, decay, lam)
+    missing = np.isnan(values)
+    values = np.where(missing, 0, values)
+    # windows are centered on the column means to avoid cancellation in
+    # E[x^2] - E[x]^2
+    values = values - values.mean(axis=0)
+    mean = _weighted_sum(values, weights, decay, lam)
+    mean_sq = _weighted_sum(values**2, weights, decay, lam)
+    variance = np.maximum(mean_sq - mean**2, 0) / (1 - (weights**2).sum())
+    std = np.sqrt(variance)
+    std[incomplete_windows(missing, window)] = np.nan
+    return wrap(std)
+
+def ewma_volatility(data, lam=0.94, min_periods=1):
+    """Returns RiskMetrics EWMA volatility of every column of returns:
+        var[t] = lam * var[t-1] + (1 - lam) * r[t]**2
+    The recursion starts from the first squared return of each column, so
+    every value uses only returns up to its date. Values with less than
+    min_periods returns are NaN. Missing values before the first return stay
+    NaN, later ones are treated as zero returns"""
+    values, wrap = as_matrix(data)
+    variance = np.full(values.shape, np.nan)
+    for j in range(values.shape[1]):
+        valid = np.flatnonzero(~np.isnan(values[:, j]))
+        if not len(valid):
+            continue
+        squares = np.nan_to_num(values[valid[0]:, j])**2
+        variance[valid[0], j] = squares[0]
+        variance[valid[0]+1:, j] = lfilter([1 - lam], [1, -lam], squares[1:],
+                                           zi=[lam * squares[0]])[0]
+        variance[valid[0]:valid[0]+min_periods-1, j] = np.nan
+    return wrap(np.sqrt(variance))
+
+def rolling_portfolio_risk(returns, weights, window, periods=12):
+    """Returns rolling expected return and standard deviation of portfolios
+    with constant weights. For the sample covariance matrix C of a window
+    w * C * w.T equals the variance of portfolio returns returns @ w in that
+    window, so no covariance matrices are built and the cost is O(T * N).
+
+    Params:
+        returns: DataFrame
+            (T x N) returns of assets
+        weights: array
+            weights of assets (N) or of many portfolios (k x N)
+        window: int
+            number of observations in a window
+        periods: int
+            number of observations per year used for annualization
+
+    Returns a DataFrame with 'Expected ann return' and 'Rolling std ann'
+    columns (with one column per portfolio on the second level if many
+    portfolios are given). Windows with missing returns are NaN"""
+    weights = np.asarray(weights, dtype=np.float64)
+    portfolio_returns = np.asarray(returns, dtype=np.float64) @ np.atleast_2d(weights).T
+    equal = np.ones(window)
+    mean = weighted_rolling_mean(portfolio_returns, window, equal) * periods
+    std = weighted_rolling_std(portfolio_returns, window, equal) * np.sqrt(periods)
+    if weights.ndim == 1:
+        return pd.DataFrame({'Expected ann return': mean[:, 0],
+                             'Rolling std ann': std[:, 0]}, index=returns.index)
+    columns = pd.MultiIndex.from_product([['Expected ann return', 'Rolling std ann'],
+                                          range(len(weights))])
+    return pd.DataFrame(np.hstack([mean, std]), index=returns.index, columns=columns)
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Monte-Carlo simulation of future portfolio values. Asset returns are drawn
+from a multivariate normal or t distribution (correlated with the Cholesky
+factor of the covariance matrix) or resampled from history in blocks. Paths
+are simulated in batches step by step and only their final returns, maximum
+drawdowns and sums needed for the mean path are kept, so memory use depends
+on the batch size and not on the number of paths or the horizon. Batches are
+distributed over a pool of processes, each one gets its own seed spawned
+from the main seed, so results depend only on the seed and the batch size
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from analysis.covariance import cholesky_factor
+
+
+METHODS = ('normal', 't', 'bootstrap')
+
+# model shared by batches run in a worker process (set by _init_worker)
+_model = None
+
+
+def _init_worker(model):
+    global _model
+    _model = model
+
+def _draw_returns(model, rng, batch_size, step, state):
+    """Returns a (batch_size x n_assets) matrix of log returns of one step"""
+    if model['method'] == 'bootstrap':
+        history = model['history']
+        block_size = model['block_size']
+        if step % block_size == 0:
+            # each path continues from a new random point of history
+            state['starts'] = rng.integers(0, len(history) - block_size + 1, batch_size)
+        return history[state['starts'] + step % block_size]
+    z = rng.standard_normal((batch_size, len(model['mean'])))
+    if model['method'] == 't':
+        df = model['df']
+        # scaled so that the covariance matrix of returns is the given one
+        z *= np.sqrt((df - 2) / rng.chisquare(df, (batch_size, 1)))
+    return model['mean'] + z @ model['factor'].T
+
+def _simulate_batch(seed, batch_size):
+    """Simulates a batch of paths with the model of the worker process and
+    returns final portfolio returns, maximum drawdowns and sums (and sums of
+    squares) of cumulative log returns of every step"""
+    model = _model
+    rng = np.random.default_rng(seed)
+    weights = model['weights']
+    horizon = model['horizon']
+    log_value = np.zeros(batch_size)
+    peak = np.zeros(batch_size)
+    max_drawdown = np.zeros(batch_size)
+    path_sums = np.zeros(horizon)
+    path_squares = np.zeros(horizon)
+    # value of every asset held (buy and hold), starts with the weights
+    holdings = np.tile(weights, (batch_size, 1))
+    state = {}
+    for step in range(horizon):
+        returns = _draw_returns(model, rng, batch_size, step, state)
+        if model['rebalance']:
+            # weights are restored every step
+            log_value += np.log1p(np.expm1(returns) @ weights)
+        else:
+            holdings *= np.exp(returns)
+            log_value = np.log(holdings.sum(axis=1))
+        np.maximum(peak, log_value, out=peak)
+        np.maximum(max_drawdown, peak - log_value, out=max_drawdown)
+        path_sums[step] = log_value.sum()
+        path_squares[step] = (log_value**2).sum()
+    return np.expm1(log_value), -np.expm1(-max_drawdown), path_sums, path_squares
+
+
+class SimulationResult():
+    """Aggregated results of a simulation: final returns of all paths (simple
+    returns over the horizon), their maximum drawdowns (fractions of the peak
+    value) and mean and std of cumulative log returns at every step"""
+
+    def __init__(self, returns, drawdowns, path_sums, path_squares, n_paths, params):
+        self.returns = returns
+        self.drawdowns = drawdowns
+        self.params = params
+        self.n_paths = n_paths
+        mean = path_sums / n_paths
+        self.mean_path = pd.DataFrame({
+            'mean': mean,
+            'std': np.sqrt(np.maximum(path_squares / n_paths - mean**2, 0))},
+            index=pd.RangeIndex(1, len(mean)+1, name='step'))
+
+    def var(self, alpha=0.95):
+        """Value at risk - loss (as a positive fraction of the portfolio value)
+        exceeded with probability 1 - alpha at the end of the horizon"""
+        return -np.quantile(self.returns, 1 - alpha)
+
+    def cvar(self, alpha=0.95):
+        """Conditional value at risk - mean loss in the worst 1 - alpha of
+        paths"""
+        cutoff = np.quantile(self.returns, 1 - alpha)
+        return -self.returns[self.returns <= cutoff].mean()
+
+    def drawdown_quantiles(self, quantiles=(0.5, 0.75, 0.9, 0.95, 0.99)):
+        """Returns quantiles of the distribution of maximum drawdowns"""
+        return pd.Series(np.quantile(self.drawdowns, quantiles), index=quantiles,
+                         name='max_drawdown')
+
+    def summary(self, alphas=(0.95, 0.99)):
+        """Returns a Series with the mean and median return, probability of a
+        loss, VaR and CVaR at given levels and the median and worst drawdown"""
+        summ = pd.Series(dtype=np.float64)
+        summ['n_paths'] = self.n_paths
+        summ['mean_return'] = self.returns.mean()
+        summ['median_return'] = np.median(self.returns)
+        summ['prob_loss'] = (self.returns < 0).mean()
+        for alpha in alphas:
+            summ['VaR_{}'.format(alpha)] = self.var(alpha)
+            summ['CVaR_{}'.format(alpha)] = self.cvar(alpha)
+        summ['median_max_drawdown'] = np.median(self.drawdowns)
+        summ['worst_max_drawdown'] = self.drawdowns.max()
+        return summ
+
+    def __str__(self):
+        return "Simulation of {} paths, {} steps, method: {}\n{}".format(
+            self.n_paths, self.params['horizon'], self.params['method'], self.summary())
+
+
+def simulate_portfolio(returns, weights, n_paths=100000, horizon=12, method='normal',
+                       df=5, block_size=6, rebalance=True, batch_size=10000,
+                       processes=None, seed=None, mean=None, factor=None):
+    """Simulates future values of a portfolio.
+
+    Params:
+        returns: array or DataFrame
+            (T x N) historical log returns of assets (rows with missing values
+            are skipped)
+        weights: array
+            weights of assets
+        n_paths: int
+            number of simulated paths
+        horizon: int
+            number of steps (periods of returns) of every path
+        method: str
+            'normal' - multivariate normal returns with historical means and
+                       covariance matrix
+            't' - multivariate t returns with df degrees of freedom (fat
+                  tails) and the same means and covariance matrix
+            'bootstrap' - blocks of block_size consecutive historical returns
+                          of all assets, keeps correlations and short term
+                          dependencies without assuming a distribution
+        rebalance: bool
+            if True weights are restored every step, otherwise the portfolio
+            is bought at the start and held
+        batch_size: int
+            number of paths simulated at once, memory use is proportional to
+            batch_size * n_assets
+        processes: int
+            number of processes (all cores by default)
+        seed: int
+            seed of the simulation, batches use seeds spawned from it
+        mean, factor: arrays
+            mean returns and a Cholesky factor of the covariance matrix used
+            by parametric methods instead of the ones calculated from returns
+            (e.g. from a CovarianceEstimate)
+
+    Returns a SimulationResult"""
+    if method not in METHODS:
+        raise ValueError("Unknown simulation method: {}".format(method))
+    history = np.asarray(returns, dtype=np.float64)
+    history = history[~np.isnan(history).any(axis=1)]
+    weights = np.asarray(weights, dtype=np.float64)
+    model = {'method': method, 'horizon': horizon, 'weights': weights,
+             'rebalance': rebalance, 'df': df, 'block_size': block_size}
+    if method == 'bootstrap':
+        if len(history) < block_size:
+            raise ValueError("Not enough history for blocks of {} returns".format(block_size))
+        model['history'] = np.ascontiguousarray(history)
+    else:
+        if method == 't' and df <= 2:
+            raise ValueError("t distribution requires more than 2 degrees of freedom")
+        model['mean'] = history.mean(axis=0) if mean is None else np.asarray(mean)
+        model['factor'] = (cholesky_factor(np.cov(history, rowvar=False)) if factor is None
+                           else np.asarray(factor))
+    sizes = [batch_size] * (n_paths // batch_size)
+    if n_paths % batch_size:
+        sizes.append(n_paths % batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    processes = processes or os.cpu_count()
+    if processes == 1 or len(sizes) == 1:
+        _init_worker(model)
+        batches = [_simulate_batch(s, size) for s, size in zip(seeds, sizes)]
+    else:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                 initargs=(model,)) as pool:
+            batches = list(pool.map(_simulate_batch, seeds, sizes))
+    final_returns = np.concatenate([batch[0] for batch in batches])
+    drawdowns = np.concatenate([batch[1] for batch in batches])
+    path_sums = np.sum([batch[2] for batch in batches], axis=0)
+    path_squares = np.sum([batch[3] for batch in batches], axis=0)
+    params = {'method': method, 'horizon': horizon, 'rebalance': rebalance,
+              'seed': seed, 'batch_size': batch_size}
+    return SimulationResult(final_returns, drawdowns, path_sums, path_squares, n_paths,
+                            params)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Summary statistics of return series of many symbols computed at once.
+Returns of all symbols are put in one matrix aligned to their last
+observation and windowed sums, standard deviations, skewness and kurtosis of
+all windows come from cumulative sums of powers of returns, so every window
+is a difference of two rows instead of a separate pass over the data
+"""
+
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+# name suffix: number of observations
+WINDOWS = {'5d': 5, '21d': 21, '252d': 252, '3y': 252*3, '5y': 252*5}
+
+METRICS = ['first_day', 'last_day', 'n_observations', 'ret_1d', 'ret_5d', 'ret_21d',
+           'ret_252d', 'ret_3y', 'ret_5y', 'std_5d', 'std_21d', 'std_252d',
+           'std_252d_ann', 'return/risk_1y', 'skew_252d', 'skew_3y', 'kurt_252d',
+           'kurt_3y', 'max_1d_ret', 'min_1d_ret', 'n_above_3_sigma', 'n_below_3_sigma']
+
+# summaries already computed, {symbol: ((last_date, n_observations), Series)}
+# - one per symbol, the least recently used are removed above MAX_SUMMARIES
+_summaries = OrderedDict()
+MAX_SUMMARIES = 2048
+
+
+def clear_summary_cache():
+    """Removes all memoized summaries"""
+    _summaries.clear()
+
+def _series(returns):
+    """Returns a dict {symbol: Series} of returns without missing values from
+    a dict of Series or a DataFrame with one column per symbol"""
+    if isinstance(returns, pd.DataFrame):
+        returns = {symbol: returns[symbol] for symbol in returns.columns}
+    return {symbol: ret.dropna() for symbol, ret in returns.items()}
+
+def _right_aligned(series, fill):
+    """Returns a (max length x n_series) matrix of values of all series with
+    their last observations in the last row. Shorter series are padded with
+    fill at the top"""
+    length = max(len(ret) for ret in series)
+    matrix = np.full((length, len(series)), fill, dtype=np.float64)
+    for j, ret in enumerate(series):
+        if len(ret):
+            matrix[length-len(ret):, j] = ret.values
+    return matrix
+
+def window_moments(matrix, counts, windows):
+    """Calculates sums, standard deviations, skewness and excess kurtosis
+    (both bias corrected the same way as pandas does) of the last w rows of
+    every column of a right aligned matrix for every window w. Columns with
+    less than w observations use all of them (like Series.tail(w) does).
+
+    Params:
+        matrix: numpy array
+            (T x N) matrix padded with zeros at the top
+        counts: numpy array
+            number of real observations in every column
+        windows: list of int
+            lengths of windows
+
+    Returns a dict {window: (n, sums, stds, skews, kurts)} of arrays of N
+    values, n is the number of observations used"""
+    n_obs = np.asarray(counts)
+    window_max = min(max(windows), len(matrix))
+    tail = matrix[len(matrix)-window_max:]
+    n_tail = np.minimum(n_obs, window_max)
+    # moments don't depend on the shift, centered values keep powers small
+    # and prevent cancellation when differences of cumulative sums are taken
+    shift = tail.sum(axis=0) / np.maximum(n_tail, 1)
+    centered = np.where(np.arange(window_max)[:, None] >= window_max - n_tail, tail - shift, 0)
+    powers = np.stack([centered, centered**2, centered**3, centered**4])
+    prefix = np.zeros((4, window_max+1, matrix.shape[1]))
+    np.cumsum(powers, axis=1, out=prefix[:, 1:])
+    results = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for w in windows:
+            s1, s2, s3, s4 = prefix[:, -1] - prefix[:, -1-min(w, window_max)]
+            n = np.minimum(n_obs, w).astype(np.float64)
+            mean = s1 / n
+            # central sums of powers
+            m2 = np.maximum(s2 - s1 * mean, 0)
+            m3 = s3 - 3 * mean * s2 + 2 * n * mean**3
+            m4 = s4 - 4 * mean * s3 + 6 * mean**2 * s2 - 3 * n * mean**4
+            std = np.sqrt(m2 / (n - 1))
+            skew = n * np.sqrt(n - 1) / (n - 2) * m3 / m2**1.5
+            kurt = ((n + 1) * n * (n - 1) * m4 / ((n - 2) * (n - 3) * m2**2)
+                    - 3 * (n - 1)**2 / ((n - 2) * (n - 3)))
+            # constant returns have no skewness and kurtosis
+            skew = np.where(n < 3, np.nan, np.where(m2 == 0, 0, skew))
+            kurt = np.where(n < 4, np.nan, np.where(m2 == 0, 0, kurt))
+            results[w] = (n, s1 + shift * n, std, skew, kurt)
+    return results
+
+def _summarize(symbols, series):
+    """Computes summaries of given symbols, returns a symbols x metrics
+    DataFrame"""
+    counts = np.array([len(ret) for ret in series])
+    full = _right_aligned(series, np.nan)
+    moments = window_moments(np.nan_to_num(full), counts, list(WINDOWS.values()))
+    summ = pd.DataFrame(index=pd.Index(symbols, name='symbol'))
+    summ['first_day'] = [ret.index[0].strftime('%Y-%m-%d') for ret in series]
+    summ['last_day'] = [ret.index[-1].strftime('%Y-%m-%d') for ret in series]
+    summ['n_observations'] = counts
+    summ['ret_1d'] = full[-1]
+    # returns and stds require full windows, shape statistics use what's available
+    for name, w in WINDOWS.items():
+        n, sums = moments[w][:2]
+        summ['ret_' + name] = np.where(n == w, sums, np.nan)
+    for name in ['5d', '21d', '252d']:
+        n, _, std = moments[WINDOWS[name]][:3]
+        summ['std_' + name] = np.where(n == WINDOWS[name], std, np.nan)
+    summ['std_252d_ann'] = summ['std_252d'] * np.sqrt(252)
+    summ['return/risk_1y'] = summ['ret_252d'] / summ['std_252d_ann']
+    for name in ['252d', '3y']:
+        summ['skew_' + name] = moments[WINDOWS[name]][3]
+    for name in ['252d', '3y']:
+        summ['kurt_' + name] = moments[WINDOWS[name]][4]
+    summ['max_1d_ret'] = np.nanmax(full, axis=0)
+    summ['min_1d_ret'] = np.nanmin(full, axis=0)
+    # mean and std of the whole series are calculated once for both tails
+    mean = np.nanmean(full, axis=0)
+    std = np.nanstd(full, axis=0, ddof=1)
+    summ['n_above_3_sigma'] = (full > mean + 3*std).sum(axis=0)
+    summ['n_below_3_sigma'] = (full < mean - 3*std).sum(axis=0)
+    return summ[METRICS]
+
+def summarize_returns(returns):
+    """Returns a DataFrame (symbols x metrics) with a summary of returns of
+    every symbol: first and last day, number of observations, returns and
+    standard deviations over the last 5, 21, 252, 756 and 1260 observations,
+    skewness and kurtosis, extreme returns and number of returns further than
+    3 standard deviations from the mean.
+
+    Params:
+        returns: dict or DataFrame
+            {symbol: Series of log returns} or a DataFrame with one column of
+            returns per symbol (missing values are skipped)
+
+    Summaries are memoized per symbol and its last date (and number of
+    observations), so only symbols with new data are recalculated. Only the
+    latest summary of a symbol is kept (MAX_SUMMARIES symbols at most)"""
+    series = _series(returns)
+    keys = {symbol: (ret.index[-1], len(ret)) for symbol, ret in series.items() if len(ret)}
+    missing = [symbol for symbol, key in keys.items()
+               if symbol not in _summaries or _summaries[symbol][0] != key]
+    rows = {symbol: _summaries[symbol][1] for symbol in keys if symbol not in missing}
+    if missing:
+        new = _summarize(missing, [series[symbol] for symbol in missing])
+        rows.update(new.iterrows())
+    # a new summary replaces the older one of the same symbol
+    for symbol, key in keys.items():
+        _summaries[symbol] = (key, rows[symbol])
+        _summaries.move_to_end(symbol)
+    while len(_summaries) > MAX_SUMMARIES:
+        _summaries.popitem(last=False)
+    rows = [rows[symbol] for symbol in keys]
+    summ = pd.DataFrame(rows, index=pd.Index(list(keys), name='symbol'), columns=METRICS)
+    return summ.infer_objects()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Text processing pipeline for articles stored in the database: tokenization,
+stopword removal and sparse term frequency / TF-IDF matrices. Articles are
+read from the database in chunks and symbols can be processed in parallel
+processes, so the whole corpus never has to be loaded into memory
+"""
+
+import os
+import json
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from data.formatting import tokenize
+from data.storage import iter_articles_from_db, list_article_symbols
+
+
+def _document_words(chunk, fold):
+    """Yields lists of words of articles (header and content) in a chunk.
+    Numbers are skipped, they are mostly dates and amounts"""
+    for header, content in zip(chunk['header'], chunk['content']):
+        words = tokenize('{} {}'.format(header or '', content or ''), fold=fold)
+        yield [word for word in words if not word.isdigit()]
+
+def _count_documents(symbol, chunksize, fold):
+    """Returns the number of articles of a symbol and a Counter of number of
+    articles every word appears in"""
+    n_docs = 0
+    doc_freq = Counter()
+    for chunk in iter_articles_from_db(symbol, chunksize):
+        for words in _document_words(chunk, fold):
+            doc_freq.update(set(words))
+            n_docs += 1
+    return n_docs, doc_freq
+
+def _term_counts(symbol, vocabulary, chunksize, fold):
+    """Returns a sparse (n_articles x n_terms) matrix of word counts and dates
+    of articles of a symbol. Words out of vocabulary are skipped"""
+    matrices = []
+    dates = []
+    for chunk in iter_articles_from_db(symbol, chunksize):
+        rows, cols = [], []
+        for i, words in enumerate(_document_words(chunk, fold)):
+            ids = [vocabulary[word] for word in words if word in vocabulary]
+            rows += [i] * len(ids)
+            cols += ids
+        # duplicated (row, col) pairs are summed into counts
+        matrices.append(sparse.csr_matrix((np.ones(len(rows), dtype=np.float64), (rows, cols)),
+                                          shape=(len(chunk), len(vocabulary))))
+        dates.append(pd.to_datetime(chunk['date']))
+    if not matrices:
+        return sparse.csr_matrix((0, len(vocabulary))), pd.DatetimeIndex([], name='date')
+    return sparse.vstack(matrices, format='csr'), pd.DatetimeIndex(pd.concat(dates), name='date')
+
+def _map(function, symbols, processes, *args):
+    """Runs function(symbol, *args) for all symbols in a pool of processes (or
+    in the current process if processes == 1) and returns the results"""
+    if processes == 1 or len(symbols) <= 1:
+        return [function(symbol, *args) for symbol in symbols]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(function, symbol, *args) for symbol in symbols]
+        return [future.result() for future in futures]
+
+
+class TextPipeline():
+    """Builds a vocabulary over articles of many symbols and transforms them
+    into sparse term frequency or TF-IDF matrices.
+
+    Params:
+        min_df: int
+            minimum number of articles a word has to appear in
+        max_df: float
+            maximum share of articles a word can appear in
+        max_features: int
+            if given only the most frequent words are kept
+        fold: bool
+            if True Polish letters are replaced with ASCII ones so that words
+            written with and without them are the same term
+        chunksize: int
+            number of articles read from the database at once
+        processes: int
+            number of processes used to process symbols (all cores by default)"""
+
+    def __init__(self, min_df=2, max_df=1.0, max_features=None, fold=False, chunksize=1000,
+                 processes=None):
+        self.min_df = min_df
+        self.max_df = max_df
+        self.max_features = max_features
+        self.fold = fold
+        self.chunksize = chunksize
+        self.processes = processes or os.cpu_count()
+        self.vocabulary = None
+
+    def fit(self, symbols=None):
+        """Builds the vocabulary and document frequencies from articles of given
+        symbols (all stored symbols by default)"""
+        if symbols is None:
+            symbols = list_article_symbols()
+        self.n_docs = 0
+        doc_freq = Counter()
+        for n_docs, counts in _map(_count_documents, symbols, self.processes,
+                                   self.chunksize, self.fold):
+            self.n_docs += n_docs
+            doc_freq.update(counts)
+        terms = [(word, df) for word, df in doc_freq.items()
+                 if df >= self.min_df and df <= self.max_df * self.n_docs]
+        # the most frequent words first, alphabetically within the same frequency
+        terms.sort(key=lambda item: (-item[1], item[0]))
+        if self.max_features is not None:
+            terms = terms[:self.max_features]
+        self.terms = [word for word, _ in terms]
+        self.doc_freq = np.array([df for _, df in terms], dtype=np.float64)
+        self.vocabulary = {word: i for i, word in enumerate(self.terms)}
+        return self
+
+    @property
+    def idf(self):
+        """Smoothed inverse document frequency of every term"""
+        return np.log((1 + self.n_docs) / (1 + self.doc_freq)) + 1
+
+    def transform(self, symbol, tfidf=True):
+        """Returns a sparse matrix (n_articles x n_terms) of a symbol's articles
+        and a DatetimeIndex of their dates. With tfidf=True term counts are
+        weighted with idf and rows are normalized to unit length"""
+        counts, dates = _term_counts(symbol, self.vocabulary, self.chunksize, self.fold)
+        return (self._tfidf(counts) if tfidf else counts), dates
+
+    def transform_many(self, symbols=None, tfidf=True):
+        """Returns a dict {symbol: (matrix, dates)}, symbols are processed in
+        parallel processes"""
+        if symbols is None:
+            symbols = list_article_symbols()
+        results = _map(_term_counts, symbols, self.processes, self.vocabulary,
+                       self.chunksize, self.fold)
+        return {symbol: ((self._tfidf(counts) if tfidf else counts), dates)
+                for symbol, (counts, dates) in zip(symbols, results)}
+
+    def _tfidf(self, counts):
+        weighted = sparse.csr_matrix(counts.multiply(self.idf))
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.csr_matrix(weighted.multiply(1 / norms[:, None]))
+
+    def top_terms(self, matrix, n=20):
+        """Returns a Series of n terms with the highest total weight in a
+        matrix returned by transform"""
+        totals = np.asarray(matrix.sum(axis=0)).ravel()
+        best = np.argsort(totals)[::-1][:n]
+        return pd.Series(totals[best], index=[self.terms[i] for i in best])
+
+    def save(self, path):
+        """Saves the vocabulary and document frequencies in a json file"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'settings': {'min_df': self.min_df, 'max_df': self.max_df,
+                                    'max_features': self.max_features, 'fold': self.fold},
+                       'n_docs': self.n_docs, 'terms': self.terms,
+                       'doc_freq': self.doc_freq.tolist()}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path, chunksize=1000, processes=None):
+        """Loads a pipeline saved with the save method"""
+        with open(path, encoding='utf-8') as f:
+            saved = json.load(f)
+        pipeline = cls(chunksize=chunksize, processes=processes, **saved['settings'])
+        pipeline.n_docs = saved['n_docs']
+        pipeline.terms = saved['terms']
+        pipeline.doc_freq = np.array(saved['doc_freq'], dtype=np.float64)
+        pipeline.vocabulary = {word: i for i, word in enumerate(pipeline.terms)}
+        return pipeline
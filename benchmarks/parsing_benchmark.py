@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the page parsers from data.parsing. HTML fixtures are parsed
+repeatedly with every available backend. Small synthetic pages with the
+structure of stooq and bankier pages are kept in benchmarks/fixtures, so the
+benchmark runs offline. Real pages can be recorded (to fixtures/recorded,
+which is not committed) and benchmarked too:
+
+    python -m benchmarks.parsing_benchmark run
+    python -m benchmarks.parsing_benchmark record --stooq CDR --bankier CDPROJEKT
+    python -m benchmarks.parsing_benchmark run --dir benchmarks/fixtures/recorded
+"""
+
+import os
+import time
+import argparse
+from data import parsing, web
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+RECORDED_DIR = os.path.join(FIXTURES_DIR, 'recorded')
+
+# fixture name: (scraper using the parser, parsing function)
+PARSERS = {
+    'stooq_symbols': ('download_stooq_symbols', parsing.parse_stooq_table),
+    'stooq_last_40': ('download_last_40_prices', parsing.parse_stooq_table),
+    'stooq_last_price': ('download_last_price', parsing.parse_stooq_quote_tables),
+    'bankier_news_list': ('download_bankier_article_urls', parsing.parse_bankier_article_links),
+    'bankier_last_page': ('find_last_news_page_bankier', parsing.parse_bankier_last_news_page),
+    'bankier_article': ('download_bankier_article', parsing.parse_bankier_article),
+}
+
+
+def record(stooq_symbol, bankier_symbol, directory=RECORDED_DIR):
+    """Downloads pages used by the scrapers and saves them as fixtures"""
+    os.makedirs(directory, exist_ok=True)
+    news_url = "https://www.bankier.pl/gielda/notowania/akcje/{}/wiadomosci/1".format(bankier_symbol)
+    urls = {
+        'stooq_symbols': "https://stooq.pl/t/?i=513&v=0&l=1",
+        'stooq_last_40': "https://stooq.pl/q/d/?s={}".format(stooq_symbol),
+        'stooq_last_price': "https://stooq.pl/q/g/?s={}".format(stooq_symbol),
+        'bankier_news_list': news_url,
+        'bankier_last_page': news_url,
+    }
+    for name, url in urls.items():
+        with open(os.path.join(directory, name + '.html'), 'wb') as f:
+            f.write(web.get(url).content)
+        print("Saved {}".format(name))
+    # the first article from the news list
+    with open(os.path.join(directory, 'bankier_news_list.html'), 'rb') as f:
+        link = parsing.parse_bankier_article_links(f.read())[0]
+    with open(os.path.join(directory, 'bankier_article.html'), 'wb') as f:
+        f.write(web.get('https://www.bankier.pl{}'.format(link)).content)
+    print("Saved bankier_article")
+
+def run(directory=FIXTURES_DIR, seconds=1.0):
+    """Parses every fixture with every backend for a given number of seconds
+    and prints pages parsed per second"""
+    backends = ['lxml', 'bs4'] if parsing.PARSER == 'lxml' else ['bs4']
+    default = parsing.PARSER
+    print("{:<32}{:>12}{:>12}".format('scraper', *['{} pages/s'.format(b) for b in backends]))
+    for name, (scraper, parse) in PARSERS.items():
+        file = os.path.join(directory, name + '.html')
+        if not os.path.exists(file):
+            print("{:<32}missing fixture {}".format(scraper, file))
+            continue
+        with open(file, 'rb') as f:
+            content = f.read()
+        rates = []
+        results = []
+        for backend in backends:
+            parsing.set_parser(backend)
+            n = 0
+            start = time.perf_counter()
+            while time.perf_counter() - start < seconds:
+                result = parse(content)
+                n += 1
+            rates.append(n / (time.perf_counter() - start))
+            results.append(result)
+        parsing.set_parser(default)
+        line = "{:<32}".format(scraper) + "".join("{:>12.1f}".format(r) for r in rates)
+        if any(result != results[0] for result in results):
+            line += "  (results differ!)"
+        print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark of page parsers")
+    parser.add_argument('command', choices=['record', 'run'])
+    parser.add_argument('--stooq', default='CDR', help="stooq symbol used by record")
+    parser.add_argument('--bankier', default='CDPROJEKT', help="bankier symbol used by record")
+    parser.add_argument('--dir', default=None, help="fixtures directory")
+    parser.add_argument('--seconds', type=float, default=1.0, help="time per parser")
+    args = parser.parse_args()
+    if args.command == 'record':
+        record(args.stooq, args.bankier, args.dir or RECORDED_DIR)
+    else:
+        run(args.dir or FIXTURES_DIR, args.seconds)
@@ -8,10 +8,33 @@ Created on Sun Dec 17 00:47:33 2017
 
 from data.gathering import download_historical_prices, download_stooq_symbols
 from data.gathering import download_last_40_prices, download_last_price
-from data.gathering import download_bankier_articles, download_bankier_article_urls
-from data.gathering import download_bankier_article, download_bankier_symbols
-from data.storage import save_price_data_to_db, read_price_data_from_db
-from data.storage import save_articles_to_db, read_articles_from_db
+from data.gathering import download_bankier_articles, download_bankier_symbols
+from data.storage import save_price_data_to_db, get_storage, list_price_symbols
+from data.storage import save_articles_to_db, read_articles_from_db, read_article_urls
+from data.storage import search_articles
+from data.formatting import articles_to_frame
+from data.cache import read_price_data, read_price_data_for_symbols
+from data.jobs import HistoryDownloadJob
+from data.pipeline import harvest_bankier_articles
+from analysis.portfolios import random_portfolios, best_portfolio
+from analysis.portfolios import portfolio_stats, portfolios_frame
+from analysis.optimization import weight_bounds, max_sharpe_weights, min_variance_weights
+from analysis.optimization import target_return_weights, efficient_frontier
+from analysis.text import TextPipeline
+from analysis.summary import summarize_returns
+from analysis.rolling import weighted_rolling_mean, weighted_rolling_std, ewma_volatility
+from analysis.rolling import rolling_portfolio_risk
+from analysis.panel import ReturnsPanel
+from analysis.simulation import simulate_portfolio
+from analysis.risk import var_cvar, rolling_var_cvar
+from analysis.backtest import backtest, rebalance_steps
+from analysis.covariance import CovarianceProvider, ESTIMATORS
+from analysis.correlation import UniverseCorrelation
+from analysis.indicators import IndicatorSet
+import time
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -22,209 +45,339 @@ sns.set()
 
 class PriceSeries():
     """Class that stores historical price data with various methods required
-    in price analysis. Data source is set to database 'db' by default but if
-    data is not available can be changed to 'web' to download it from stooq"""
+    in price analysis. Data source is set to database 'db' by default (prices
+    are loaded from the columnar cache first, see data.cache) but if data is not
+    available can be changed to 'web' to download it from stooq"""
 
     def __init__(self, stooq_symbol, source = 'db'):
         self.symbol = stooq_symbol
         if source == 'db':
-            self.data = read_price_data_from_db(self.symbol)
+            self.data = read_price_data(self.symbol)
         elif source == 'web':
             self.data = download_historical_prices(self.symbol)
-            self.save_data_to_db()
+            self.save_data_to_db(mode='rebuild')
         self.add_returns()
         self.add_monthly_returns()
         
-    def download_all_historical_prices_for_all_stocks(self):
+    def download_all_historical_prices_for_all_stocks(self, workers=4, retry_failed=False):
         """Downloads list of stock symbols from stooq.pl and iterates through
         it to download historical OHLCV data and store it in a database file.
-        Can be run few times on the same instance to continue downloading after
-        the limit of downloads is reached. Method is relatively slow and can be
-        used to recreate the full price database from scratch"""
-        # check if downloaded and symbols lists are already initialized
+        Progress is saved in the database (see data.jobs.HistoryDownloadJob) so
+        it can be run again, also from a new process, to continue downloading
+        after the limit of downloads is reached. Method is relatively slow and can
+        be used to recreate the full price database from scratch"""
         if not hasattr(self, 'downloaded'):
             self.downloaded = []
         if not hasattr(self, 'symbols'):
             # download available stooq symbols
             self.get_symbols()
-        # set a variable that stops iterations when limit is reached
-        limit = False
-        for symbol in self.symbols:
-            if not limit:
-                if symbol[0] not in self.downloaded:
-                    # download prices
-                    data = download_historical_prices(symbol[0])
-                    # check if response contains any data
-                    if len(data) > 0:
-                        # save to db, print status and add to downloaded list
-                        save_price_data_to_db(symbol[0], data)
-                        print("Downloaded {}".format(symbol))
-                        self.downloaded.append(symbol[0])
-                    else:
-                        # stop downloading when limit is reached
-                        print("Limit reached, change IP and run again")
-                        limit = True
-                        break
+        job = HistoryDownloadJob([symbol[0] for symbol in self.symbols], workers, retry_failed)
+        self.downloaded += job.run()
                     
     def get_symbols(self):
         self.symbols = download_stooq_symbols()
         print("{} symbols downloaded".format(len(self.symbols)))
     
-    def update_prices(self, only_last=True, date_offset=0):
-        """When only_last is True  downloads only the last price of the stock.
-        If set to False downloads up to 40 but can be limited to ~150 downloads 
-        per day. Offset used to set last business day and prevent downloading 
-        data multiple times on weekends/non-trading days. 
-        For example for Saturday: date_offset=-1 (if Friday was a trading day)"""
+    def fetch_new_prices(self, only_last=True, date_offset=0):
+        """Downloads prices missing in the price series and returns them as a
+        DataFrame without changing the series or the database. Returns None if
+        the series is already up to date and raises ValueError if nothing could
+        be downloaded. Parameters are the same as in update_prices"""
         # find the last business/trading day
-        last_b_day = pd.datetime.today()+pd.Timedelta(days=date_offset)
+        last_b_day = pd.Timestamp.today()+pd.Timedelta(days=date_offset)
         # last business day tuple
         bd_tuple = (last_b_day.day, last_b_day.month, last_b_day.year)
         # make sure the price data is sorted by date
         self.data = self.data.sort_index()
         # find last price observation day in the database
         last_date = self.data.tail(1).index[0]
-        # if last observation date is different than last business day
-        # some data is missing so try to downloading it
-        if (last_date.day, last_date.month, last_date.year) != bd_tuple:
-            # by default download only last price
-            if only_last:
-                new_data = download_last_price(self.symbol)
-            # if not "only_last" try downloading last 40 (subject to daily limits)
-            else:
-                new_data = download_last_40_prices(self.symbol)
-            # count new rows added to the database
-            rows_updated = 0
-            if new_data is not None:
-                # for each downloaded date
-                for date in new_data.index:
-                    # if it's not already in the database then add it
-                    if date not in self.data.index:
-                        row = new_data.xs(date)
-                        self.data = self.data.append(row)
-                        rows_updated += 1
-                # save updated price series to the database
-                self.data = self.data.sort_index()
-                self.add_returns()
-                self.save_data_to_db(silent=True)
-                print('{} - added {} new prices'.format(self.symbol, rows_updated))
-            else:
-                raise ValueError("{} - no data downloaded")
+        # if last observation date is the same as last business day nothing is missing
+        if (last_date.day, last_date.month, last_date.year) == bd_tuple:
+            return None
+        # by default download only last price
+        if only_last:
+            new_data = download_last_price(self.symbol)
+        # if not "only_last" try downloading last 40 (subject to daily limits)
+        else:
+            new_data = download_last_40_prices(self.symbol)
+        if new_data is None:
+            raise ValueError("{} - no data downloaded".format(self.symbol))
+        # keep only dates that are not already in the database
+        return new_data[~new_data.index.isin(self.data.index)]
+
+    def add_new_prices(self, new_rows, verify=False):
+        """Adds new rows of prices to the series. Log returns are calculated
+        only from the first new row on and monthly returns only from its
+        month. If verify is True the result is compared with a full
+        recalculation and ValueError is raised if they differ"""
+        if not len(new_rows):
+            return
+        self.data = pd.concat([self.data, new_rows]).sort_index()
+        start = self.data.index.searchsorted(new_rows.index.min())
+        self.add_returns(start)
+        self.add_monthly_returns(start)
+        if verify:
+            returns = self.data['log_return']
+            monthly_returns = self.monthly_returns
+            self.add_returns()
+            self.add_monthly_returns()
+            if not (np.allclose(returns, self.data['log_return'], rtol=0, atol=1e-12)
+                    and monthly_returns.index.equals(self.monthly_returns.index)
+                    and np.allclose(monthly_returns, self.monthly_returns, rtol=0, atol=1e-12)):
+                raise ValueError("{} - incremental returns differ from a full "
+                                 "recalculation".format(self.symbol))
+
+    def update_prices(self, only_last=True, date_offset=0):
+        """When only_last is True  downloads only the last price of the stock.
+        If set to False downloads up to 40 but can be limited to ~150 downloads 
+        per day. Offset used to set last business day and prevent downloading 
+        data multiple times on weekends/non-trading days. 
+        For example for Saturday: date_offset=-1 (if Friday was a trading day)"""
+        new_rows = self.fetch_new_prices(only_last, date_offset)
+        # nothing is written (and cached prices stay valid) without new rows
+        if new_rows is not None and not new_rows.empty:
+            self.add_new_prices(new_rows)
+            # write only the new rows, the rest of the table is untouched
+            self.save_data_to_db(silent=True, rows=new_rows)
+            print('{} - added {} new prices'.format(self.symbol, len(new_rows)))
         else:
-            self.downloaded.append(self.symbol)
             print('{} already up to date'.format(self.symbol))
             
-    def update_prices_for_all_stocks(self, only_last=True, date_offset=0):
+    def update_prices_for_all_stocks(self, only_last=True, date_offset=0, workers=8,
+                                     max_rate=None, batch_size=50):
         """When only_last is True method downloads only the last price of all
         available symbols. If set to False downloads up to 40 but can be limited
         to ~150 downloads per day. Offset used to set last business day and
         prevent downloading data multiple times on weekends/non-trading days
-        For example for Saturday: date_offset=-1 (if Friday was a trading day"""
+        For example for Saturday: date_offset=-1 (if Friday was a trading day)
+
+        Symbols are loaded and downloaded concurrently by a pool of 'workers'
+        threads (at most max_rate new downloads per second if given), while all
+        database writes are done by the calling thread in transactions of up to
+        batch_size symbols. Downloading stops after 5 failed downloads. Failed
+        symbols don't stop the others and prices downloaded before an error
+        are always saved. Status of every symbol is stored in the
+        update_status DataFrame"""
         # check if downloaded and symbols lists are already initialized
         if not hasattr(self, 'downloaded'):
             self.downloaded = []
         if not hasattr(self, 'symbols'):
             # download available stooq symbols
             self.get_symbols()
-        # boolean value that stops the loop when set to false
-        keep_iterating = True
+        downloaded = set(self.downloaded)
+        queue = deque(symbol[0] for symbol in self.symbols if symbol[0] not in downloaded)
+
+        def update_symbol(symbol):
+            """Loads price data and downloads missing prices of a symbol"""
+            px = PriceSeries(symbol)
+            return px.fetch_new_prices(only_last, date_offset)
+
         # number of prices failed to update
         self.error_count = 0
-        for symbol in self.symbols:
-            if symbol[0] not in self.downloaded:
-                if keep_iterating:
-                    # load price data from database by initializing price series object
-                    try:
-                        px = PriceSeries(symbol[0])
-                        px.update_prices(only_last=only_last, date_offset=date_offset)
-                        self.downloaded.append(symbol[0])
-                    except pd.io.sql.DatabaseError:
-                        print('No data found for {}'.format(symbol[0]))
-                    except ValueError:
-                        self.error_count += 1
-                    except (IndexError, AttributeError):
-                        print("Issue with {}".format(symbol[0]))
-                        continue
-                    if self.error_count >= 5:
-                        keep_iterating = False
+        status = {}
+        pending_writes = []
+        storage = get_storage('price_data')
+
+        def write_pending():
+            """Saves downloaded prices of many symbols in one transaction"""
+            with storage.transaction():
+                for symbol, new_rows in pending_writes:
+                    save_price_data_to_db(symbol, new_rows, silent=True)
+            for symbol, new_rows in pending_writes:
+                self.downloaded.append(symbol)
+                print('{} - added {} new prices'.format(symbol, len(new_rows)))
+            del pending_writes[:]
+
+        start = time.time()
+        last_submit = 0
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                running = {}
+                while queue or running:
+                    # keep the pool busy unless the limit of errors was reached
+                    while queue and len(running) < 2 * workers and self.error_count < 5:
+                        if max_rate is not None:
+                            time.sleep(max(0, last_submit + 1 / max_rate - time.time()))
+                            last_submit = time.time()
+                        symbol = queue.popleft()
+                        running[pool.submit(update_symbol, symbol)] = symbol
+                    if not running:
+                        break
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        symbol = running.pop(future)
+                        try:
+                            new_rows = future.result()
+                        except pd.io.sql.DatabaseError:
+                            print('No data found for {}'.format(symbol))
+                            status[symbol] = ('no data in db', 0)
+                        except ValueError:
+                            self.error_count += 1
+                            status[symbol] = ('download error', 0)
+                        except (IndexError, AttributeError):
+                            print("Issue with {}".format(symbol))
+                            status[symbol] = ('issue', 0)
+                        except requests.RequestException as e:
+                            print("{} - connection error: {}".format(symbol, e))
+                            self.error_count += 1
+                            status[symbol] = ('connection error', 0)
+                        else:
+                            if new_rows is None or new_rows.empty:
+                                print('{} already up to date'.format(symbol))
+                                self.downloaded.append(symbol)
+                                status[symbol] = ('up to date', 0)
+                            else:
+                                pending_writes.append((symbol, new_rows))
+                                status[symbol] = ('updated', len(new_rows))
+                    if len(pending_writes) >= batch_size:
+                        write_pending()
+                    if self.error_count >= 5 and queue:
                         print("Limit reached!")
-
-    def save_data_to_db(self, silent=False):
+                        for symbol in queue:
+                            status[symbol] = ('skipped', 0)
+                        queue.clear()
+        finally:
+            # prices downloaded before an error are saved too
+            write_pending()
+            self.update_status = pd.DataFrame.from_dict(status, orient='index',
+                                                        columns=['status', 'new_rows'])
+        elapsed = time.time() - start
+        print(self.update_status['status'].value_counts().to_string())
+        print("{} symbols processed in {:.1f}s ({:.1f} symbols/s)".format(
+            len(status), elapsed, len(status) / max(elapsed, 1e-9)))
+
+    def save_data_to_db(self, silent=False, rows=None, mode='upsert'):
+        """Saves price data in the database. By default all rows are upserted,
+        'rows' can be used to write only a part of data (e.g. new prices) and
+        mode='rebuild' replaces the whole table"""
         columns = ['open', 'high', 'low', 'close', 'volume']
-        save_price_data_to_db(self.symbol, self.data[columns], silent)
-
-    def add_returns(self):
-        self.data['log_return'] = np.log(self.data['close'].pct_change()+1)
-        self.data.fillna(0, inplace=True)
-
-    def add_monthly_returns(self):
-        self.monthly_returns = self.data['log_return'].resample('MS').sum()
+        if rows is None:
+            rows = self.data
+        save_price_data_to_db(self.symbol, rows[columns], silent, mode)
+
+    def add_returns(self, start=None):
+        """Adds log returns of close prices, missing returns (the first one and
+        ones next to missing prices) are 0. If start is given only returns of
+        rows from position start on are calculated"""
+        if start is None or start == 0 or 'log_return' not in self.data:
+            returns = np.log(self.data['close'].pct_change()+1)
+            self.data['log_return'] = returns.fillna(0)
+            return
+        # the previous close is needed for the first new return
+        close = self.data['close'].iloc[start-1:]
+        returns = np.log(close.pct_change()+1).iloc[1:]
+        column = self.data.columns.get_loc('log_return')
+        self.data.iloc[start:, column] = returns.fillna(0).values
+
+    def add_monthly_returns(self, start=None):
+        """Sums log returns in calendar months. If start is given only months
+        from the month of the row at position start on are summed again"""
+        if start is None or not hasattr(self, 'monthly_returns'):
+            self.monthly_returns = self.data['log_return'].resample('MS').sum()
+            return
+        first_month = self.data.index[start].to_period('M').to_timestamp()
+        returns = self.data['log_return']
+        recent = returns[returns.index >= first_month].resample('MS').sum()
+        kept = self.monthly_returns[self.monthly_returns.index < first_month]
+        self.monthly_returns = pd.concat([kept, recent])
 
     def add_rolling_avg(self, column='close', window=21):
         col_name = 'r_avg_{}_{}'.format(column, window)
         self.data[col_name] = self.data[column].rolling(window).mean()
-        self.data.dropna()
 
-    def add_rolling_std(self, window=21, annualized=True, weighted=False, decay='lin'):
+    def add_rolling_std(self, window=21, annualized=True, weighted=False, decay='lin',
+                        lam=0.94):
+        """Adds a rolling standard deviation of log returns. If weighted is True
+        newer returns get higher weights, decay is 'lin' (linear), 'exp'
+        (exponential with factor lam) or an array of weights (see
+        analysis.rolling.weighted_rolling_std)"""
         if not weighted:
             col_name = 'rolling_std_{}'.format(window)
             self.data[col_name] = self.data['log_return'].rolling(window).std()
         else:
             col_name = 'rolling_w_std_{}'.format(window)
-            roll = self.data['log_return'].rolling(window)
-            weights = np.linspace(0, 1, window)/sum(np.linspace(0, 1, window))
-            self.data[col_name] = roll.apply(lambda x: (x*weights).std())
+            self.data[col_name] = weighted_rolling_std(self.data['log_return'], window,
+                                                       decay, lam)
+        if annualized:
+            self.data[col_name] = self.data[col_name] * np.sqrt(252)
+
+    def add_weighted_rolling_avg(self, column='close', window=21, decay='lin', lam=0.94):
+        """Adds a weighted moving average of a column, newer values get higher
+        weights (see add_rolling_std for decay options)"""
+        col_name = 'r_w_avg_{}_{}'.format(column, window)
+        self.data[col_name] = weighted_rolling_mean(self.data[column], window, decay, lam)
+
+    def add_ewma_std(self, lam=0.94, annualized=True):
+        """Adds RiskMetrics EWMA volatility of log returns (lam=0.94 is the
+        RiskMetrics factor for daily data)"""
+        col_name = 'ewma_std_{}'.format(lam)
+        self.data[col_name] = ewma_volatility(self.data['log_return'], lam)
         if annualized:
             self.data[col_name] = self.data[col_name] * np.sqrt(252)
-        self.data.dropna()
 
-    def add_weighted_rolling_avg(self, window=21):
-        pass
+    def add_indicators(self, market='WIG', **params):
+        """Adds columns of technical indicators (moving averages, RSI, MACD,
+        Bollinger bands, ATR and beta against the market index if market is
+        not None). Params are passed to analysis.indicators.IndicatorSet,
+        which is kept in the indicators attribute for updates"""
+        self.indicators = IndicatorSet(**params)
+        columns = {column: self.data[[column]].rename(columns={column: self.symbol})
+                   for column in ('high', 'low', 'close')}
+        market_close = read_price_data(market)['close'] if market is not None else None
+        frame = self.indicators.compute(columns['high'], columns['low'], columns['close'],
+                                        market_close)
+        for name, values in frame.droplevel('symbol', axis=1).items():
+            self.data[name] = values
+
+    @classmethod
+    def indicators_for_stocks(cls, symbols=None, market='WIG', **params):
+        """Calculates technical indicators of all (or given) stocks stored in
+        the database together and returns an IndicatorSet (history of
+        indicators in its history attribute). New days of prices are added
+        with its update method"""
+        return IndicatorSet.load(symbols, market, **params)
 
     def summary(self):
-        """Returns a summary of rolling statustics for price series"""
-        summ = pd.Series()
-        ret = self.data['log_return']
-        #returns
-        def roll_return(returns, window):
-            if len(returns) >= window:
-                return returns.tail(window).sum()
-            else:
-                return np.nan
-
-        def roll_std(returns, window):
-            if len(returns) >= window:
-                return returns.tail(window).std()
-            else:
-                return np.nan
-        #general
-        summ.set_value('first_day', pd.to_datetime(str(ret.head(1).index.values[0])).strftime('%Y-%m-%d'))
-        summ.set_value('last_day', pd.to_datetime(str(ret.tail(1).index.values[0])).strftime('%Y-%m-%d'))
-        summ.set_value('n_observations', len(ret))
-        #returns
-        summ.set_value('ret_1d', ret.tail(1)[0])
-        summ.set_value('ret_5d', roll_return(ret, 5))
-        summ.set_value('ret_21d', roll_return(ret, 21))
-        summ.set_value('ret_252d', roll_return(ret, 252))
-        summ.set_value('ret_3y', roll_return(ret, 252*3))
-        summ.set_value('ret_5y', roll_return(ret, 252*5))
-        # standard dev
-        summ.set_value('std_5d', roll_std(ret, 5))
-        summ.set_value('std_21d', roll_std(ret, 21))
-        summ.set_value('std_252d', roll_std(ret, 252))
-        summ.set_value('std_252d_ann', roll_std(ret, 252)*np.sqrt(252))
-        # risk/return profile
-        summ.set_value('return/risk_1y', summ['ret_252d']/summ['std_252d_ann'])
-        # tails and shape
-        summ.set_value('skew_252d', ret.tail(252).skew())
-        summ.set_value('skew_3y', ret.tail(252*3).skew())
-        summ.set_value('kurt_252d', ret.tail(252).kurt())
-        summ.set_value('kurt_3y', ret.tail(252*3).kurt())
-        summ.set_value('max_1d_ret', max(ret))
-        summ.set_value('min_1d_ret', min(ret))
-        summ.set_value('n_above_3_sigma', len(ret[ret > (ret.mean()+3*ret.std())]))
-        summ.set_value('n_below_3_sigma', len(ret[ret < (ret.mean()-3*ret.std())]))
-        return summ
+        """Returns a summary of rolling statistics for price series (see
+        analysis.summary.summarize_returns)"""
+        return summarize_returns({self.symbol: self.data['log_return']}).iloc[0]
+
+    @classmethod
+    def summary_for_stocks(cls, symbols=None):
+        """Returns a DataFrame (symbols x metrics) with summaries of all (or
+        given) stocks stored in the database. Prices are read from the cache and
+        all summaries are calculated together"""
+        if symbols is None:
+            symbols = list_price_symbols()
+        prices = read_price_data_for_symbols(symbols)
+        returns = {symbol: np.log(data['close'].pct_change()+1).fillna(0)
+                   for symbol, data in prices.items() if len(data)}
+        return summarize_returns(returns)
+
+    def value_at_risk(self, levels=(0.95, 0.99), method='historical', window=None):
+        """Returns VaR and CVaR of daily log returns (positive values are losses).
+        Method is 'historical', 'parametric' or 'cornish_fisher'. If window is
+        given the measures are calculated in rolling windows of window days
+        and a DataFrame with (measure, level) columns is returned, otherwise
+        a Series for the whole history (see analysis.risk)"""
+        returns = self.data['log_return'].rename(self.symbol)
+        if window is None:
+            return var_cvar(returns, levels, method).iloc[0]
+        return rolling_var_cvar(returns, window, levels, method).droplevel('symbol', axis=1)
+
+    @classmethod
+    def value_at_risk_for_stocks(cls, symbols=None, levels=(0.95, 0.99), method='historical',
+                                 window=None):
+        """Returns VaR and CVaR of all (or given) stocks stored in the database
+        calculated together for all symbols. Without window the result is
+        indexed by symbol, with window it is a DataFrame of dates with
+        (measure, level, symbol) columns"""
+        if symbols is None:
+            symbols = list_price_symbols()
+        returns = ReturnsPanel.load(symbols, missing='pairwise').returns
+        if window is None:
+            return var_cvar(returns, levels, method)
+        return rolling_var_cvar(returns, window, levels, method)
 
     def price_return_hist(self, n_months=12, hist=True, kde=False,
                           display_normal=True, bins=100):
@@ -294,55 +447,73 @@ class Articles():
         # download all available articles related to a given symbol
         article_list = download_bankier_articles(self.symbol)
         # transform downloaded data into a dataframe
-        self.data = pd.DataFrame()
-        self.data['date'] = [pd.to_datetime(article[0]) for article in article_list]
-        self.data['header'] = [article[1].strip() for article in article_list]
-        self.data['content'] = [article[2].strip() for article in article_list]
-        self.data['url'] = [article[3].strip() for article in article_list]
-        self.data['source'] = ['bankier' for item in article_list]
-        self.data.set_index('date', inplace = True)
-        self.data = self.data.sort_index(ascending=False)
+        self.data = articles_to_frame(article_list)
         # save dataframe with articles to database file
         self.save_data_to_db()
         
-    def update_articles(self):
-        """Compares the list of downloaded articles with articles available
-        and downloads the ones that are missing"""
-        # download a list of urls of all available articles
-        available_urls = download_bankier_article_urls(self.symbol)
-        # create a list of all urls that already have been downloaded
-        downloaded_urls = list(self.data['url'])
-        counter = 0
-        # download all articles that have not been downloaded yet
-        for url in available_urls:
-            if url not in downloaded_urls:
-                try:
-                    art = download_bankier_article(url)
-                    art.append('bankier')
-                    art_df = pd.DataFrame([art], columns =["date", "header", "content", 
-                                                      "url", "source"])
-                    art_df.set_index("date", inplace = True)
-                    art_df.index = pd.to_datetime(art_df.index, yearfirst = True)
-                    self.data.append(art_df)
-                    counter += 1
-                except:
-                    continue
-        print("{} - downloaded {} new articles".format(self.symbol, counter))
-        # if any new articles were downloaded sort the dataset and save it in db
-        if counter > 0:
-            self.data = self.data.sort_index(ascending=False)
-            self.save_data_to_db()
+    def update_articles(self, workers=8):
+        """Downloads articles that are not in the database yet. Paging through
+        the list of available articles stops at the first already known url
+        (unless an earlier download of the history was interrupted - then it
+        continues from the page where it stopped), articles that failed to
+        download before are retried and new articles are inserted into the
+        database without rewriting it"""
+        known_urls = {self.symbol: set(self.data['url'])}
+        _, report = harvest_bankier_articles([self.symbol], known_urls, workers=workers)
+        # if any new articles were saved reload the dataset from db
+        if report.saved[self.symbol]:
+            self.load_data_from_db()
+        print("{} - downloaded {} new articles".format(self.symbol, report.saved[self.symbol]))
+        if report.errors:
+            print(report)
             
+    def search(self, query, since=None, until=None, limit=50):
+        """Searches the symbol's articles with the full-text index and returns
+        a DataFrame of hits from the best match (see data.storage.search_articles).
+        Example: articles mentioning 'dywidenda' in the last month
+            test.search('dywidenda', since=pd.Timestamp.today()-pd.DateOffset(months=1))"""
+        return search_articles(query, [self.symbol], since, until, limit)
+
+    def term_matrix(self, pipeline=None, tfidf=True):
+        """Returns a sparse (n_articles x n_terms) TF-IDF (or term count if
+        tfidf=False) matrix of the symbol's articles and a DatetimeIndex of
+        their dates. Articles are read from the database in chunks. If pipeline
+        is not given a TextPipeline is fitted on the symbol's articles only"""
+        if pipeline is None:
+            pipeline = TextPipeline(processes=1).fit([self.symbol])
+        self.pipeline = pipeline
+        return pipeline.transform(self.symbol, tfidf)
+
+    def top_terms(self, n=20, pipeline=None, tfidf=True):
+        """Returns a Series of n terms with the highest total weight in the
+        symbol's articles"""
+        matrix, _ = self.term_matrix(pipeline, tfidf)
+        return self.pipeline.top_terms(matrix, n)
+
     @classmethod
-    def update_articles_for_all_stocks(cls):
-        """Runs 'update_articles' method on all available symbols"""
+    def text_pipeline(cls, symbols=None, processes=None, **params):
+        """Fits a TextPipeline on articles of all (or given) symbols stored in
+        the database using many processes. The pipeline can be saved with its
+        save method and passed to term_matrix to get comparable matrices"""
+        return TextPipeline(processes=processes, **params).fit(symbols)
+
+    @classmethod
+    def search_all(cls, query, since=None, until=None, limit=50, symbols=None):
+        """Searches articles of all (or given) symbols with the full-text index"""
+        return search_articles(query, symbols, since, until, limit)
+
+    @classmethod
+    def update_articles_for_all_stocks(cls, workers=8, per_host=4):
+        """Downloads articles missing in the database for all available symbols.
+        Articles of all symbols are downloaded concurrently and appended to the
+        database in batches. Returns a HarvestReport with numbers of articles
+        and errors"""
         symbols = download_bankier_symbols()
-        for symbol in symbols:
-            try:
-                test = cls(symbol)
-                test.update_articles()
-            except:
-                continue
+        known_urls = {symbol: read_article_urls(symbol) for symbol in symbols}
+        _, report = harvest_bankier_articles(symbols, known_urls, workers=workers,
+                                             per_host=per_host)
+        print(report)
+        return report
             
 
 class PortfolioOptimizer():
@@ -350,21 +521,33 @@ class PortfolioOptimizer():
 
     def __init__(self, name):
         self.name = name
+        self.covariances = CovarianceProvider()
+        self.set_covariance_estimator('sample')
 
     def __str__(self):
         return "Portfolio {} of: {}".format(self.name, ", ".join(self.symbols))
 
-    def add_stocks(self, stock_symbols, weights=None):
-        self.symbols = stock_symbols
-        self.stocks = [PriceSeries(symbol) for symbol in self.symbols]
-        self.returns = pd.DataFrame()
-        for stock in self.stocks:
-            self.returns[stock.symbol] = stock.data['log_return']
-        self.monthly_returns = pd.DataFrame()
-        for stock in self.stocks:
-            self.monthly_returns[stock.symbol] = stock.monthly_returns
+    def add_stocks(self, stock_symbols, weights=None, missing='drop'):
+        """Loads returns of given stocks into a ReturnsPanel (see
+        analysis.panel). Prices of all stocks are read with one query when the
+        consolidated prices table exists (see
+        data.storage.migrate_to_consolidated_prices). Missing data policy is
+        'drop', 'ffill' or 'pairwise'. Attributes returns and monthly_returns
+        are DataFrame views of the panel's matrices"""
+        self.symbols = list(stock_symbols)
+        self.panel = ReturnsPanel.load(self.symbols, missing)
+        self.returns = self.panel.returns
+        self.monthly_returns = self.panel.monthly_returns
+        self._stocks = None
         self.weights = weights
 
+    @property
+    def stocks(self):
+        """PriceSeries objects of all stocks, created when first needed"""
+        if self._stocks is None:
+            self._stocks = [PriceSeries(symbol) for symbol in self.symbols]
+        return self._stocks
+
     def set_weights(self, weights):
         """Provide weights of stocks in a form of a matrix/array
         Format:
@@ -373,93 +556,257 @@ class PortfolioOptimizer():
         self.weights = weights
 
     def summary(self):
-        summ = pd.DataFrame()
-        for stock in self.stocks:
-            summ[stock.symbol] = stock.summary()
-        return summ
+        """Returns a DataFrame (symbols x metrics) with summaries of all stocks"""
+        return summarize_returns(self.panel.symbol_returns())
+
+    def set_covariance_estimator(self, estimator='sample', **params):
+        """Selects the covariance estimator used by optimization, random
+        portfolios, correlation and simulation methods: 'sample',
+        'ledoit_wolf', 'ewma' (param lam) or 'factor' (param n_factors), see
+        analysis.covariance"""
+        if estimator not in ESTIMATORS:
+            raise ValueError("Unknown covariance estimator: {}".format(estimator))
+        self.cov_estimator = estimator
+        self.cov_params = params
+
+    def covariance(self, months_of_data=36, monthly=True):
+        """Returns a CovarianceEstimate (mean returns, covariance and correlation
+        matrices and the Cholesky factor) of the last months_of_data months (or
+        days if monthly is False). Estimates are memoized, so all methods using
+        the same period share one matrix"""
+        return self.covariances.estimate(self.panel, months_of_data, self.cov_estimator,
+                                         monthly, **self.cov_params)
 
     def correlation(self, months=36, plot=False):
-        price_matrix = pd.DataFrame()
-        for stock in self.stocks:
-            stock.add_monthly_returns()
-            price_matrix[stock.symbol] = stock.monthly_returns.tail(months)
+        corr = self.covariance(months).frame(corr=True)
         if plot:
-            sns.heatmap(price_matrix.corr())
-        return price_matrix.corr()
+            sns.heatmap(corr)
+        return corr
+
+    @classmethod
+    def universe_correlation(cls, monthly=False, recompute=False, **params):
+        """Returns a UniverseCorrelation of all stored stocks (see
+        analysis.correlation) with daily or monthly returns. The saved matrix is
+        used unless recompute is True or it doesn't exist yet, params are passed
+        to UniverseCorrelation.compute. Example:
+            PortfolioOptimizer.universe_correlation().top('PZU', 10)"""
+        corr = UniverseCorrelation('monthly' if monthly else 'daily')
+        if not recompute:
+            try:
+                return corr.load()
+            except FileNotFoundError:
+                pass
+        return corr.compute(monthly=monthly, **params)
 
     def generate_rand_portfolios(self, n_portfolios = 10000, months_of_data = 36,
-                                 plot=True, weights=False, figsize=(12,6)):
-        """Function takes a list of stock symbols as input and generates a given number
-        of randomly weighted protfolios based of monthly price data from a given period.
-        Function displays a scatterplot of generated portfolios' risk/return characteristics
-        as well as points the portfolio with the best expected return to expected risk ratio"""
-        # Merge monthly returns from the given period in one data frame
-        df = pd.DataFrame()
-        for price_series in self.stocks:
-            df[price_series.symbol] = price_series.monthly_returns.tail(months_of_data)
-
-        def random_weights(n):
-            """Function returns an array of randomly generated weights that sum up to 1"""
-            nums = np.random.rand(n)
-            return nums/sum(nums)
-
-        def create_rand_portfolio(df):
-            """Function calculates mean return and standard deviation of a randomly
-            generated portfolio of given stocks"""
-            e_r = np.asmatrix(np.mean(df.T, axis=1))          # average returns
-            w = np.asmatrix(random_weights(df.T.shape[0]))    # randomly generated weights
-            C = np.asmatrix(np.cov(np.array(df).T))           # variance-covariance matrix
-            # calculate the dot product of expected weights and mean returns
-            # expected portfolio return:
-            mu = np.dot(w, e_r.T)*12
-            # clalculate the standard deviation of the portfolio
-            std = np.sqrt(w * C * w.T)*np.sqrt(12)
-            # rerun the random generation if the risk is too high to refuce outliers
-            if std > 0.6:
-                return create_rand_portfolio(df)
-            #return the expected return, standard deviation and transposed vector of weights
-            return mu, std, w.T
-
-        # generate given number of random portfolios
-        means, stds, w = np.column_stack([create_rand_portfolio(df) for _ in range(n_portfolios)])
-        # create a list of return/risk ratios for all portfolios
-        rr = []
-        for m, s, w in zip(means, stds, w):
-            rr.append([m/s, w, m, s])
+                                 plot=True, weights=False, figsize=(12,6), seed=None):
+        """Function generates a given number of randomly weighted protfolios based
+        of monthly price data from a given period. All portfolios are generated in
+        one batch (see analysis.portfolios.random_portfolios) and stored in the
+        random_portfolios attribute as a DataFrame of expected return, std,
+        return/risk ratio and weights. Function displays a scatterplot of generated
+        portfolios' risk/return characteristics as well as points the portfolio
+        with the best expected return to expected risk ratio"""
+        symbols = self.monthly_returns.columns
+        # mean returns and variance-covariance matrix are calculated only once
+        e_r, C = self.return_stats(months_of_data)
+        self.random_portfolios = random_portfolios(e_r, C, n_portfolios, seed=seed,
+                                                   symbols=symbols)
         # find the portfolio with the best return/risk ratio
-        best = max(rr, key=lambda item : item[0])
+        best = best_portfolio(self.random_portfolios)
+        if plot:
+            self.plot_rand_portfolios(figsize=figsize)
+        # return weights of the best portfolio
+        if weights:
+            return best[symbols].values.astype(np.float64)
+
+    def plot_rand_portfolios(self, figsize=(12,6), max_points=100000):
+        """Displays a scatterplot of risk/return characteristics of portfolios
+        created by generate_rand_portfolios and points the portfolio with the best
+        expected return to expected risk ratio. If there are more than max_points
+        portfolios a random sample of them is plotted"""
+        portfolios = self.random_portfolios
+        symbols = portfolios.columns[3:]
+        best = best_portfolio(portfolios)
+        if len(portfolios) > max_points:
+            portfolios = portfolios.sample(max_points)
+        #create a scatterplot, return/risk ratio determines data points colors
+        plt.figure(figsize=figsize)
+        plt.scatter(portfolios['std'], portfolios['return'], alpha = 0.5,
+                    c = portfolios['return/risk'])
+        plt.xlabel('Annualized standard deviation')
+        plt.ylabel('Expected annual return')
+        # add a side bar with return/risk levels legend
+        cbar = plt.colorbar()
+        cbar.ax.get_yaxis().labelpad = 15
+        cbar.ax.set_ylabel('E(r)/std', rotation=270)
+        # create a description of the most efficient portfolio
+        description = "E(r): {}%, Portfolio: ".format("%.2f" % (best['return']*100))
+        for symbol in symbols:
+            description += "{}: {}%, ".format(symbol, "%.2f" % (best[symbol]*100))
+        # add a pointer with description to the chart
+        plt.annotate(description, xy=(best['std'], best['return']), size = 10,
+                     xytext=(best['std']-0.12, best['return']+0.11),
+                     arrowprops=dict(facecolor='grey', shrink=0.05),)
+        # add a chart title
+        plt.title('Mean and standard deviation of returns of {} randomly generated portfolios'.format(len(self.random_portfolios)))
+        plt.show()
+
+    def return_stats(self, months_of_data=36):
+        """Returns mean monthly returns and the variance-covariance matrix of
+        monthly returns from a given period"""
+        estimate = self.covariance(months_of_data)
+        return estimate.mean, estimate.cov
+
+    def optimize(self, objective='max_sharpe', months_of_data=36, bounds=(0, 1),
+                 target=None, risk_free=0, set_weights=False):
+        """Finds optimal weights of the portfolio based on monthly returns from
+        a given period. Returns an array of weights in the set_weights format.
+
+        Parameters:
+            objective: str
+                'max_sharpe' - the best (return - risk_free)/std ratio
+                'min_variance' - the lowest standard deviation
+                'target_return' - the lowest std with expected return = target
+            bounds: tuple, list or dict
+                (low, high) for all stocks, list of (low, high) per stock or
+                dict {symbol: (low, high)}. Default (0, 1) is long-only
+            target: float
+                expected annual return, required for 'target_return'
+            risk_free: float
+                annual risk free rate used for 'max_sharpe'
+            set_weights: bool
+                if True the weights are also set as portfolio's weights"""
+        e_r, C = self.return_stats(months_of_data)
+        w = self._optimal_weights(e_r, C, objective, weight_bounds(bounds, self.symbols),
+                                  target, risk_free)
+        if set_weights:
+            self.set_weights(w)
+        return w
+
+    def _optimal_weights(self, e_r, C, objective, bounds, target, risk_free):
+        """Solves the optimization problem for given monthly statistics"""
+        if objective == 'max_sharpe':
+            return max_sharpe_weights(e_r, C, bounds, risk_free/12)
+        elif objective == 'min_variance':
+            return min_variance_weights(e_r, C, bounds)
+        elif objective == 'target_return':
+            if target is None:
+                raise ValueError("target is required for 'target_return' objective")
+            return target_return_weights(e_r, C, target/12, bounds)
+        raise ValueError("Unknown objective: {}".format(objective))
+
+    def weight_schedule(self, objective='max_sharpe', months_of_data=36, rebalance='Q',
+                        bounds=(0, 1), target=None, risk_free=0):
+        """Re-runs the optimizer on rolling windows of monthly returns and returns
+        a DataFrame of weights (dates x symbols) that can be backtested. Weights
+        dated on the first day of a month use only returns of the previous
+        months_of_data months, rebalance is the frequency of changes ('M', 'Q',
+        'Y' or a number of months). Parameters are the same as in optimize"""
+        index = self._schedule_months()
+        b = weight_bounds(bounds, self.symbols)
+        steps = rebalance_steps(index, rebalance)
+        steps[0] = True
+        schedule = {}
+        for i in np.flatnonzero(steps):
+            if i < months_of_data:
+                continue
+            # estimates are shared with other methods through the provider
+            estimate = self.covariances.estimate(self.panel, months_of_data, self.cov_estimator,
+                                                 True, i, **self.cov_params)
+            schedule[index[i]] = self._optimal_weights(estimate.mean, estimate.cov, objective,
+                                                       b, target, risk_free)
+        return pd.DataFrame.from_dict(schedule, orient='index', columns=self.symbols)
+
+    def _schedule_months(self):
+        """Months for which weights can be decided: months of monthly returns
+        and the next month (weights for it use all returns)"""
+        index = self.panel.monthly_index
+        return index.append(pd.DatetimeIndex([index[-1] + pd.DateOffset(months=1)]))
+
+    def backtest(self, weights=None, rebalance='M', cost=0.001, monthly=False, risk_free=0,
+                 plot=False, figsize=(12,6)):
+        """Backtests weight schemes on daily (or monthly) returns of the stocks.
+        Weights are current portfolio weights by default, can be other static
+        weights, a schedule from weight_schedule or a dict of many strategies
+        (see analysis.backtest.backtest). Portfolios are rebalanced with a
+        given frequency ('M', 'Q', number of periods or None) paying cost of
+        every traded unit. Returns a BacktestResult with equity curves,
+        turnover, drawdowns and a summary with Sharpe ratios"""
+        if weights is None:
+            weights = self.weights
+        returns = self.monthly_returns if monthly else self.returns
+        self.backtest_results = backtest(returns, weights, rebalance, cost,
+                                         12 if monthly else 252, risk_free)
         if plot:
-            # use the return/risk ratio to determine data points colors on the plot
-            colors = [np.asscalar(item[0]) for item in rr]
-            #create a scatterplot
-            plt.figure(figsize=figsize)
-            plt.scatter(stds, means, alpha = 0.5, c = colors)
+            self.backtest_results.equity.plot(
+                title='Backtest of {}, rebalancing: {}'.format(self.name, rebalance),
+                figsize=figsize)
+            plt.show()
+        return self.backtest_results
+
+    def efficient_frontier(self, n_points=50, months_of_data=36, bounds=(0, 1),
+                           plot=False, figsize=(12,6)):
+        """Calculates portfolios on the efficient frontier and returns a DataFrame
+        of their annualized expected return, std, return/risk ratio and weights.
+        Bounds have the same format as in the optimize method"""
+        e_r, C = self.return_stats(months_of_data)
+        b = weight_bounds(bounds, self.symbols)
+        w = efficient_frontier(e_r, C, b, n_points)
+        means, stds = portfolio_stats(w, e_r, C)
+        self.frontier = portfolios_frame(w, means*12, stds*np.sqrt(12), self.symbols)
+        if plot:
+            self.frontier.plot(x='std', y='return', figsize=figsize, legend=False,
+                               title='Efficient frontier of {}'.format(self.name))
             plt.xlabel('Annualized standard deviation')
             plt.ylabel('Expected annual return')
-            # add a side bar with return/risk levels legend
-            cbar = plt.colorbar()
-            cbar.ax.get_yaxis().labelpad = 15
-            cbar.ax.set_ylabel('E(r)/std', rotation=270)
-
-            def desc(ex, weights, symbols):
-                """Function creates a description of the expected return and weights of a
-                portfolio"""
-                string = "E(r): {}%, Portfolio: ".format("%.2f" % (np.asscalar(ex)*100))
-                for n, w in enumerate(weights):
-                    string += "{}: {}%, ".format(symbols[n], "%.2f" % (np.asscalar(w)*100))
-                return string
-
-            # create a description of the most efficient portfolio
-            description = desc(best[2], best[1], df.columns)
-            # add a pointer with description to the chart
-            plt.annotate(description, xy=(best[3], best[2]), size = 10, xytext=(best[3]-0.12, best[2]+0.11),
-                         arrowprops=dict(facecolor='grey', shrink=0.05),)
-            # add a chart title
-            plt.title('Mean and standard deviation of returns of {} randomly generated portfolios'.format(n_portfolios))
             plt.show()
-        # return weights of the best portfolio
-        if weights:
-            return best[1]
+        return self.frontier
+
+    def value_at_risk(self, levels=(0.95, 0.99), method='historical', window=None,
+                      monthly=False, individual=False):
+        """Returns VaR and CVaR of daily (or monthly) log returns of the portfolio
+        with current weights or of every stock if individual is True. Method is
+        'historical', 'parametric' or 'cornish_fisher', with window the
+        measures are calculated in rolling windows (see analysis.risk)"""
+        returns = self.monthly_returns if monthly else self.returns
+        if not individual:
+            returns = returns.dropna()
+            returns = pd.Series(returns.values @ np.asarray(self.weights, dtype=np.float64),
+                                index=returns.index, name=self.name)
+        if window is None:
+            result = var_cvar(returns, levels, method)
+            return result if individual else result.iloc[0]
+        result = rolling_var_cvar(returns, window, levels, method)
+        return result if individual else result.droplevel('symbol', axis=1)
+
+    def simulate(self, n_paths=100000, horizon=12, method='normal', periods_of_data=36,
+                 monthly=True, rebalance=True, df=5, block_size=6, batch_size=10000,
+                 processes=None, seed=None, plot=False, figsize=(12,6)):
+        """Simulates future values of the portfolio (with current weights) based
+        on monthly (or daily if monthly is False) returns from the last
+        periods_of_data periods. Method is 'normal', 't' or 'bootstrap' (see
+        analysis.simulation.simulate_portfolio). Horizon is the number of
+        periods of every path. Returns a SimulationResult with VaR, CVaR and
+        drawdown distributions, it's also stored in the simulation attribute"""
+        values = self.panel.monthly_values if monthly else self.panel.values
+        if periods_of_data is not None:
+            values = values[-periods_of_data:]
+        mean = factor = None
+        if method != 'bootstrap':
+            estimate = self.covariance(periods_of_data, monthly)
+            mean, factor = estimate.mean, estimate.cholesky
+        self.simulation = simulate_portfolio(values, self.weights, n_paths, horizon, method,
+                                             df, block_size, rebalance, batch_size,
+                                             processes, seed, mean, factor)
+        if plot:
+            returns = pd.Series(self.simulation.returns)
+            returns.plot.hist(bins=100, figsize=figsize,
+                              title='Simulated returns of {} after {} periods'.format(
+                                  self.name, horizon))
+            plt.axvline(-self.simulation.var(0.95), color='red')
+            plt.show()
+        return self.simulation
 
     def plot_returns(self, window=252, figsize=(12,6)):
         """Plots cumulative return of all stocks in the porflolio for a given time
@@ -480,52 +827,26 @@ class PortfolioOptimizer():
     def plot_portfolio_trailing_risk(self, months_of_data=24, figsize=(12,6)):
         # Merge monthly returns from the given period in one data frame
         data = self.monthly_returns.dropna()
-
-        def portfolio_return(row):
-            return (row*self.weights).sum()
-
-        #return data.rolling(window=1, axis=1).apply(lambda x: f1(x))
-        self.portfolio_returns = pd.DataFrame()
-        self.portfolio_returns['Portfolio return'] = data.apply(lambda x: portfolio_return(x), axis=1)
+        self.portfolio_returns = pd.DataFrame(index=data.index)
+        self.portfolio_returns['Portfolio return'] = data.values @ np.asarray(self.weights)
         self.portfolio_returns['Expected ann return'] = self.portfolio_returns.rolling(months_of_data).mean()*12
         self.portfolio_returns['Rolling std ann'] = self.portfolio_returns['Portfolio return'].rolling(months_of_data).std()*np.sqrt(12)
         t = "Annualized trailing risk (std) of the portfolio, window = {} months".format(months_of_data)
         self.portfolio_returns.plot(title=t, figsize=figsize)
 
 
+    def trailing_risk(self, months_of_data=24):
+        """Returns annualized rolling expected return and standard deviation of
+        the portfolio (with current weights) calculated from monthly returns
+        over windows of months_of_data months"""
+        data = self.monthly_returns.dropna()
+        return rolling_portfolio_risk(data, self.weights, months_of_data).dropna()
+
     def plot_portfolio_trailing_risk2(self, months_of_data=24, figsize=(12,6)):
         """Does almost the same thing as the previous function but using standard approach
         with variance-covariance matrix and matrix calculations. Returns only MA portfolio return
         (expected return) and not actual return as the first method does"""
-        from data.formatting import slice_dataframe
-
-        def create_portfolio(df):
-            """Function calculates mean return and standard deviation of a randomly
-            generated portfolio of given stocks"""
-            e_r = np.asmatrix(np.mean(df.T, axis=1))         # average returns
-            w = np.asmatrix(self.weights)    # randomly generated weights
-            C = np.asmatrix(np.cov(np.array(df).T))           # variance-covariance matrix
-            # calculate the dot product of expected weights and mean returns
-            # expected portfolio return:
-            mu = np.dot(w, e_r.T)
-            # clalculate the standard deviation of the portfolio
-            std = np.sqrt(w * C * w.T)*np.sqrt(12)
-            #return the expected return, standard deviation and transposed vector of weights
-            return (np.asscalar(mu), np.asscalar(std))
-
-        data = self.monthly_returns.dropna()
-        slices = slice_dataframe(data, months_of_data)
-        return_risk_list = []
-        for slc in slices:
-            return_risk_list.append(create_portfolio(slc))
-
-        returns = [item[0] for item in return_risk_list]
-        std = [item[1] for item in return_risk_list]
-        last_index_first_slice = slices[0].iloc[len(slices[0])-1].name
-        self.portfolio_returns = pd.DataFrame(index=data.loc[last_index_first_slice:].index)
-        self.portfolio_returns['Expected ann return'] = returns
-        self.portfolio_returns['Expected ann return'] = self.portfolio_returns['Expected ann return']*12
-        self.portfolio_returns['Rolling std ann'] = std
+        self.portfolio_returns = self.trailing_risk(months_of_data)
         t = "Annualized trailing risk (std) of the portfolio, window = {} months".format(months_of_data)
         self.portfolio_returns.plot(title=t, figsize=figsize)
 
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar cache of price data. Every symbol's price table is kept as two
+memory-mapped numpy files (OHLCV values and dates) that are loaded without
+parsing. SQLite stays the source of truth - cached files are tagged with the
+version of the table (see data.storage.read_price_versions) and are rebuilt
+when the table changes. Cache directory is set by the PORTFOLIO_CACHE_DIR
+environment variable (price_cache next to the database by default)
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from data.storage import DB_DIR, PRICE_COLUMNS, read_price_data_from_db
+from data.storage import read_price_versions
+
+
+CACHE_DIR = os.environ.get('PORTFOLIO_CACHE_DIR', os.path.join(DB_DIR, 'price_cache'))
+
+
+class PriceCache():
+    """Directory of memory-mapped price arrays, one subdirectory per symbol:
+        <path>/<symbol>/<version>.values.npy - float64 (n_days x 5) OHLCV
+        <path>/<symbol>/<version>.dates.npy - datetime64 dates"""
+
+    def __init__(self, path=CACHE_DIR):
+        self.path = path
+
+    def _files(self, symbol, version):
+        base = os.path.join(self.path, symbol, version)
+        return base + '.values.npy', base + '.dates.npy'
+
+    def _remove_other_versions(self, symbol, version):
+        """Removes files of versions other than the given one. Files that are
+        still memory-mapped by live DataFrames can't be removed on Windows -
+        they are left to be removed by a later store or load"""
+        directory = os.path.join(self.path, symbol)
+        for file in os.listdir(directory):
+            if not file.startswith(version + '.'):
+                try:
+                    os.remove(os.path.join(directory, file))
+                except OSError:
+                    pass
+
+    def load(self, symbol, version):
+        """Returns cached price data of a given version or None if it's not in
+        the cache. Values are memory-mapped (read-only) and not copied"""
+        values_file, dates_file = self._files(symbol, version)
+        try:
+            values = np.load(values_file, mmap_mode='r')
+            dates = np.load(dates_file, mmap_mode='r')
+        except FileNotFoundError:
+            return None
+        self._remove_other_versions(symbol, version)
+        index = pd.DatetimeIndex(dates, name='date')
+        return pd.DataFrame(values, index=index, columns=PRICE_COLUMNS, copy=False)
+
+    def store(self, symbol, version, data):
+        """Saves price data in the cache and removes older versions (those
+        which can't be removed yet are removed later)"""
+        directory = os.path.join(self.path, symbol)
+        os.makedirs(directory, exist_ok=True)
+        values_file, dates_file = self._files(symbol, version)
+        values = np.ascontiguousarray(data[PRICE_COLUMNS].to_numpy(dtype=np.float64))
+        dates = data.index.values
+        # write to temporary files first so readers never see half-written data
+        for file, array in ((values_file, values), (dates_file, dates)):
+            with open(file + '.tmp', 'wb') as f:
+                np.save(f, array)
+            os.replace(file + '.tmp', file)
+        self._remove_other_versions(symbol, version)
+
+    def clear(self, symbol):
+        """Removes all cached versions of a symbol"""
+        directory = os.path.join(self.path, symbol)
+        if os.path.isdir(directory):
+            for file in os.listdir(directory):
+                os.remove(os.path.join(directory, file))
+
+
+_cache = PriceCache()
+
+def set_price_cache(cache):
+    """Replaces the shared cache object, e.g. PriceCache(another_path)"""
+    global _cache
+    _cache = cache
+
+def read_price_data(symbol, use_cache=True):
+    """Reads price data of a symbol from the cache or from the database if the
+    cache is missing or out of date (the cache is then refreshed)"""
+    return read_price_data_for_symbols([symbol], use_cache)[symbol]
+
+def read_price_data_for_symbols(symbols, use_cache=True):
+    """Returns a dict {symbol: price data} for many symbols. Versions of all
+    tables are checked with a single query"""
+    if not use_cache:
+        return {symbol: read_price_data_from_db(symbol) for symbol in symbols}
+    versions = read_price_versions(list(symbols))
+    data = {}
+    for symbol in symbols:
+        if symbol not in versions:
+            # table without a version (see data.storage.add_missing_price_versions)
+            # is read without caching, without a table the database raises the
+            # usual error
+            data[symbol] = read_price_data_from_db(symbol)
+            continue
+        df = _cache.load(symbol, versions[symbol])
+        if df is None:
+            df = read_price_data_from_db(symbol)
+            _cache.store(symbol, versions[symbol], df)
+        data[symbol] = df
+    return data
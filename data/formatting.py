@@ -5,6 +5,15 @@ Created on Sun Dec  3 13:25:52 2017
 @author: Daniel
 """
 
+import os
+import re
+from functools import lru_cache
+import pandas as pd
+
+
+STOPWORDS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              'stopwords.txt')
+
 def chng_date(date, simple = False):
     months = {"sty": "01", "lut": "02", "mar": "03", "kwi": "04", "maj": "05", 
           "cze": "06", "lip": "07", "sie": "08", "wrz": "09", "paź": "10",
@@ -33,4 +42,71 @@ def slice_dataframe(df, window):
             i+=1
     return dfs
             
-    
\ No newline at end of file
+    
+def articles_to_frame(article_list, source='bankier'):
+    """Transforms a list of downloaded articles [date, header, content, url]
+    into a DataFrame indexed by date with header, content, url and source
+    columns (the format used to store articles in the database)"""
+    data = pd.DataFrame()
+    data['date'] = pd.to_datetime([article[0] for article in article_list], yearfirst=True)
+    data['header'] = [article[1].strip() for article in article_list]
+    data['content'] = [article[2].strip() for article in article_list]
+    data['url'] = [article[3].strip() for article in article_list]
+    data['source'] = [source for item in article_list]
+    data.set_index('date', inplace = True)
+    return data.sort_index(ascending=False)
+
+@lru_cache(maxsize=None)
+def load_stopwords(path=STOPWORDS_FILE):
+    """Returns a frozenset of Polish stopwords. The file is saved in cp1250,
+    utf-8 is used if it's ever converted"""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    try:
+        text = raw.decode('utf-8')
+    except UnicodeDecodeError:
+        text = raw.decode('cp1250')
+    return frozenset(word.strip().lower() for word in text.split())
+
+_word = re.compile(r'\w+')
+_polish_letters = str.maketrans('ąćęłńóśźżĄĆĘŁŃÓŚŹŻ', 'acelnoszzACELNOSZZ')
+
+def strip_diacritics(text):
+    """Replaces Polish letters with their ASCII equivalents (ą -> a, ł -> l)"""
+    return text.translate(_polish_letters)
+
+@lru_cache(maxsize=None)
+def folded_stopwords(path=STOPWORDS_FILE):
+    """Returns stopwords without diacritics. The stopwords file contains some
+    words in both forms (e.g. 'być' and 'byc') and some only with Polish
+    letters, after folding they are all matched the same way"""
+    return frozenset(strip_diacritics(word) for word in load_stopwords(path))
+
+def tokenize(text, stopwords=True, fold=False):
+    """Splits text into lowercase words (letters and digits) and removes
+    stopwords if stopwords is True (or a given set of stopwords). If fold is
+    True Polish letters are replaced with ASCII ones"""
+    text = text.lower()
+    if fold:
+        text = strip_diacritics(text)
+    words = _word.findall(text)
+    if stopwords is True:
+        stopwords = folded_stopwords() if fold else load_stopwords()
+    if stopwords:
+        words = [word for word in words if word not in stopwords]
+    return words
+
+# the most common endings of declined Polish nouns and adjectives (longest first)
+_endings = ('owie', 'ami', 'ach', 'ego', 'emu', 'ych', 'ymi', 'imi', 'owa', 'ową', 'owe',
+            'owy', 'owi', 'om', 'ów', 'em', 'ie', 'ej', 'ym', 'im', 'ą', 'ę', 'y', 'i', 'a',
+            'e', 'u', 'o')
+
+def light_stem(word, min_length=4):
+    """Removes the longest common Polish inflectional ending of a lowercase
+    word if at least min_length letters are left
+    (dywidenda, dywidendy, dywidendę -> dywidend). It's not a real stemmer -
+    alternations like spółka -> spółce are not handled"""
+    for ending in _endings:
+        if word.endswith(ending) and len(word) - len(ending) >= min_length:
+            return word[:-len(ending)]
+    return word
@@ -8,11 +8,21 @@ Created on Fri Dec  1 22:55:53 2017
 Functions created to gather financial data
 """
 
-import requests
+import io
+from contextlib import nullcontext
 from bs4 import BeautifulSoup
 import pandas as pd
 from datetime import datetime
 from data.formatting import chng_date
+from data import web
+from data.parsing import parse_stooq_table, parse_stooq_quote_tables
+from data.parsing import parse_bankier_last_news_page, parse_bankier_article_links
+from data.parsing import parse_bankier_article
+
+# number of seconds symbol lists are served from the http cache without
+# asking the server again. Article list pages change with every new article,
+# so they are cached but always revalidated (ETag/Last-Modified)
+SYMBOL_LIST_MAX_AGE = 3600
 
 # price/fin_data functions:
 
@@ -31,18 +41,11 @@ def download_stooq_symbols(n_pages = 10):
         # download page's content
         url = "https://stooq.pl/t/?i=513&v=0&l={}".format(page)
         # send an http request
-        req = requests.get(url)
-        # format the response usnign BS
-        soup = BeautifulSoup(req.content, "lxml")
-        # extract table that contains ticker codes
-        price_table = soup.find("table", {"class": "fth1"})
-        table_body = price_table.find('tbody')
-        # extract rows from the table
-        rows = table_body.find_all('tr')
+        req = web.get(url, cache=True, max_age=SYMBOL_LIST_MAX_AGE)
+        # extract rows from the table that contains ticker codes
+        rows = parse_stooq_table(req.content)
         # for each row extract the ticker name
-        for row in rows:
-            cols = row.find_all('td')
-            cols = [ele.text.strip() for ele in cols]
+        for cols in rows:
             symbol_list.append([ele for ele in cols if ele][:2])
     # add index symbols to the list
     symbol_list.append(['WIG', 'WIG'])
@@ -57,7 +60,7 @@ def download_bankier_symbols(index=''):
     # download page's content
     url = "http://www.bankier.pl/gielda/notowania/akcje?index={}".format(index)
     # send an http request
-    req = requests.get(url)
+    req = web.get(url, cache=True, max_age=SYMBOL_LIST_MAX_AGE)
     # format the response usnign BS
     soup = BeautifulSoup(req.content, "lxml")
     # extract te symbols from table
@@ -84,7 +87,7 @@ def download_historical_prices(symbol):
         # download page's content
         url = 'http://stooq.pl/q/d/l/?s={}&i=d'.format(symbol)
         # load prices from downloaded CSV file using pandas
-        px_series = pd.read_csv(url)
+        px_series = pd.read_csv(io.BytesIO(web.get(url).content))
         if len(px_series.columns) == 6:
             # setup column names
             px_series.columns = ["date", "open", "high", "low", "close", "volume"]
@@ -96,7 +99,7 @@ def download_historical_prices(symbol):
             return px_series
         else:
             return []
-    except (pd.io.common.EmptyDataError, ConnectionAbortedError):
+    except (pd.errors.EmptyDataError, ConnectionAbortedError):
         return []
 
 def download_historical_fin_data(symbol, period ='ann'):
@@ -116,7 +119,7 @@ def download_historical_fin_data(symbol, period ='ann'):
         # create an url to the first page of fin data of given company
         url = "http://www.bankier.pl/gielda/notowania/akcje/{}/wyniki-finansowe/skonsolidowany/{}/standardowy/1".format(symbol, period_dict[period])
         # send an http request
-        req = requests.get(url)
+        req = web.get(url)
         # format the response usnign BS
         soup = BeautifulSoup(req.content, "lxml")
         # find all page numbers
@@ -150,7 +153,7 @@ def download_historical_fin_data(symbol, period ='ann'):
         # create an url that points to the fin data
         url = "http://www.bankier.pl/gielda/notowania/akcje/{}/wyniki-finansowe/skonsolidowany/{}/standardowy/{}".format(symbol,period_dict[period], site)
         # send an http request    
-        req = requests.get(url)
+        req = web.get(url)
         # format the response usnign BS
         soup = BeautifulSoup(req.content, "lxml")
         # find the table that contains fin data        
@@ -207,27 +210,11 @@ def download_last_40_prices(symbol):
     ## create request url
     url = "https://stooq.pl/q/d/?s={}".format(symbol)
     # send http request
-    req = requests.get(url)
-    # format the response usnign BS
-    soup = BeautifulSoup(req.content, "lxml")
-    # find the rable that contains price data
-    price_table = soup.find("table", {"class": "fth1"})
-    # find table body
-    try:
-        table_body = price_table.find('tbody')
-    except AttributeError:
+    req = web.get(url)
+    # extract rows (lists of cell texts) of the table that contains price data
+    data = parse_stooq_table(req.content)
+    if data is None:
         return None
-    # find all rows in table
-    rows = table_body.find_all('tr')
-    # create empty list to store data    
-    data = []
-    for row in rows:
-        # find all elements (columns) in a row
-        cols = row.find_all('td')
-        # create a list of found elements
-        cols = [element.text.strip() for element in cols]
-        # append a row (vector) of data to data list
-        data.append([element for element in cols])
     # create an empty list for formatted data
     formatted_data = []
     for row in data:
@@ -268,43 +255,10 @@ def download_last_price(symbol):
     # create request url
     url = "https://stooq.pl/q/g/?s={}".format(symbol)
     # send http request
-    req = requests.get(url)
-    # format the response usnign BS
-    soup = BeautifulSoup(req.content, "lxml")
-    # find all tables in on the website
-    site_tables = soup.find_all("table")
-    # create a list of tables
-    all_tables = []
-    for item in site_tables:
-        all_tables.append(item)
-    # find table with price data
-    for n, table in enumerate(all_tables):
-        # if table starts with "Kurs" it contains the price data
-        if table.text.startswith("Kurs"):
-            pos = n
-            break
+    req = web.get(url)
     try:
-        # select first and second tabel with price data
-        data_tables = [all_tables[pos], all_tables[pos+1]]
-        # create an empty list to store data from tables
-        all_table_content = []
-        # for each table of the two
-        for table in data_tables:
-            # find table body
-            table_body = table.find('tbody')
-            # find all rows in the table body
-            rows = table_body.find_all('tr')
-            # create an ampty list for data from tables
-            data = []
-            # for each row in row list
-            for row in rows:
-                # find row columns
-                cols = row.find_all('td')
-                # create a list of all elements of a row
-                cols = [element.text.strip() for element in cols]
-                data.append([element for element in cols])
-            # add to all content
-            all_table_content.append(data)
+        # extract rows of the two tables with price data
+        all_table_content = parse_stooq_quote_tables(req.content)
         # extract days and month - a list of two elements
         date = all_table_content[0][1][1].split(",")[0].split()
         # add current year as third element
@@ -344,106 +298,85 @@ def download_last_price(symbol):
 
 # article functions:
 
-def find_last_news_page_bankier(symbol):
+def _limited_get(url, limiter=None, **kwargs):
+    """Sends a request with the shared client, within the limit of parallel
+    requests to the host if a limiter is given (see data.pipeline.HostLimiter)"""
+    with limiter(url) if limiter is not None else nullcontext():
+        return web.get(url, **kwargs)
+
+def find_last_news_page_bankier(symbol, limiter=None):
     """Returns last page of bankier's article news list"""
     url = "https://www.bankier.pl/gielda/notowania/akcje/{}/wiadomosci/1".format(symbol)
-    req = requests.get(url)
-    soup = BeautifulSoup(req.content, "lxml")
-    # search for class that contains page numbers after the separator
-    pages = soup.find_all("a", {"class": "numeral btn"})
-    # if nothing found it means there is no separator (less than 6 pages) and
-    # antoher class (with a space at the end) has to be used
-    if len(pages) == 0:
-        pages = soup.find_all("a", {"class": "numeral btn "})
-        # if nothing found again it means there's only one page
-        if len(pages) == 0:
-            return 1
-        else:
-            # if there are some matches return the last page found
-            return int(pages[-1].text)
-    # there is a page list separator return the last match
-    else:
-        return int(pages[-1].text)
+    req = _limited_get(url, limiter, cache=True)
+    return parse_bankier_last_news_page(req.content)
     
 def download_bankier_article(url):
-    req = requests.get(url)
-    soup = BeautifulSoup(req.content, "lxml")
-    # search for article content
-    article_content_raw = soup.find_all("div", {"id": "articleContent"})[0]
-    # find all paragraphs in the article body
-    article_paragraphs = article_content_raw.find_all('p')
-    # empty list to store found paragraphs
-    paragraphs_list = []
-    for item in article_paragraphs:
-        paragraphs_list.append(item.getText())
-    # transform list of paragrapsh into one string
-    article = " ".join(paragraphs_list).strip()
-    # remove all newlines and unnecessary spaces, leave plain text with single
-    # spaces
-    article_formatted = " ".join(article.split())
-    # find articles header
-    article_header_raw = soup.find_all("h1", {"class": "entry-title"})[0]
-    # extract header text
-    article_header = article_header_raw.text
-    # find entry date of the article
-    entry_date_raw = soup.find_all("time", {"class": "entry-date"})
-    entry_date = entry_date_raw[0].getText()
-    # return a list of entry date, article content and url
-    return [entry_date, article_header, article_formatted, url]
+    """Downloads an article from bankier.pl and returns a list of its entry
+    date, header, content and url"""
+    req = web.get(url)
+    # return a list of entry date, article header, content and url
+    return parse_bankier_article(req.content) + [url]
 
-def download_bankier_article_urls(symbol, n_pages='all'):
-    """Downloads urls urls of all available articles related to a given stock"""
+def iter_bankier_article_pages(symbol, n_pages='all', known_urls=None, resume_page=None,
+                               limiter=None):
+    """Yields (page number, urls of articles that are not known) of pages of
+    bankier's news list of a stock. Pages are sorted from the newest articles
+    so paging stops at the first page that contains any of known_urls (older
+    articles have been downloaded before) unless resume_page is given - then
+    listing jumps to resume_page (the deepest page read by a previous,
+    interrupted sync) and continues to the last page. Requests are limited by
+    the limiter if it's given"""
     if n_pages == "all":
         # determine how many pages of articles are available for the given symbol
-        n_pages = find_last_news_page_bankier(symbol)
-    # create an empty set to store article links
-    article_links = set()
-    # downloand article links from every page
-    for page in range(1,n_pages+1):
+        n_pages = find_last_news_page_bankier(symbol, limiter)
+    if known_urls is None:
+        known_urls = set()
+    page = 1
+    while page <= n_pages:
         # create request url
         url = "https://www.bankier.pl/gielda/notowania/akcje/{}/wiadomosci/{}".format(symbol,page)
         # send http request
-        req = requests.get(url)
-        # format the response usnign BS
-        soup = BeautifulSoup(req.content, "lxml")
-        # create a list of articles/links
-        article_list = soup.find_all("span", {"class": "entry-title"})
-        for item in article_list:
-            try:
-                for link in item.find_all('a'):
-                    # append article link to the set
-                   article_links.add('https://www.bankier.pl{}'.format(str(link.get("href"))))
-            except:
+        req = _limited_get(url, limiter, cache=True)
+        links = ['https://www.bankier.pl{}'.format(link)
+                 for link in parse_bankier_article_links(req.content)]
+        yield page, [link for link in links if link not in known_urls]
+        if any(link in known_urls for link in links):
+            if resume_page is None:
+                return
+            if page < resume_page:
+                page = resume_page
                 continue
-    # transform links set to a list
+        page += 1
+
+def download_bankier_article_urls(symbol, n_pages='all', known_urls=None, limiter=None):
+    """Downloads urls urls of all available articles related to a given stock.
+    If a set of known_urls is given, paging stops at the first page that
+    contains any of them and only urls that are not known are returned (see
+    iter_bankier_article_pages)"""
+    # create an empty dict to store article links (ordered from the newest)
+    article_links = {}
+    for _, links in iter_bankier_article_pages(symbol, n_pages, known_urls, limiter=limiter):
+        article_links.update(dict.fromkeys(links))
+    # transform links to a list
     return list(article_links)
 
 
-def download_bankier_articles(symbol, n_pages='all'):
+def download_bankier_articles(symbol, n_pages='all', workers=8):
     """For a given symbol downloads available articles related to company with
-    a timestamp.
+    a timestamp. Articles are downloaded by a pool of workers threads (see
+    data.pipeline.harvest_bankier_articles)
     
     Params:
         n_pages: int or str: "all"
     """
-    article_links = download_bankier_article_urls(symbol, n_pages)
-    # create an empty list to store article's content
-    articles = []
-    n = 0 # counter
-    for link in article_links:
-        # download article and add it to the list
-        try:
-            articles.append(download_bankier_article(link))
-            # increment number of downloaded and display progress
-            n += 1
-            print(n, "of", len(article_links), "downloaded")
-        except:
-            print("Error with {}".format(link))
-            continue
-    # filter out articles withour any content
-    articles_filtered = [article for article in articles if article[1] != ""]
+    from data.pipeline import harvest_bankier_articles
+    results, report = harvest_bankier_articles([symbol], n_pages=n_pages, workers=workers,
+                                               save=False)
+    print(report.downloaded[symbol], "of", report.listed[symbol], "downloaded")
+    if report.errors:
+        print(report)
     # return list of downloaded articles
-    return articles_filtered
+    return results[symbol]
 
 # forum functions
     
@@ -457,7 +390,7 @@ def download_stockwatch_forum_symbols(n_pages = 15):
         # create url
         url = 'https://www.stockwatch.pl/forum/tematy-8p{}_Spolki-od-A-do-Z--GPW.aspx'.format(page)
         # send http request
-        req = requests.get(url)
+        req = web.get(url)
         # format the response usnign BS
         soup = BeautifulSoup(req.content, "lxml")
         # search for table that contains forum's content
@@ -530,7 +463,7 @@ def download_stooq_forum_posts(stock, thread_num=-1, page_range='all'):
         url = 'https://www.stockwatch.pl/forum/wpisy-{}p{}_{}.aspx'.format(thread_num,
                                                      page, stock)
         # send http request
-        req = requests.get(url)
+        req = web.get(url)
         # format the response usnign BS
         soup = BeautifulSoup(req.content, "lxml")
         # find posts content
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Resumable jobs that download data in bulk. Progress is stored in the
+database so a job can be continued from a new process, e.g. after the daily
+stooq download limit is reached:
+
+    python -m data.jobs --workers 4
+"""
+
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+import pandas as pd
+from data.gathering import download_historical_prices, download_stooq_symbols
+from data.storage import get_storage, save_price_data_to_db
+
+
+# errors after which a download is tried again in the next run
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError)
+
+
+class HistoryDownloadJob():
+    """Downloads all historical prices of given symbols (all stooq symbols by
+    default) and rebuilds their price tables. Status of every symbol is kept
+    in the download_checkpoint table:
+        'done' - prices downloaded and saved
+        'failed' - transient (network) error, retried in next runs until
+                   max_attempts failures in a row
+        'error' - any other error, e.g. unexpected data (retried only with
+                  retry_failed)
+        'rate_limited' - empty response, most likely the daily limit
+    The attempts column counts attempts in a row that ended with the same
+    status. Symbols that are done are skipped when the job is run again"""
+
+    table = 'download_checkpoint'
+
+    def __init__(self, symbols=None, workers=4, retry_failed=False, max_attempts=3):
+        self.symbols = symbols
+        self.workers = workers
+        self.retry_failed = retry_failed
+        self.max_attempts = max_attempts
+        self.storage = get_storage('price_data')
+        with self.storage.transaction() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS {} ("symbol" TEXT PRIMARY KEY, '
+                         '"status" TEXT, "attempts" INTEGER, "last_attempt" TIMESTAMP, '
+                         '"rows" INTEGER, "error" TEXT)'.format(self.table))
+
+    def checkpoint(self):
+        """Returns the checkpoint table as a DataFrame indexed by symbol"""
+        return self.storage.read_sql('SELECT * FROM {}'.format(self.table),
+                                     index_col='symbol')
+
+    def reset(self):
+        """Removes all progress so the next run downloads everything again"""
+        with self.storage.transaction() as conn:
+            conn.execute('DELETE FROM {}'.format(self.table))
+
+    def _skipped(self):
+        """Returns a set of symbols that should not be downloaded again: done
+        ones, ones with errors and ones that failed max_attempts times (only
+        done ones with retry_failed)"""
+        if self.retry_failed:
+            query = 'SELECT "symbol" FROM {} WHERE "status"=\'done\''
+        else:
+            query = ('SELECT "symbol" FROM {} WHERE "status" IN (\'done\', \'error\') '
+                     'OR ("status"=\'failed\' AND "attempts">=?)')
+        cur = self.storage.connection.execute(
+            query.format(self.table), () if self.retry_failed else (self.max_attempts,))
+        return {row[0] for row in cur}
+
+    def _mark(self, conn, symbol, status, rows=0, error=None):
+        conn.execute('INSERT INTO {} VALUES (?, ?, 1, ?, ?, ?) ON CONFLICT("symbol") DO UPDATE '
+                     'SET "status"=excluded."status", '
+                     '"attempts"=CASE WHEN "status"=excluded."status" THEN "attempts"+1 ELSE 1 END, '
+                     '"last_attempt"=excluded."last_attempt", "rows"=excluded."rows", '
+                     '"error"=excluded."error"'.format(self.table),
+                     (symbol, status, pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S'),
+                      rows, error))
+
+    def run(self):
+        """Downloads prices of all symbols that are not done yet. Downloads run
+        in a pool of threads, prices and checkpoints are saved together in one
+        transaction per symbol by the calling thread. The job stops submitting
+        new downloads when the download limit is reached. Returns a list of
+        symbols downloaded in this run"""
+        if self.symbols is None:
+            self.symbols = [symbol[0] for symbol in download_stooq_symbols()]
+        skipped = self._skipped()
+        queue = deque(symbol for symbol in self.symbols if symbol not in skipped)
+        print("{} symbols to download, {} skipped".format(len(queue), len(self.symbols) - len(queue)))
+        downloaded = []
+        limit = False
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            running = {}
+            while queue or running:
+                while queue and not limit and len(running) < self.workers:
+                    symbol = queue.popleft()
+                    running[pool.submit(download_historical_prices, symbol)] = symbol
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    symbol = running.pop(future)
+                    with self.storage.transaction() as conn:
+                        try:
+                            data = future.result()
+                        except Exception as e:
+                            status = 'failed' if isinstance(e, TRANSIENT_ERRORS) else 'error'
+                            self._mark(conn, symbol, status, error=repr(e))
+                            print("Error with {}: {}".format(symbol, e))
+                            continue
+                        # check if response contains any data
+                        if len(data) > 0:
+                            save_price_data_to_db(symbol, data, silent=True, mode='rebuild')
+                            self._mark(conn, symbol, 'done', len(data))
+                            print("Downloaded {}".format(symbol))
+                            downloaded.append(symbol)
+                        else:
+                            self._mark(conn, symbol, 'rate_limited')
+                            limit = True
+        if limit:
+            print("Limit reached, change IP and run again")
+        return downloaded
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Download historical prices of all stocks "
+                                                 "from stooq.pl, continuing the previous run")
+    parser.add_argument('--workers', type=int, default=4, help="number of parallel downloads")
+    parser.add_argument('--symbols', nargs='+', help="symbols to download (all by default)")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="download failed symbols again (also after errors and "
+                             "max attempts)")
+    parser.add_argument('--max-attempts', type=int, default=3,
+                        help="number of transient failures in a row after which a "
+                             "symbol is skipped")
+    parser.add_argument('--reset', action='store_true', help="forget progress of previous runs")
+    parser.add_argument('--status', action='store_true', help="only print the checkpoint summary")
+    args = parser.parse_args(args)
+    job = HistoryDownloadJob(args.symbols, args.workers, args.retry_failed, args.max_attempts)
+    if args.reset:
+        job.reset()
+    if not args.status:
+        job.run()
+    print(job.checkpoint()['status'].value_counts().to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Functions that extract data from stooq.pl and bankier.pl pages. Each of them
+reads only the elements it needs with lxml XPath queries and falls back to
+BeautifulSoup when lxml is not installed (or when set_parser('bs4') is used).
+Both backends return the same plain python structures
+"""
+
+from bs4 import BeautifulSoup, UnicodeDammit
+try:
+    import lxml.html
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'bs4'
+
+
+def set_parser(parser):
+    """Selects the parsing backend: 'lxml' or 'bs4'"""
+    global PARSER
+    if parser not in ('lxml', 'bs4'):
+        raise ValueError("Unknown parser: {}".format(parser))
+    PARSER = parser
+
+def _document(content):
+    """Parses a page with lxml. Bytes are decoded first (utf-8 or the encoding
+    detected the same way as BeautifulSoup does) because lxml assumes latin-1
+    when a page doesn't declare its encoding"""
+    if isinstance(content, bytes):
+        try:
+            content = content.decode('utf-8')
+        except UnicodeDecodeError:
+            content = UnicodeDammit(content, is_html=True).unicode_markup
+    return lxml.html.fromstring(content)
+
+def _has_class(name):
+    """XPath condition equivalent of BeautifulSoup's {"class": name} for a
+    single class name"""
+    return "contains(concat(' ', normalize-space(@class), ' '), ' {} ')".format(name)
+
+def _rows_lxml(table):
+    """Returns texts of all cells of all rows in the first tbody of a table"""
+    bodies = table.xpath('.//tbody')
+    if not bodies:
+        return None
+    return [[td.text_content().strip() for td in tr.iter('td')]
+            for tr in bodies[0].iter('tr')]
+
+def _rows_bs4(table):
+    table_body = table.find('tbody')
+    if table_body is None:
+        return None
+    return [[td.text.strip() for td in tr.find_all('td')]
+            for tr in table_body.find_all('tr')]
+
+def parse_stooq_table(content):
+    """Returns rows (lists of cell texts) of stooq's main data table (class
+    'fth1') used on symbol list and price history pages. Returns None if the
+    page doesn't contain the table"""
+    if PARSER == 'lxml':
+        tables = _document(content).xpath(
+            '//table[{}]'.format(_has_class('fth1')))
+        return _rows_lxml(tables[0]) if tables else None
+    price_table = BeautifulSoup(content, "lxml").find("table", {"class": "fth1"})
+    return _rows_bs4(price_table) if price_table is not None else None
+
+def parse_stooq_quote_tables(content):
+    """Returns rows of the two tables with the last session's quote (the first
+    one starts with 'Kurs') from stooq's quote page or None if not found"""
+    if PARSER == 'lxml':
+        tables = _document(content).xpath('//table')
+        text = lambda table: table.text_content()
+        rows = _rows_lxml
+    else:
+        tables = BeautifulSoup(content, "lxml").find_all("table")
+        text = lambda table: table.text
+        rows = _rows_bs4
+    for n, table in enumerate(tables[:-1]):
+        # if table starts with "Kurs" it contains the price data
+        if text(table).startswith("Kurs"):
+            return [rows(tables[n]), rows(tables[n+1])]
+    return None
+
+def parse_bankier_last_news_page(content):
+    """Returns the number of the last page of bankier's news list"""
+    if PARSER == 'lxml':
+        doc = _document(content)
+        find = lambda cls: [a.text_content() for a in doc.xpath('//a[@class="{}"]'.format(cls))]
+    else:
+        soup = BeautifulSoup(content, "lxml")
+        find = lambda cls: [a.text for a in soup.find_all("a", {"class": cls})]
+    # page numbers after the separator, if there is no separator (less than 6
+    # pages) another class (with a space at the end) is used
+    pages = find("numeral btn") or find("numeral btn ")
+    # if nothing found it means there's only one page
+    return int(pages[-1]) if pages else 1
+
+def parse_bankier_article_links(content):
+    """Returns hrefs of article links from a page of bankier's news list"""
+    if PARSER == 'lxml':
+        return _document(content).xpath(
+            '//span[{}]//a/@href'.format(_has_class('entry-title')))
+    soup = BeautifulSoup(content, "lxml")
+    return [link.get("href") for item in soup.find_all("span", {"class": "entry-title"})
+            for link in item.find_all('a') if link.get("href") is not None]
+
+def parse_bankier_article(content):
+    """Returns [entry date, header, content] of a bankier's article. Raises
+    IndexError if the page is not an article"""
+    if PARSER == 'lxml':
+        doc = _document(content)
+        body = doc.xpath('//div[@id="articleContent"]')[0]
+        paragraphs = [p.text_content() for p in body.iter('p')]
+        header = doc.xpath('//h1[{}]'.format(_has_class('entry-title')))[0].text_content()
+        entry_date = doc.xpath('//time[{}]'.format(_has_class('entry-date')))[0].text_content()
+    else:
+        soup = BeautifulSoup(content, "lxml")
+        body = soup.find_all("div", {"id": "articleContent"})[0]
+        paragraphs = [p.getText() for p in body.find_all('p')]
+        header = soup.find_all("h1", {"class": "entry-title"})[0].text
+        entry_date = soup.find_all("time", {"class": "entry-date"})[0].getText()
+    # remove all newlines and unnecessary spaces, leave plain text with single
+    # spaces
+    article = " ".join(" ".join(paragraphs).split())
+    return [entry_date, header, article]
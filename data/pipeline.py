@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent pipeline that harvests articles from bankier.pl:
+    list article urls of every symbol -> fetch pages -> parse -> save in
+    batches
+Listing, fetching and parsing run in a pool of threads with a limit of
+parallel requests per host (for both list pages and articles). Saving is done by the calling thread only.
+Errors don't stop the pipeline - they are counted in a HarvestReport.
+
+When articles are saved, progress of listing (the deepest news list page
+read and whether the last page was reached) and urls of articles that
+failed to download are stored in the database. The next harvest continues
+listing of symbols whose history is incomplete from the stored page and
+downloads failed articles again (up to max_attempts times), so articles
+missed by an interrupted run are not lost
+"""
+
+import threading
+from collections import Counter
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import pandas as pd
+from data import web
+from data.gathering import iter_bankier_article_pages
+from data.parsing import parse_bankier_article
+from data.formatting import articles_to_frame
+from data.storage import get_storage, insert_articles_to_db, read_article_sync
+from data.storage import save_article_sync, read_failed_article_urls, save_article_failures
+
+
+class HarvestReport():
+    """Counts of listed, downloaded and saved articles and of errors in every
+    stage of the pipeline ('list', 'fetch', 'parse', 'save')"""
+
+    def __init__(self):
+        self.listed = Counter()
+        self.downloaded = Counter()
+        self.saved = Counter()
+        self.errors = []
+
+    def add_error(self, stage, symbol, url, error):
+        self.errors.append((stage, symbol, url, type(error).__name__, str(error)))
+
+    def error_frame(self):
+        """Returns a DataFrame with all errors"""
+        return pd.DataFrame(self.errors, columns=['stage', 'symbol', 'url', 'error', 'message'])
+
+    def summary(self):
+        """Returns a DataFrame with numbers of articles and errors per symbol"""
+        summ = pd.DataFrame({'listed': pd.Series(self.listed, dtype=int),
+                             'downloaded': pd.Series(self.downloaded, dtype=int),
+                             'saved': pd.Series(self.saved, dtype=int)})
+        errors = self.error_frame()
+        if len(errors):
+            summ = summ.join(errors.groupby('symbol').size().rename('errors'), how='outer')
+        return summ.fillna(0).astype(int)
+
+    def __str__(self):
+        errors = Counter((e[0], e[3]) for e in self.errors)
+        text = "{} articles listed, {} downloaded, {} saved, {} errors".format(
+            sum(self.listed.values()), sum(self.downloaded.values()),
+            sum(self.saved.values()), len(self.errors))
+        for (stage, error), n in errors.most_common():
+            text += "\n  {} - {}: {}".format(stage, error, n)
+        return text
+
+
+class HostLimiter():
+    """Limits the number of parallel requests to every host"""
+
+    def __init__(self, per_host):
+        self.per_host = per_host
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host)
+            return self._semaphores[host]
+
+
+def fetch_bankier_article(url, limiter):
+    """Downloads and parses an article. Returns [date, header, content, url]
+    or raises an exception with a 'stage' attribute ('fetch' or 'parse')"""
+    try:
+        with limiter(url):
+            req = web.get(url)
+        req.raise_for_status()
+    except Exception as e:
+        e.stage = 'fetch'
+        raise
+    try:
+        return parse_bankier_article(req.content) + [url]
+    except Exception as e:
+        e.stage = 'parse'
+        raise
+
+def list_bankier_articles(symbol, n_pages, known_urls, progress, limiter):
+    """Lists urls of articles of a symbol that are not known. progress is
+    (page, complete) of previous syncs (None if the symbol was never synced)
+    - if its history is not complete listing continues from the stored page
+    to the last one. Returns the urls (from the newest), new progress and the
+    exception that stopped listing (None if there was none)"""
+    page, complete = progress if progress is not None else (0, False)
+    urls = {}
+    error = None
+    try:
+        for n, links in iter_bankier_article_pages(symbol, n_pages, known_urls,
+                                                   None if complete else max(page, 1), limiter):
+            urls.update(dict.fromkeys(links))
+            # all pages before the deepest one have been read
+            if n <= page + 1:
+                page = max(page, n)
+    except Exception as e:
+        error = e
+    else:
+        # without a complete history listing ends only at the last page
+        complete = complete or n_pages == 'all'
+    return list(urls), (page, complete), error
+
+def harvest_bankier_articles(symbols, known_urls=None, n_pages='all', workers=8,
+                             per_host=4, batch_size=200, save=True, report=None,
+                             max_attempts=3):
+    """Downloads articles of many symbols concurrently.
+
+    Params:
+        known_urls: dict {symbol: set of urls}
+            urls that are already downloaded and are skipped
+        per_host: int
+            maximum number of parallel requests to one host
+        batch_size: int
+            number of articles saved in the database in one transaction
+        save: bool
+            if True articles are inserted into articles_<symbol> tables
+            (urls already stored are ignored) and progress of listing and
+            failed urls are stored, if False articles are only returned
+        max_attempts: int
+            number of failed downloads after which an article is not
+            downloaded again
+    Returns a dict {symbol: list of articles} (empty lists if save is True)
+    and the HarvestReport"""
+    if known_urls is None:
+        known_urls = {}
+    if report is None:
+        report = HarvestReport()
+    limiter = HostLimiter(per_host)
+    results = {symbol: [] for symbol in symbols}
+    pending = {symbol: [] for symbol in symbols}
+    failures = []
+    resolved = []
+    storage = get_storage('articles')
+    progress = read_article_sync(symbols) if save else {}
+    retried = read_failed_article_urls(symbols, max_attempts) if save else {}
+    given_up = read_failed_article_urls(symbols, max_attempts, True) if save else {}
+
+    def flush(listed=None):
+        """Saves all pending articles, failures and progress of listing in
+        one transaction"""
+        saved = {}
+        with storage.transaction():
+            for symbol, articles in pending.items():
+                if articles:
+                    saved[symbol] = insert_articles_to_db(articles_to_frame(articles), symbol)
+            save_article_failures(failures, resolved)
+            if listed:
+                save_article_sync(listed)
+        for symbol, n in saved.items():
+            report.saved[symbol] += n
+            pending[symbol].clear()
+        del failures[:], resolved[:]
+
+    # urls that failed in previous runs are downloaded again
+    queued = {symbol: set(retried.get(symbol, ())) - set(known_urls.get(symbol, ()))
+              for symbol in symbols}
+    queue = [(symbol, url) for symbol in symbols for url in queued[symbol]]
+    # and urls that failed max_attempts times are never downloaded
+    for symbol, urls in given_up.items():
+        queued[symbol].update(urls)
+    listed = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # producer stage - list article urls of every symbol
+        # (paging stops at the first page with an already known url unless
+        # the history of the symbol is not complete yet)
+        running = {pool.submit(list_bankier_articles, symbol, n_pages, known_urls.get(symbol),
+                               progress.get(symbol), limiter): ('list', symbol, None)
+                   for symbol in symbols}
+        while running or queue:
+            # keep a bounded number of articles in flight
+            while queue and len(running) < 4 * workers:
+                symbol, url = queue.pop()
+                running[pool.submit(fetch_bankier_article, url, limiter)] = ('fetch', symbol, url)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, symbol, url = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    stage = getattr(e, 'stage', stage)
+                    report.add_error(stage, symbol, url, e)
+                    failures.append((symbol, url, stage, repr(e)))
+                    continue
+                if stage == 'list':
+                    urls, listed[symbol], error = result
+                    if error is not None:
+                        report.add_error('list', symbol, None, error)
+                    urls = [u for u in urls if u not in queued[symbol]]
+                    queued[symbol].update(urls)
+                    report.listed[symbol] += len(urls)
+                    queue += [(symbol, u) for u in urls]
+                    continue
+                resolved.append(url)
+                # filter out articles without any content
+                if result[1] != "":
+                    report.downloaded[symbol] += 1
+                    if save:
+                        pending[symbol].append(result)
+                    else:
+                        results[symbol].append(result)
+            if save and sum(len(a) for a in pending.values()) >= batch_size:
+                flush()
+    if save:
+        flush(listed)
+    return results, report
@@ -3,47 +3,608 @@
 Created on Sat Jan 27 23:16:27 2018
 
 @author: Daniel
+
+Functions that store and read price data, financial data and articles. All
+of them share one SQLiteStorage object per database file (see get_storage).
+Database files are kept in the directory set by the PORTFOLIO_DB_DIR
+environment variable or in the project directory by default
 """
 
+import os
+import uuid
 import sqlite3
+import threading
+from contextlib import contextmanager
 import pandas as pd
+from data.formatting import tokenize, light_stem
+
+
+DB_DIR = os.environ.get('PORTFOLIO_DB_DIR',
+                        os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class SQLiteStorage():
+    """Storage backend for a single sqlite database file. Every thread gets
+    its own connection which is created once and then reused, so bulk jobs
+    don't pay the connect cost for every symbol. Writes should be done inside
+    the transaction context manager - nested transactions are merged into the
+    outermost one, which allows batching many writes into one commit:
+
+        with storage.transaction():
+            for symbol, data in prices:
+                save_price_data_to_db(symbol, data)
+    """
+
+    def __init__(self, path, mmap_size=256*1024**2, timeout=30):
+        self.path = path
+        self.mmap_size = mmap_size
+        self.timeout = timeout
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "SQLiteStorage('{}')".format(self.path)
+
+    def _connect(self):
+        # autocommit mode, transactions are started explicitly in transaction()
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA mmap_size={}'.format(int(self.mmap_size)))
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    @property
+    def connection(self):
+        """Connection of the current thread"""
+        if self._pid != os.getpid():
+            # forked process (e.g. multiprocessing) - connections of the parent
+            # process can't be used
+            self._reset()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Context manager that commits all writes done inside it at once or
+        rolls them back if an exception is raised"""
+        conn = self.connection
+        depth = self._local.depth
+        if depth == 0:
+            conn.execute('BEGIN')
+        self._local.depth = depth + 1
+        try:
+            yield conn
+        except BaseException:
+            if depth == 0:
+                conn.execute('ROLLBACK')
+            raise
+        else:
+            if depth == 0:
+                conn.execute('COMMIT')
+        finally:
+            self._local.depth = depth
+
+    def table_exists(self, table):
+        cur = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,))
+        return cur.fetchone() is not None
+
+    def read_sql(self, query, params=None, **kwargs):
+        """Runs pandas.read_sql_query on the connection of the current thread"""
+        return pd.read_sql_query(query, self.connection, params=params, **kwargs)
 
+    def write_frame(self, table, df, index_label, if_exists='replace'):
+        """Writes a DataFrame (with its index) into a table. Works like
+        DataFrame.to_sql but doesn't commit by itself so it can be a part of
+        a bigger transaction"""
+        columns = [index_label] + [str(col) for col in df.columns]
+        types = [_sql_type(df.index)] + [_sql_type(df[col]) for col in df.columns]
+        with self.transaction() as conn:
+            if if_exists == 'replace':
+                conn.execute('DROP TABLE IF EXISTS "{}"'.format(table))
+            conn.execute('CREATE TABLE IF NOT EXISTS "{}" ({})'.format(
+                table, ", ".join('"{}" {}'.format(c, t) for c, t in zip(columns, types))))
+            conn.execute('CREATE INDEX IF NOT EXISTS "ix_{0}_{1}" ON "{0}" ("{1}")'
+                         .format(table, index_label))
+            conn.executemany('INSERT INTO "{}" VALUES ({})'.format(
+                table, ", ".join("?" * len(columns))), frame_rows(df))
+            if table.startswith('px_'):
+                # cached copies of a price table expire with every write
+                _new_price_version(conn, table[len('px_'):])
 
-def save_price_data_to_db(table, price_data, silent=False):
-    conn = sqlite3.connect('C:/Users/Daniel/Desktop/PythonProjects/PortfolioManagement/price_data.db')
-    price_data.to_sql('px_' + table, conn, if_exists='replace', index_label='date')
+    def close(self):
+        """Closes connections of all threads"""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+        self._reset()
+
+
+def _sql_type(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return 'TIMESTAMP'
+    if pd.api.types.is_integer_dtype(values):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(values):
+        return 'REAL'
+    return 'TEXT'
+
+def _sql_values(values):
+    """Transforms a column/index into a list of values accepted by sqlite"""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return [None if pd.isnull(v) else v for v in
+                pd.DatetimeIndex(values).strftime('%Y-%m-%d %H:%M:%S')]
+    values = pd.Series(values).astype(object)
+    return values.where(values.notnull(), None).tolist()
+
+def frame_rows(df):
+    """Returns a list of rows (index first) of a DataFrame in sqlite format"""
+    columns = [_sql_values(df.index)] + [_sql_values(df[col]) for col in df.columns]
+    return list(zip(*columns))
+
+_storages = {}
+_storages_lock = threading.Lock()
+
+def get_storage(name):
+    """Returns the shared storage object of a database ('price_data',
+    'fin_data' or 'articles'). It's created on the first call"""
+    with _storages_lock:
+        if name not in _storages:
+            _storages[name] = SQLiteStorage(os.path.join(DB_DIR, name + '.db'))
+        return _storages[name]
+
+def set_storage(name, storage):
+    """Replaces the shared storage object of a database, e.g. to use a file
+    in a different location: set_storage('price_data', SQLiteStorage(path))"""
+    with _storages_lock:
+        old = _storages.get(name)
+        _storages[name] = storage
+    if old is not None and old is not storage:
+        old.close()
+
+PRICE_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+def _prepare_price_table(conn, table):
+    """Creates a price table with a primary key on date. Tables created
+    before (by DataFrame.to_sql) don't have one so a unique index on date
+    is added to them - it works as the same conflict target for upserts"""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?",
+                       (table,)).fetchone()
+    if row is None:
+        conn.execute('CREATE TABLE "{}" ("date" TIMESTAMP PRIMARY KEY, {})'.format(
+            table, ", ".join('"{}" REAL'.format(col) for col in PRICE_COLUMNS)))
+    elif 'PRIMARY KEY' not in row[0]:
+        try:
+            conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS "ux_{0}_date" ON "{0}" ("date")'
+                         .format(table))
+        except sqlite3.IntegrityError:
+            # old table with duplicated dates - keep the last inserted row
+            conn.execute('DELETE FROM "{0}" WHERE rowid NOT IN (SELECT MAX(rowid) FROM "{0}" '
+                         'GROUP BY "date")'.format(table))
+            conn.execute('CREATE UNIQUE INDEX "ux_{0}_date" ON "{0}" ("date")'.format(table))
+
+def save_price_data_to_db(table, price_data, silent=False, mode='upsert'):
+    """Saves OHLCV price data of a symbol in the px_<symbol> table.
+
+    Params:
+        mode: str
+            'upsert' - adds new dates and overwrites prices of existing ones
+            'append' - adds only new dates, existing rows are left untouched
+            'rebuild' - drops the table and writes the whole price_data again"""
+    storage = get_storage('price_data')
+    px_table = 'px_' + table
+    price_data = price_data[PRICE_COLUMNS]
+    columns = ", ".join('"{}"'.format(col) for col in ['date'] + PRICE_COLUMNS)
+    if mode == 'upsert':
+        updates = ", ".join('"{0}"=excluded."{0}"'.format(col) for col in PRICE_COLUMNS)
+        query = 'INSERT INTO "{}" ({}) VALUES (?, ?, ?, ?, ?, ?) ' \
+                'ON CONFLICT("date") DO UPDATE SET {}'.format(px_table, columns, updates)
+    elif mode in ('append', 'rebuild'):
+        query = 'INSERT OR IGNORE INTO "{}" ({}) VALUES (?, ?, ?, ?, ?, ?)'.format(px_table, columns)
+    else:
+        raise ValueError("Unknown mode: {}".format(mode))
+    rows = frame_rows(price_data)
+    with storage.transaction() as conn:
+        if mode == 'rebuild':
+            conn.execute('DROP TABLE IF EXISTS "{}"'.format(px_table))
+        _prepare_price_table(conn, px_table)
+        conn.executemany(query, rows)
+        # keep the consolidated table in sync if it's used
+        if storage.table_exists('prices'):
+            _save_consolidated_prices(conn, table, rows, mode)
+        # every write changes the version so cached copies of the table expire
+        _new_price_version(conn, table)
     if not silent:
-        print("Price data saved in {} table".format(table))
+        print("Price data saved in {} table ({} rows)".format(table, len(price_data)))
 
 def read_price_data_from_db(table):
-    conn = sqlite3.connect('C:/Users/Daniel/Desktop/PythonProjects/PortfolioManagement/price_data.db')
-    df = pd.read_sql_query("SELECT * FROM {}".format('px_' + table), conn, index_col='date', 
-                             parse_dates={'date': '%Y-%m-%d %H:%M:%S'})    
+    storage = get_storage('price_data')
+    df = storage.read_sql("SELECT * FROM {}".format('px_' + table), index_col='date',
+                          parse_dates={'date': '%Y-%m-%d %H:%M:%S'})
     df.index.name = 'date'
     return df
 
+def _new_price_version(conn, symbol):
+    """Sets a new random version token of a symbol's price table"""
+    conn.execute('CREATE TABLE IF NOT EXISTS price_versions ("symbol" TEXT PRIMARY KEY, '
+                 '"version" TEXT)')
+    version = uuid.uuid4().hex
+    conn.execute('INSERT OR REPLACE INTO price_versions VALUES (?, ?)', (symbol, version))
+    return version
+
+def read_price_versions(symbols):
+    """Returns a dict {symbol: version} of price tables. The version changes
+    every time a table is written (by save_price_data_to_db or write_frame).
+    Read-only - symbols without a version (no price table or a table written
+    by older versions, see add_missing_price_versions) are left out"""
+    storage = get_storage('price_data')
+    versions = {}
+    if storage.table_exists('price_versions'):
+        for i in range(0, len(symbols), 500):
+            chunk = list(symbols[i:i+500])
+            cur = storage.connection.execute(
+                'SELECT "symbol", "version" FROM price_versions WHERE "symbol" IN ({})'
+                .format(", ".join("?" * len(chunk))), chunk)
+            versions.update(cur.fetchall())
+    return versions
+
+def add_missing_price_versions(silent=False):
+    """Gives versions to price tables written by older versions, which are
+    otherwise read from the database without caching until they are written
+    again. Returns the number of versions added"""
+    storage = get_storage('price_data')
+    symbols = list_price_symbols()
+    with storage.transaction() as conn:
+        versions = read_price_versions(symbols)
+        missing = [symbol for symbol in symbols if symbol not in versions]
+        for symbol in missing:
+            _new_price_version(conn, symbol)
+    if not silent:
+        print("{} price versions added".format(len(missing)))
+    return len(missing)
+
+def list_price_symbols():
+    """Returns symbols of all price tables stored in the database"""
+    cur = get_storage('price_data').connection.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'px\\_%' ESCAPE '\\'")
+    return sorted(row[0][3:] for row in cur)
+
+def check_price_symbols(symbols):
+    """Raises ValueError if any of symbols has no price table"""
+    missing = sorted(set(symbols) - set(list_price_symbols()))
+    if missing:
+        raise ValueError("No price data of: {}".format(", ".join(missing)))
+
+def _create_consolidated_prices(conn):
+    """Creates the long-format prices table keyed by (symbol, date). The index
+    on (date, symbol, close) covers cross-sectional queries of close prices"""
+    conn.execute('CREATE TABLE IF NOT EXISTS prices ("symbol" TEXT, "date" TIMESTAMP, {}, '
+                 'PRIMARY KEY ("symbol", "date")) WITHOUT ROWID'.format(
+                     ", ".join('"{}" REAL'.format(col) for col in PRICE_COLUMNS)))
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_prices_date_symbol ON prices '
+                 '("date", "symbol", "close")')
+
+def _save_consolidated_prices(conn, symbol, rows, mode):
+    columns = ", ".join('"{}"'.format(col) for col in ['symbol', 'date'] + PRICE_COLUMNS)
+    if mode == 'rebuild':
+        conn.execute('DELETE FROM prices WHERE "symbol"=?', (symbol,))
+    verb = 'INSERT OR IGNORE' if mode == 'append' else 'INSERT OR REPLACE'
+    conn.executemany('{} INTO prices ({}) VALUES (?, ?, ?, ?, ?, ?, ?)'.format(verb, columns),
+                     [(symbol,) + row for row in rows])
+
+def migrate_to_consolidated_prices(silent=False):
+    """Creates the consolidated 'prices' table (symbol, date, OHLCV) and copies
+    data from all px_<symbol> tables into it. Once the table exists every
+    save_price_data_to_db call keeps it in sync. Can be run again to copy
+    tables written by older versions"""
+    storage = get_storage('price_data')
+    symbols = list_price_symbols()
+    columns = ", ".join('"{}"'.format(col) for col in ['date'] + PRICE_COLUMNS)
+    with storage.transaction() as conn:
+        _create_consolidated_prices(conn)
+        for symbol in symbols:
+            conn.execute('INSERT OR REPLACE INTO prices SELECT ?, {} FROM "px_{}"'
+                         .format(columns, symbol), (symbol,))
+    if not silent:
+        print("{} price tables copied to the prices table".format(len(symbols)))
+
+def read_price_panel(symbols, start=None, end=None, column='close'):
+    """Reads prices of many symbols in one query and returns a wide DataFrame
+    indexed by date with one column per symbol. Uses the consolidated prices
+    table if it exists, otherwise the px_<symbol> tables are combined with
+    UNION ALL. Both ways raise ValueError if any symbol has no price table.
+
+    Params:
+        start, end: str or datetime
+            optional range of dates (inclusive)
+        column: str or list
+            price column(s) to read. For a list of columns the result has
+            (column, symbol) MultiIndex columns"""
+    storage = get_storage('price_data')
+    symbols = list(symbols)
+    check_price_symbols(symbols)
+    columns = [column] if isinstance(column, str) else list(column)
+    selected = ", ".join('"{}"'.format(col) for col in ['symbol', 'date'] + columns)
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append('"date" >= ?')
+        params.append(pd.Timestamp(start).strftime('%Y-%m-%d %H:%M:%S'))
+    if end is not None:
+        conditions.append('"date" <= ?')
+        params.append(pd.Timestamp(end).strftime('%Y-%m-%d %H:%M:%S'))
+    if storage.table_exists('prices'):
+        conditions.append('"symbol" IN ({})'.format(", ".join("?" * len(symbols))))
+        query = 'SELECT {} FROM prices WHERE {}'.format(selected, " AND ".join(conditions))
+        frames = [storage.read_sql(query, params=params + list(symbols))]
+    else:
+        where = ' WHERE ' + " AND ".join(conditions) if conditions else ''
+        selected = ", ".join('"{}"'.format(col) for col in ['date'] + columns)
+        frames = []
+        # sqlite limits the number of terms in a compound select to 500
+        for i in range(0, len(symbols), 500):
+            chunk = symbols[i:i+500]
+            query = " UNION ALL ".join('SELECT ? AS "symbol", {} FROM "px_{}"{}'
+                                       .format(selected, symbol, where) for symbol in chunk)
+            chunk_params = []
+            for symbol in chunk:
+                chunk_params += [symbol] + params
+            frames.append(storage.read_sql(query, params=chunk_params))
+    long = pd.concat(frames, ignore_index=True)
+    long['date'] = pd.to_datetime(long['date'], format='%Y-%m-%d %H:%M:%S')
+    panel = long.pivot(index='date', columns='symbol',
+                       values=column if isinstance(column, str) else columns)
+    panel.columns.names = [None] * panel.columns.nlevels
+    return panel.reindex(columns=list(symbols), level=None if isinstance(column, str) else 1)
+
 def save_fin_data_to_db(table, fin_data, period, silent=False):
-    conn = sqlite3.connect('C:/Users/Daniel/Desktop/PythonProjects/PortfolioManagement/fin_data.db')
-    fin_data.to_sql('fin_{}_{}'.format(table, period), conn, if_exists='replace', index_label='date')
+    storage = get_storage('fin_data')
+    storage.write_frame('fin_{}_{}'.format(table, period), fin_data, 'date')
     if not silent:
-        print("Financial data saved in {} table".format(table)) 
+        print("Financial data saved in {} table".format(table))
 
 def read_fin_data_from_db(table, period):
-    conn = sqlite3.connect('C:/Users/Daniel/Desktop/PythonProjects/PortfolioManagement/fin_data.db')
-    return pd.read_sql_query('SELECT * FROM fin_{}_{}'.format(table, period), 
-                             conn, index_col='date')
+    storage = get_storage('fin_data')
+    return storage.read_sql('SELECT * FROM fin_{}_{}'.format(table, period),
+                            index_col='date')
+
+ARTICLE_COLUMNS = ['header', 'content', 'url', 'source']
+
+def _prepare_articles_table(conn, table):
+    """Creates an articles table with a unique index on url. Tables created
+    before may contain duplicated urls - only the first copy is kept"""
+    conn.execute('CREATE TABLE IF NOT EXISTS "{}" ("date" TIMESTAMP, {})'.format(
+        table, ", ".join('"{}" TEXT'.format(col) for col in ARTICLE_COLUMNS)))
+    try:
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS "ux_{0}_url" ON "{0}" ("url")'
+                     .format(table))
+    except sqlite3.IntegrityError:
+        conn.execute('DELETE FROM "{0}" WHERE rowid NOT IN (SELECT MIN(rowid) FROM "{0}" '
+                     'GROUP BY "url")'.format(table))
+        conn.execute('CREATE UNIQUE INDEX "ux_{0}_url" ON "{0}" ("url")'.format(table))
+    conn.execute('CREATE INDEX IF NOT EXISTS "ix_{0}_date" ON "{0}" ("date")'.format(table))
+
+def insert_articles_to_db(articles, symbol):
+    """Inserts articles into the articles_<symbol> table (created if needed)
+    and into the full-text search index. Articles with urls that are already
+    stored are ignored. Returns the number of inserted articles"""
+    storage = get_storage('articles')
+    table = 'articles_{}'.format(symbol)
+    columns = ", ".join('"{}"'.format(col) for col in ['date'] + ARTICLE_COLUMNS)
+    query = 'INSERT OR IGNORE INTO "{}" ({}) VALUES (?, ?, ?, ?, ?)'.format(table, columns)
+    inserted = []
+    with storage.transaction() as conn:
+        _prepare_articles_table(conn, table)
+        for row in frame_rows(articles[ARTICLE_COLUMNS]):
+            if conn.execute(query, row).rowcount == 1:
+                inserted.append(row)
+        _prepare_article_index(conn)
+        _index_articles(conn, symbol, inserted)
+    return len(inserted)
 
 def save_articles_to_db(articles, symbol, silent=False):
-    """Saves articles from various sources to DB. Requires columns:
+    """Saves articles from various sources to DB replacing all articles that
+    are stored for the symbol. Requires columns:
         ["date", "header", "content", "url", "source"]"""
-    conn = sqlite3.connect('C:/Users/Daniel/Desktop/PythonProjects/PortfolioManagement/articles.db')
+    storage = get_storage('articles')
     table = 'articles_{}'.format(symbol)
-    articles.to_sql(table, conn, if_exists='replace', index_label='date')
+    with storage.transaction() as conn:
+        conn.execute('DROP TABLE IF EXISTS "{}"'.format(table))
+        _prepare_article_index(conn)
+        conn.execute('DELETE FROM articles_fts WHERE "symbol"=?', (symbol,))
+        insert_articles_to_db(articles, symbol)
+    if not silent:
+        print("Articles saved in {} table".format(table))
+
+def _prepare_article_index(conn):
+    """Creates the full-text search index of articles of all symbols. Header
+    and content are indexed as lowercase words without stopwords, diacritics
+    are ignored in searches"""
+    conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5('
+                 'symbol UNINDEXED, date UNINDEXED, url UNINDEXED, title UNINDEXED, '
+                 'header, content, tokenize="unicode61 remove_diacritics 2")')
+
+def _index_articles(conn, symbol, rows):
+    """Adds rows (date, header, content, url, source) to the search index"""
+    conn.executemany('INSERT INTO articles_fts VALUES (?, ?, ?, ?, ?, ?)',
+                     [(symbol, date, url, header, " ".join(tokenize(header)),
+                       " ".join(tokenize(content))) for date, header, content, url, _ in rows])
+
+def list_article_symbols():
+    """Returns symbols of all article tables stored in the database"""
+    cur = get_storage('articles').connection.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'articles\\_%' ESCAPE '\\'")
+    return sorted(row[0][len('articles_'):] for row in cur if row[0] != 'articles_fts'
+                  and not row[0].startswith('articles_fts_'))
+
+def rebuild_article_index(silent=False):
+    """Recreates the full-text search index from all articles_<symbol> tables,
+    e.g. for articles saved by older versions"""
+    storage = get_storage('articles')
+    tables = ['articles_' + symbol for symbol in list_article_symbols()]
+    columns = ", ".join('"{}"'.format(col) for col in ['date'] + ARTICLE_COLUMNS)
+    with storage.transaction() as conn:
+        conn.execute('DROP TABLE IF EXISTS articles_fts')
+        _prepare_article_index(conn)
+        for table in tables:
+            rows = conn.execute('SELECT {} FROM "{}"'.format(columns, table)).fetchall()
+            _index_articles(conn, table[len('articles_'):], rows)
     if not silent:
-        print("Articles saved in {} table".format(table)) 
+        print("{} article tables indexed".format(len(tables)))
+
+def _fts_query(query):
+    """Transforms a query into FTS5 syntax: words are normalized the same way
+    as indexed text and all of them have to be found. Words of at least 4
+    letters match all their inflected forms - the word or any word starting
+    with its stem (see data.formatting.light_stem), exact matches rank
+    higher. Words ending with '*' match all words with the given prefix"""
+    terms = []
+    for word in query.split():
+        for token in tokenize(word.rstrip('*')):
+            if word.endswith('*'):
+                terms.append('"{}"*'.format(token))
+            elif len(token) >= 4:
+                terms.append('("{}" OR "{}"*)'.format(token, light_stem(token)))
+            else:
+                terms.append('"{}"'.format(token))
+    return " AND ".join(terms)
+
+def search_articles(query, symbols=None, since=None, until=None, limit=50, raw=False):
+    """Searches articles of given symbols (all by default) and returns a
+    DataFrame of hits (symbol, date, header, url, rank) from the best match.
+    Matches in headers count twice as much as in the content. Polish words
+    are matched in any inflected form (a query 'dywidenda' finds 'dywidendy'
+    and 'dywidendę' too) with exact forms ranked higher, 'dywid*' matches all
+    words starting with 'dywid'.
+
+    Params:
+        since, until: str or datetime
+            optional range of article dates
+        raw: bool
+            if True the query is passed to sqlite FTS5 as it is"""
+    columns = ['symbol', 'date', 'header', 'url', 'rank']
+    storage = get_storage('articles')
+    match = query if raw else _fts_query(query)
+    if not match or not storage.table_exists('articles_fts'):
+        return pd.DataFrame(columns=columns)
+    conditions = ['articles_fts MATCH ?']
+    params = [match]
+    if symbols is not None:
+        conditions.append('"symbol" IN ({})'.format(", ".join("?" * len(symbols))))
+        params += list(symbols)
+    if since is not None:
+        conditions.append('"date" >= ?')
+        params.append(pd.Timestamp(since).strftime('%Y-%m-%d %H:%M:%S'))
+    if until is not None:
+        conditions.append('"date" <= ?')
+        params.append(pd.Timestamp(until).strftime('%Y-%m-%d %H:%M:%S'))
+    params.append(limit)
+    return storage.read_sql(
+        'SELECT "symbol", "date", "title" AS "header", "url", '
+        'bm25(articles_fts, 0, 0, 0, 0, 2.0, 1.0) AS "rank" FROM articles_fts '
+        'WHERE {} ORDER BY "rank" LIMIT ?'.format(" AND ".join(conditions)),
+        params=params, parse_dates=['date'])
+
+def _prepare_article_sync_tables(conn):
+    """Creates tables with the progress of article syncs: the deepest news
+    list page read (all pages before it were read too) and whether the last
+    page was reached, and urls of articles that failed to download"""
+    conn.execute('CREATE TABLE IF NOT EXISTS article_sync ("symbol" TEXT PRIMARY KEY, '
+                 '"page" INTEGER, "complete" INTEGER, "updated" TIMESTAMP)')
+    conn.execute('CREATE TABLE IF NOT EXISTS article_failures ("url" TEXT PRIMARY KEY, '
+                 '"symbol" TEXT, "stage" TEXT, "error" TEXT, "attempts" INTEGER, '
+                 '"last_attempt" TIMESTAMP)')
+
+def read_article_sync(symbols):
+    """Returns a dict {symbol: (page, complete)} with progress of syncs of
+    symbols' articles (symbols never synced are left out)"""
+    storage = get_storage('articles')
+    if not storage.table_exists('article_sync'):
+        return {}
+    symbols = list(symbols)
+    progress = {}
+    for i in range(0, len(symbols), 500):
+        chunk = symbols[i:i+500]
+        cur = storage.connection.execute(
+            'SELECT "symbol", "page", "complete" FROM article_sync WHERE "symbol" IN ({})'
+            .format(", ".join("?" * len(chunk))), chunk)
+        progress.update((symbol, (page, bool(complete))) for symbol, page, complete in cur)
+    return progress
+
+def save_article_sync(progress):
+    """Saves progress of syncs given as a dict {symbol: (page, complete)}"""
+    now = pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
+    with get_storage('articles').transaction() as conn:
+        _prepare_article_sync_tables(conn)
+        conn.executemany('INSERT OR REPLACE INTO article_sync VALUES (?, ?, ?, ?)',
+                         [(symbol, page, int(complete), now)
+                          for symbol, (page, complete) in progress.items()])
+
+def read_failed_article_urls(symbols, max_attempts=3, exhausted=False):
+    """Returns a dict {symbol: list of urls} of articles that failed to
+    download less than max_attempts times (or at least max_attempts times
+    if exhausted is True)"""
+    storage = get_storage('articles')
+    failed = {}
+    if not storage.table_exists('article_failures'):
+        return failed
+    symbols = list(symbols)
+    for i in range(0, len(symbols), 500):
+        chunk = symbols[i:i+500]
+        cur = storage.connection.execute(
+            'SELECT "symbol", "url" FROM article_failures WHERE "attempts" {} ? AND '
+            '"symbol" IN ({}) ORDER BY rowid'.format(">=" if exhausted else "<",", ".join("?" * len(chunk))),
+            [max_attempts] + chunk)
+        for symbol, url in cur:
+            failed.setdefault(symbol, []).append(url)
+    return failed
+
+def save_article_failures(failures, resolved=()):
+    """Records failed downloads given as a list of (symbol, url, stage, error)
+    (attempts of urls that failed before are counted) and removes urls that
+    were downloaded (resolved) from failures"""
+    now = pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
+    with get_storage('articles').transaction() as conn:
+        _prepare_article_sync_tables(conn)
+        conn.executemany('INSERT INTO article_failures VALUES (?, ?, ?, ?, 1, ?) '
+                         'ON CONFLICT("url") DO UPDATE SET "stage"=excluded."stage", '
+                         '"error"=excluded."error", "attempts"="attempts"+1, '
+                         '"last_attempt"=excluded."last_attempt"',
+                         [(url, symbol, stage, error, now)
+                          for symbol, url, stage, error in failures])
+        conn.executemany('DELETE FROM article_failures WHERE "url"=?',
+                         [(url,) for url in resolved])
+
+def read_article_urls(symbol):
+    """Returns a set of urls of articles stored for a symbol"""
+    storage = get_storage('articles')
+    if not storage.table_exists('articles_{}'.format(symbol)):
+        return set()
+    cur = storage.connection.execute('SELECT "url" FROM "articles_{}"'.format(symbol))
+    return {row[0] for row in cur}
 
 def read_articles_from_db(symbol):
     """Reads articles from DB"""
-    conn = sqlite3.connect('C:/Users/Daniel/Desktop/PythonProjects/PortfolioManagement/articles.db')
-    return pd.read_sql_query('SELECT * FROM articles_{}'.format(symbol), 
-                             conn, index_col='date')
\ No newline at end of file
+    storage = get_storage('articles')
+    return storage.read_sql('SELECT * FROM articles_{}'.format(symbol),
+                            index_col='date', parse_dates=['date'])
+
+def iter_articles_from_db(symbol, chunksize=1000, columns=('date', 'header', 'content')):
+    """Yields articles of a symbol in DataFrames of up to chunksize rows so
+    that the whole content never has to be loaded at once"""
+    storage = get_storage('articles')
+    query = 'SELECT {} FROM "articles_{}" ORDER BY date'.format(
+        ", ".join('"{}"'.format(c) for c in columns), symbol)
+    for chunk in storage.read_sql(query, chunksize=chunksize):
+        yield chunk
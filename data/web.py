@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Shared HTTP layer used by all data gathering functions. Requests go through
+pooled keep-alive sessions with timeouts and exponential backoff retries.
+Pages requested with cache=True are stored on disk (PORTFOLIO_HTTP_CACHE
+directory, http_cache next to the database by default) and revalidated with
+ETag/Last-Modified headers. Stored pages can be replayed without network
+access - record them once and then use an offline client:
+
+    set_client(HTTPClient(cache_dir='fixtures', record=True))
+    set_client(HTTPClient(cache_dir='fixtures', offline=True))
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+from data.storage import DB_DIR
+
+
+CACHE_DIR = os.environ.get('PORTFOLIO_HTTP_CACHE', os.path.join(DB_DIR, 'http_cache'))
+
+
+class HTTPClient():
+    """HTTP client with connection pooling, retries and an on-disk cache.
+
+    Params:
+        timeout: float or tuple
+            (connect, read) timeout in seconds
+        retries: int
+            number of retries of failed connections and 429/5xx responses,
+            waiting backoff * 2^n seconds between them
+        pool_size: int
+            number of kept-alive connections per host
+        offline: bool
+            if True pages are served only from the cache and missing pages
+            raise ConnectionError
+        record: bool
+            if True all downloaded pages are stored in the cache (not only
+            the ones requested with cache=True), e.g. to record fixtures"""
+
+    def __init__(self, cache_dir=CACHE_DIR, timeout=(5, 30), retries=3, backoff=0.5,
+                 pool_size=20, offline=False, record=False):
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.offline = offline
+        self.record = record
+        retry = Retry(total=retries, backoff_factor=backoff, allowed_methods=['GET'],
+                      status_forcelist=(429, 500, 502, 503, 504), raise_on_status=False)
+        # one adapter (and its thread-safe connection pools) shared by sessions
+        # of all threads
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                                   max_retries=retry)
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        """Session of the current thread"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            session.mount('http://', self.adapter)
+            session.mount('https://', self.adapter)
+        return session
+
+    def _cache_files(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.cache_dir, key[:2], key)
+        return base + '.json', base + '.body'
+
+    def _load(self, url):
+        meta_file, body_file = self._cache_files(url)
+        try:
+            with open(meta_file) as f:
+                meta = json.load(f)
+            with open(body_file, 'rb') as f:
+                body = f.read()
+        except (FileNotFoundError, ValueError):
+            return None, None
+        return meta, body
+
+    def _store(self, url, response):
+        meta_file, body_file = self._cache_files(url)
+        os.makedirs(os.path.dirname(meta_file), exist_ok=True)
+        meta = {'url': url, 'time': time.time(), 'headers': dict(response.headers)}
+        # write to temporary files first so readers never see half-written data
+        with open(body_file + '.tmp', 'wb') as f:
+            f.write(response.content)
+        os.replace(body_file + '.tmp', body_file)
+        with open(meta_file + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_file + '.tmp', meta_file)
+
+    def _touch(self, url, meta):
+        meta_file, _ = self._cache_files(url)
+        meta['time'] = time.time()
+        with open(meta_file + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_file + '.tmp', meta_file)
+
+    @staticmethod
+    def _response(url, meta, body):
+        """Creates a response object from a cached page"""
+        response = requests.models.Response()
+        response.url = url
+        response.status_code = 200
+        response.headers = CaseInsensitiveDict(meta['headers'])
+        response._content = body
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
+
+    def get(self, url, cache=False, max_age=0):
+        """Sends a GET request and returns the response.
+
+        Params:
+            cache: bool
+                if True the page is stored on disk and revalidated with
+                ETag/Last-Modified headers on the next requests
+            max_age: int
+                number of seconds a cached page is served without asking the
+                server at all"""
+        if self.offline:
+            meta, body = self._load(url)
+            if meta is None:
+                raise requests.ConnectionError("{} is not cached and client is offline".format(url))
+            return self._response(url, meta, body)
+        if not cache:
+            response = self.session.get(url, timeout=self.timeout)
+            if self.record and response.status_code == 200:
+                self._store(url, response)
+            return response
+        meta, body = self._load(url)
+        if meta is not None and time.time() - meta['time'] < max_age:
+            return self._response(url, meta, body)
+        headers = {}
+        if meta is not None:
+            if 'ETag' in meta['headers']:
+                headers['If-None-Match'] = meta['headers']['ETag']
+            if 'Last-Modified' in meta['headers']:
+                headers['If-Modified-Since'] = meta['headers']['Last-Modified']
+        response = self.session.get(url, timeout=self.timeout, headers=headers)
+        if response.status_code == 304 and meta is not None:
+            # not modified - serve the cached page and restart its max_age
+            self._touch(url, meta)
+            return self._response(url, meta, body)
+        if response.status_code == 200:
+            self._store(url, response)
+        return response
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Returns the shared HTTP client. It's created on the first call"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HTTPClient()
+        return _client
+
+def set_client(client):
+    """Replaces the shared HTTP client, e.g. with an offline one"""
+    global _client
+    with _client_lock:
+        _client = client
+
+def get(url, cache=False, max_age=0):
+    """Sends a GET request with the shared client (see HTTPClient.get)"""
+    return get_client().get(url, cache, max_age)
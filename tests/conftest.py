@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Fixtures shared by tests. Databases (and caches) of every test are created
+in its own temporary directory, set as PORTFOLIO_DB_DIR
+"""
+
+import os
+import tempfile
+
+# modules read the directory when they are imported - make sure that they
+# never point to the project directory
+os.environ['PORTFOLIO_DB_DIR'] = tempfile.mkdtemp(prefix='portfolio_tests_')
+os.environ['PORTFOLIO_CACHE_DIR'] = os.path.join(os.environ['PORTFOLIO_DB_DIR'],
+                                                 'price_cache')
+
+import numpy as np
+import pandas as pd
+import pytest
+import requests
+from data import storage
+from data import cache
+from data import web
+
+
+def _close_storages():
+    with storage._storages_lock:
+        storages = list(storage._storages.values())
+        storage._storages.clear()
+    for db in storages:
+        db.close()
+
+
+@pytest.fixture
+def db_dir(tmp_path, monkeypatch):
+    """Empty database directory used by all storages and the price cache"""
+    _close_storages()
+    monkeypatch.setenv('PORTFOLIO_DB_DIR', str(tmp_path))
+    monkeypatch.setattr(storage, 'DB_DIR', str(tmp_path))
+    previous_cache = cache._cache
+    cache.set_price_cache(cache.PriceCache(str(tmp_path / 'price_cache')))
+    yield tmp_path
+    cache.set_price_cache(previous_cache)
+    _close_storages()
+
+
+def make_prices(n_days=300, end='2026-10-16', seed=0, gaps=0):
+    """Random OHLCV prices of business days (with gaps random days removed)"""
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(end=end, periods=n_days, name='date')
+    if gaps:
+        index = index.delete(rng.choice(len(index), gaps, replace=False))
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, len(index))))
+    return pd.DataFrame({'open': close * (1 + rng.uniform(-0.01, 0.01, len(index))),
+                         'high': close * (1 + rng.uniform(0, 0.02, len(index))),
+                         'low': close * (1 - rng.uniform(0, 0.02, len(index))),
+                         'close': close,
+                         'volume': rng.integers(100, 10000, len(index)).astype(float)},
+                        index=index)
+
+
+@pytest.fixture
+def prices():
+    return make_prices
+
+
+class OfflineSite():
+    """Pages served by an offline HTTPClient (see data.web) - the same format
+    as pages recorded with record=True"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def add(self, url, body, headers=None):
+        response = requests.models.Response()
+        response.status_code = 200
+        response.headers = requests.structures.CaseInsensitiveDict(
+            headers or {'Content-Type': 'text/html; charset=utf-8'})
+        response._content = body.encode('utf-8') if isinstance(body, str) else body
+        self.client._store(url, response)
+
+    def remove(self, url):
+        for file in self.client._cache_files(url):
+            if os.path.exists(file):
+                os.remove(file)
+
+    def add_bankier_symbol(self, symbol, n_articles, per_page=10, start=0):
+        """Adds list pages and articles of a symbol (newest first). Articles
+        are numbered from start, article i is published i days after
+        2020-01-01. Returns urls of articles (newest first)"""
+        numbers = list(range(start + n_articles - 1, start - 1, -1))
+        pages = [numbers[i:i+per_page] for i in range(0, len(numbers), per_page)] or [[]]
+        urls = []
+        for n, page in enumerate(pages, 1):
+            links = ['/wiadomosc/{}-{}.html'.format(symbol, i) for i in page]
+            self.add(BANKIER_LIST_URL.format(symbol, n), bankier_list_page(links, len(pages)))
+            for i, link in zip(page, links):
+                url = 'https://www.bankier.pl' + link
+                date = pd.Timestamp('2020-01-01') + pd.Timedelta(days=i)
+                self.add(url, bankier_article_page(
+                    date.strftime('%Y-%m-%d %H:%M'), '{} article {}'.format(symbol, i),
+                    'Tekst artykulu numer {} o spolce {}.'.format(i, symbol)))
+                urls.append(url)
+        return urls
+
+
+BANKIER_LIST_URL = 'https://www.bankier.pl/gielda/notowania/akcje/{}/wiadomosci/{}'
+
+def bankier_list_page(links, last_page=1):
+    items = "".join('<li><span class="entry-title"><a href="{}">title</a></span></li>'
+                    .format(link) for link in links)
+    pages = "".join('<a class="numeral btn">{}</a>'.format(n)
+                    for n in range(1, last_page + 1)) if last_page > 1 else ''
+    return '<html><body><ul>{}</ul><div>{}</div></body></html>'.format(items, pages)
+
+def bankier_article_page(date, header, text):
+    return ('<html><body><time class="entry-date">{}</time><h1 class="entry-title">{}</h1>'
+            '<div id="articleContent"><p>{}</p></div></body></html>'.format(date, header, text))
+
+def stooq_table_page(rows):
+    body = "".join('<tr>{}</tr>'.format("".join('<td>{}</td>'.format(c) for c in row))
+                   for row in rows)
+    return '<html><body><table class="fth1"><tbody>{}</tbody></table></body></html>'.format(body)
+
+
+@pytest.fixture
+def offline_site(tmp_path):
+    """Replaces the shared HTTP client with an offline one serving pages added
+    to the returned OfflineSite"""
+    previous = web._client
+    client = web.HTTPClient(cache_dir=str(tmp_path / 'http_fixtures'), offline=True)
+    web.set_client(client)
+    yield OfflineSite(client)
+    web.set_client(previous)
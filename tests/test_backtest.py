@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of backtests of weight schemes (analysis.backtest)
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from analysis.backtest import backtest, rebalance_steps
+
+
+@pytest.fixture
+def returns():
+    """Log returns of 2 assets on 4 days (simple returns in comments)"""
+    index = pd.to_datetime(['2026-01-02', '2026-01-05', '2026-01-06', '2026-01-07'])
+    simple = np.array([[0.1, 0.0],     # A +10%
+                       [0.0, 0.2],     # B +20%
+                       [-0.1, 0.1],
+                       [0.0, 0.0]])
+    return pd.DataFrame(np.log1p(simple), index=index, columns=['A', 'B'])
+
+
+def test_rebalance_steps():
+    index = pd.to_datetime(['2026-01-29', '2026-01-30', '2026-02-02', '2026-02-03',
+                            '2026-03-02'])
+    assert not rebalance_steps(index, None).any()
+    assert rebalance_steps(index, 2).tolist() == [True, False, True, False, True]
+    assert rebalance_steps(index, 'M').tolist() == [False, False, True, False, True]
+
+
+def test_turnover_and_costs_at_rebalance_dates(returns):
+    result = backtest(returns, [0.5, 0.5], rebalance=2, cost=0.01)
+    # day 1: buying from cash, the whole value is traded
+    # day 2: A drifted to 0.55/1.05, B to 0.5/1.05, no trade
+    # day 3: after B's gain weights are 0.55/1.15 and 0.6/1.15, both are
+    #        restored to 0.5
+    traded = [1, 0, 0.05 / 1.15, 0]
+    gross = [1.05, 1.15 / 1.05, 0.5 * 0.9 + 0.5 * 1.1, 1]
+    expected_returns = [g * (1 - 0.01 * t) - 1 for g, t in zip(gross, traded)]
+    np.testing.assert_allclose(result.turnover['portfolio'], traded)
+    np.testing.assert_allclose(result.costs['portfolio'], np.multiply(traded, 0.01))
+    np.testing.assert_allclose(result.returns['portfolio'], expected_returns)
+    np.testing.assert_allclose(result.equity['portfolio'], np.cumprod(np.add(expected_returns, 1)))
+    summ = result.summary()
+    assert summ.loc['portfolio', 'total_costs'] == pytest.approx(0.01 * (1 + 0.05 / 1.15))
+
+
+def test_buy_and_hold_trades_once(returns):
+    result = backtest(returns, [0.5, 0.5], rebalance=None, cost=0.01)
+    np.testing.assert_allclose(result.turnover['portfolio'], [1, 0, 0, 0])
+    # value of held assets without costs of later trades
+    values = 0.5 * np.array([1.1 * 0.9, 1.2 * 1.1])
+    assert result.equity['portfolio'].iloc[-1] == pytest.approx(values.sum() * 0.99)
+
+
+def test_cash_before_first_scheduled_weights(returns):
+    # decided on a Saturday, used from Monday; the next change is traded
+    # although the calendar never rebalances
+    schedule = pd.DataFrame({'A': [1.0, 0.0], 'B': [0.0, 1.0]},
+                            index=pd.to_datetime(['2026-01-03', '2026-01-06']))
+    result = backtest(returns, {'static': [0.5, 0.5], 'schedule': schedule},
+                      rebalance=None, cost=0.01)
+    first = result.returns['schedule']
+    assert first.iloc[0] == 0
+    assert result.equity['schedule'].iloc[0] == 1
+    assert result.turnover['schedule'].tolist() == [0, 1, 2, 0]
+    # all in A on day 2 (no change), switched to B on day 3
+    np.testing.assert_allclose(first.iloc[1:], [0.99 - 1, 1.1 * 0.98 - 1, 0])
+    # the static strategy starts on the first day
+    assert result.turnover['static'].tolist() == [1, 0, 0, 0]
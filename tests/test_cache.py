@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of price table versions and the columnar price cache (data.cache)
+"""
+
+import os
+import pandas as pd
+from data.storage import get_storage, save_price_data_to_db, read_price_versions
+from data.storage import add_missing_price_versions
+from data.cache import read_price_data
+
+
+def test_cache_expires_after_write(db_dir, prices):
+    data = prices(50)
+    save_price_data_to_db('AAA', data, silent=True)
+    version = read_price_versions(['AAA'])['AAA']
+    pd.testing.assert_frame_equal(read_price_data('AAA'), data, check_freq=False)
+    assert (db_dir / 'price_cache' / 'AAA' / (version + '.values.npy')).exists()
+    changed = data.iloc[-1:] * 2
+    save_price_data_to_db('AAA', changed, silent=True)
+    assert read_price_versions(['AAA'])['AAA'] != version
+    assert read_price_data('AAA')['close'].iloc[-1] == changed['close'].iloc[-1]
+
+
+def test_write_frame_sets_price_version(db_dir, prices):
+    storage = get_storage('price_data')
+    storage.write_frame('px_BBB', prices(5), 'date')
+    version = read_price_versions(['BBB'])['BBB']
+    storage.write_frame('px_BBB', prices(6), 'date')
+    assert read_price_versions(['BBB'])['BBB'] != version
+
+
+def test_read_price_versions_is_read_only(db_dir, prices):
+    storage = get_storage('price_data')
+    # a table written by an older version, without a version row
+    data = prices(20)
+    data.to_sql('px_OLD', storage.connection, index_label='date')
+    changes = storage.connection.total_changes
+    assert read_price_versions(['OLD', 'MISSING']) == {}
+    assert storage.connection.total_changes == changes
+    assert not storage.table_exists('price_versions')
+    # read from the database without caching
+    assert len(read_price_data('OLD')) == 20
+    assert not (db_dir / 'price_cache' / 'OLD').exists()
+    assert add_missing_price_versions(silent=True) == 1
+    assert list(read_price_versions(['OLD'])) == ['OLD']
+    assert len(read_price_data('OLD')) == 20
+    assert (db_dir / 'price_cache' / 'OLD').exists()
+
+
+def test_files_in_use_are_removed_later(db_dir, prices, monkeypatch):
+    data = prices(50)
+    save_price_data_to_db('AAA', data, silent=True)
+    old = read_price_data('AAA')
+    directory = db_dir / 'price_cache' / 'AAA'
+    remove = os.remove
+
+    def locked_remove(path):
+        # Windows doesn't allow removing memory-mapped files
+        raise PermissionError(13, 'The process cannot access the file', path)
+
+    monkeypatch.setattr(os, 'remove', locked_remove)
+    save_price_data_to_db('AAA', data.iloc[-1:] * 2, silent=True)
+    assert read_price_data('AAA')['close'].iloc[-1] == data['close'].iloc[-1] * 2
+    assert len(list(directory.iterdir())) == 4
+    # the old version is still readable by its DataFrame
+    assert old['close'].iloc[-1] == data['close'].iloc[-1]
+    monkeypatch.setattr(os, 'remove', remove)
+    read_price_data('AAA')
+    version = read_price_versions(['AAA'])['AAA']
+    assert sorted(f.name for f in directory.iterdir()) == [version + '.dates.npy',
+                                                          version + '.values.npy']
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of pairwise-complete correlations of the universe of symbols
+(analysis.correlation) against pandas
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from analysis.correlation import UniverseCorrelation, pairwise_correlation
+from analysis.panel import ReturnsPanel
+from data.storage import save_price_data_to_db
+
+
+# symbols with their numbers of days and removed days, the last one is
+# listed too recently for correlations with 60 common returns
+LISTINGS = {'AAA': (400, 0), 'BBB': (400, 20), 'CCC': (250, 0), 'DDD': (320, 7),
+            'EEE': (400, 3), 'FFF': (45, 0)}
+
+
+@pytest.fixture
+def stored(db_dir, prices):
+    """Correlated prices of symbols listed at different times with gaps"""
+    rng = np.random.default_rng(4)
+    market = pd.Series(rng.normal(0, 0.015, 400), index=prices(400).index)
+    for i, (symbol, (n_days, gaps)) in enumerate(LISTINGS.items()):
+        data = prices(n_days, seed=i, gaps=gaps)
+        beta = 0.3 * i
+        log_close = np.log(data['close']) + beta * market.reindex(data.index).cumsum()
+        data['close'] = np.exp(log_close)
+        save_price_data_to_db(symbol, data, silent=True)
+    return list(LISTINGS)
+
+
+def test_pairwise_correlation_of_blocks():
+    rng = np.random.default_rng(0)
+    values = rng.normal(0, 1, (80, 5)) + rng.normal(0, 1, (80, 1))
+    values[:30, 1] = np.nan
+    values[rng.random((80, 5)) < 0.2] = np.nan
+    mask = ~np.isnan(values)
+    x = np.where(mask, values, 0)
+    mask = mask.astype(float)
+    corr = pairwise_correlation(x[:, :2], mask[:, :2], x[:, 2:], mask[:, 2:], min_periods=40)
+    expected = pd.DataFrame(values).corr(min_periods=40).values[:2, 2:]
+    np.testing.assert_allclose(corr, expected, rtol=1e-10)
+    assert np.isnan(corr[1]).any()
+
+
+@pytest.mark.parametrize('monthly, min_periods', [(False, 60), (False, 300), (True, 6)])
+def test_universe_correlation_matches_pandas(stored, tmp_path, monthly, min_periods):
+    panel = ReturnsPanel.load(stored, missing='pairwise')
+    values = panel.monthly_values if monthly else panel.values
+    expected = pd.DataFrame(values, columns=stored).corr(min_periods=min_periods)
+    corr = UniverseCorrelation('test', str(tmp_path)).compute(
+        stored, monthly=monthly, min_periods=min_periods, dtype=np.float64, block_size=4,
+        workers=2)
+    pd.testing.assert_frame_equal(corr.frame(), expected, rtol=1e-10)
+    # pairs of FFF never have enough common returns
+    assert corr.frame().loc['FFF'].isna().all()
+    assert corr.settings['min_periods'] == min_periods
+    index = panel.monthly_index if monthly else panel.index
+    assert corr.settings['last_date'] == index[-1].strftime('%Y-%m-%d')
+
+
+def test_saved_matrix_lookups(stored, tmp_path):
+    corr = UniverseCorrelation('test', str(tmp_path)).compute(stored, block_size=2)
+    loaded = UniverseCorrelation('test', str(tmp_path)).load()
+    frame = corr.frame()
+    assert loaded.symbols == stored
+    pd.testing.assert_frame_equal(loaded.frame(['CCC', 'AAA']),
+                                  frame.loc[['CCC', 'AAA'], ['CCC', 'AAA']])
+    top = loaded.top('AAA', 3)
+    assert list(top) == sorted(frame.loc['AAA'].drop('AAA').dropna(), reverse=True)[:3]
+    assert 'FFF' not in loaded.top('AAA', 10).index
+    pairs = loaded.top_pairs(2)
+    assert pairs['correlation'].iloc[0] == pytest.approx(np.nanmax(np.where(
+        np.eye(len(stored), dtype=bool), np.nan, frame.values)))
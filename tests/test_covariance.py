@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of memoized covariance estimates (analysis.covariance) and the
+optimizer methods using them
+"""
+
+import numpy as np
+import pandas as pd
+from analysis.covariance import CovarianceProvider, ESTIMATORS
+from analysis.panel import ReturnsPanel
+from core import PortfolioOptimizer
+from data.storage import save_price_data_to_db
+
+
+SYMBOLS = ['AAA', 'BBB', 'CCC']
+
+
+def make_panel(prices, changes=None):
+    close = pd.concat({symbol: prices(1200, seed=i)['close']
+                       for i, symbol in enumerate(SYMBOLS)}, axis=1)
+    for (symbol, i), value in (changes or {}).items():
+        close.iloc[i, SYMBOLS.index(symbol)] = value
+    return ReturnsPanel(close)
+
+
+def test_changed_data_is_not_served_from_memo(prices):
+    provider = CovarianceProvider()
+    panel = make_panel(prices)
+    estimate = provider.estimate(panel, 36)
+    assert provider.estimate(make_panel(prices), 36) is estimate
+    # a corrected price in the middle of the window, the last date is the same
+    corrected = make_panel(prices, {('BBB', 1000): 150.0})
+    assert corrected.index[-1] == panel.index[-1]
+    assert corrected.version != panel.version
+    fresh = provider.estimate(corrected, 36)
+    assert fresh is not estimate
+    np.testing.assert_allclose(fresh.cov, np.cov(corrected.monthly_values[-36:], rowvar=False))
+
+
+def test_estimates_of_earlier_windows(prices):
+    provider = CovarianceProvider()
+    panel = make_panel(prices)
+    values = panel.monthly_values
+    estimate = provider.estimate(panel, 24, 'ledoit_wolf', end=40)
+    np.testing.assert_allclose(estimate.cov, ESTIMATORS['ledoit_wolf'](values[16:40]))
+    np.testing.assert_allclose(estimate.mean, values[16:40].mean(axis=0))
+    assert provider.estimate(panel, 24, 'ledoit_wolf', end=40) is estimate
+    assert provider.estimate(panel, 24, 'ledoit_wolf') is not estimate
+
+
+def test_weight_schedule_uses_provider(db_dir, prices, monkeypatch):
+    for i, symbol in enumerate(SYMBOLS):
+        save_price_data_to_db(symbol, prices(1200, seed=i), silent=True)
+    optimizer = PortfolioOptimizer('test')
+    optimizer.add_stocks(SYMBOLS)
+    optimizer.set_covariance_estimator('ledoit_wolf')
+    optimizer.covariances.maxsize = 100
+    current = optimizer.covariance(24)
+    calls = []
+    estimate = optimizer.covariances.estimate
+
+    def counted(*args, **kwargs):
+        calls.append(args)
+        return estimate(*args, **kwargs)
+
+    monkeypatch.setattr(optimizer.covariances, 'estimate', counted)
+    schedule = optimizer.weight_schedule('min_variance', 24, rebalance=1)
+    assert len(calls) == len(schedule) > 0
+    # weights for the next month use the estimate of all returns
+    assert len(optimizer.covariances._estimates) == len(schedule)
+    assert optimizer.covariance(24) is current
+    np.testing.assert_allclose(schedule.sum(axis=1), 1)
+    # the schedule is the same when estimates come from the memo
+    pd.testing.assert_frame_equal(optimizer.weight_schedule('min_variance', 24, rebalance=1),
+                                  schedule)
+    assert len(optimizer.covariances._estimates) == len(schedule)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of technical indicators (analysis.indicators): functions against
+pandas and incremental updates of an IndicatorSet against a full calculation
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from analysis.indicators import IndicatorSet, sma, ema, rsi, macd, bollinger_bands
+
+
+@pytest.fixture
+def panel(prices):
+    """High, low and close prices of symbols with a late start and days
+    without trading, and market closes"""
+    frames = {symbol: prices(400, seed=i, gaps=10 * i) for i, symbol in enumerate('ABC')}
+    frames['C'] = frames['C'].iloc[150:]
+    columns = {column: pd.concat({symbol: frame[column] for symbol, frame in frames.items()},
+                                 axis=1, sort=True)
+               for column in ('high', 'low', 'close')}
+    market = prices(400, seed=9)['close']
+    return columns['high'], columns['low'], columns['close'], market
+
+
+def test_functions_match_pandas(panel):
+    close = panel[2]['A']
+    pd.testing.assert_series_equal(sma(close, 20), close.rolling(20).mean())
+    pd.testing.assert_series_equal(ema(close, 20), close.ewm(span=20, adjust=False).mean())
+    changes = close.diff()
+    gains = changes.clip(lower=0).ewm(alpha=1/14, adjust=False).mean()
+    losses = (-changes).clip(lower=0).ewm(alpha=1/14, adjust=False).mean()
+    pd.testing.assert_series_equal(rsi(close), 100 * gains / (gains + losses))
+    line = close.ewm(span=12, adjust=False).mean() - close.ewm(span=26, adjust=False).mean()
+    pd.testing.assert_series_equal(macd(close)[0], line)
+    pd.testing.assert_series_equal(macd(close)[1], line.ewm(span=9, adjust=False).mean())
+    _, upper, _ = bollinger_bands(close)
+    pd.testing.assert_series_equal(upper, close.rolling(20).mean() + 2 * close.rolling(20).std())
+
+
+def test_compute_matches_functions(panel):
+    high, low, close, market = panel
+    frame = IndicatorSet(sma_windows=(5, 20)).compute(high, low, close, market)
+    filled = close.ffill()
+    pd.testing.assert_frame_equal(frame['sma_20'], sma(filled, 20), check_names=False)
+    pd.testing.assert_frame_equal(frame['rsi_14'], rsi(filled), check_names=False)
+    # dates before the first price of a symbol stay NaN
+    first = close['C'].first_valid_index()
+    assert frame['ema_20']['C'][:first].iloc[:-1].isnull().all()
+    assert frame['ema_20']['C'][first:].notnull().all()
+
+
+def test_updates_after_restore_match_compute(panel, tmp_path):
+    high, low, close, market = panel
+    params = dict(sma_windows=(5, 20), beta_window=60, refresh=7)
+    full = IndicatorSet(**params).compute(high, low, close, market)
+    n = 300
+    indicators = IndicatorSet(**params)
+    indicators.compute(high.iloc[:n], low.iloc[:n], close.iloc[:n], market)
+    indicators.save(str(tmp_path / 'indicators.pkl'))
+    indicators = IndicatorSet.restore(str(tmp_path / 'indicators.pkl'))
+    market = market.reindex(close.index).ffill()
+    for date in close.index[n:]:
+        values = indicators.update(date, high.loc[date], low.loc[date], close.loc[date],
+                                   market.loc[date])
+        np.testing.assert_allclose(values.values, full.loc[date].values, rtol=1e-9,
+                                   atol=1e-9, equal_nan=True)
+    pd.testing.assert_frame_equal(indicators.latest(),
+                                  full.iloc[-1].unstack('indicator')[indicators.names()],
+                                  check_names=False)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the resumable history download job (data.jobs)
+"""
+
+import requests
+from data import jobs
+from data.jobs import HistoryDownloadJob
+from data.storage import read_price_data_from_db
+
+
+def test_transient_failures_are_retried(db_dir, prices, monkeypatch):
+    calls = {}
+
+    def download(symbol):
+        calls[symbol] = calls.get(symbol, 0) + 1
+        if symbol == 'NET' and calls[symbol] < 3:
+            raise requests.ConnectionError('connection reset')
+        if symbol == 'DOWN':
+            raise requests.Timeout('read timeout')
+        if symbol == 'BAD':
+            raise KeyError('unexpected data')
+        return prices(10)
+
+    monkeypatch.setattr(jobs, 'download_historical_prices', download)
+    symbols = ['NET', 'DOWN', 'BAD', 'OK']
+    job = HistoryDownloadJob(symbols, workers=2, max_attempts=3)
+    assert sorted(job.run()) == ['OK']
+    status = job.checkpoint()['status']
+    assert status.to_dict() == {'NET': 'failed', 'DOWN': 'failed', 'BAD': 'error', 'OK': 'done'}
+    # transient failures are retried without retry_failed, errors are not
+    assert job.run() == []
+    assert job.run() == ['NET']
+    checkpoint = job.checkpoint()
+    assert checkpoint.loc['NET', 'status'] == 'done'
+    assert checkpoint.loc['DOWN', 'attempts'] == 3
+    assert len(read_price_data_from_db('NET')) == 10
+    # after max_attempts failures in a row the symbol is skipped
+    job.run()
+    assert calls == {'NET': 3, 'DOWN': 3, 'BAD': 1, 'OK': 1}
+    # retry_failed tries all symbols that are not done again
+    HistoryDownloadJob(symbols, retry_failed=True).run()
+    assert calls == {'NET': 3, 'DOWN': 4, 'BAD': 2, 'OK': 1}
+
+
+def test_rate_limit_stops_job(db_dir, prices, monkeypatch):
+    monkeypatch.setattr(jobs, 'download_historical_prices',
+                        lambda symbol: [] if symbol == 'LIMIT' else prices(5))
+    job = HistoryDownloadJob(['LIMIT'] + ['S{}'.format(i) for i in range(10)], workers=1)
+    downloaded = job.run()
+    assert len(downloaded) < 10
+    assert job.checkpoint().loc['LIMIT', 'status'] == 'rate_limited'
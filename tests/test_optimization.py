@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of mean-variance optimization (analysis.optimization)
+"""
+
+import numpy as np
+import pytest
+from analysis.optimization import weight_bounds, min_variance_weights, max_sharpe_weights
+from analysis.optimization import max_return_weights, target_return_weights
+from analysis.optimization import efficient_frontier
+from analysis.portfolios import random_weights, portfolio_stats
+
+
+@pytest.fixture
+def stats():
+    """Monthly mean returns and covariance matrix of 5 assets"""
+    rng = np.random.default_rng(3)
+    returns = rng.normal(0.01, 0.05, (60, 5)) + rng.normal(0, 0.03, (60, 1))
+    returns[:, 0] += 0.01
+    return returns.mean(axis=0), np.cov(returns, rowvar=False)
+
+
+def assert_feasible(w, bounds):
+    assert w.sum() == pytest.approx(1, abs=1e-8)
+    for weight, (low, high) in zip(w, bounds):
+        assert low - 1e-8 <= weight <= high + 1e-8
+
+
+def test_weights_sum_to_one_within_bounds(stats):
+    mean, cov = stats
+    symbols = list('ABCDE')
+    for bounds in [(0, 1), (0.05, 0.4), {'A': (0, 0.1), 'B': (0.2, 0.5)}]:
+        b = weight_bounds(bounds, symbols)
+        assert_feasible(min_variance_weights(mean, cov, b), b)
+        assert_feasible(max_sharpe_weights(mean, cov, b), b)
+        assert_feasible(max_return_weights(mean, b), b)
+    b = weight_bounds((0, 0.3), symbols)
+    assert max_sharpe_weights(mean, cov, b)[0] == pytest.approx(0.3, abs=1e-6)
+
+
+def test_max_sharpe_beats_random_portfolios(stats):
+    mean, cov = stats
+    b = weight_bounds((0, 1), list('ABCDE'))
+    means, stds = portfolio_stats(random_weights(20000, 5, np.random.default_rng(0)), mean, cov)
+    w = max_sharpe_weights(mean, cov, b, risk_free=0.001)
+    best_mean, best_std = portfolio_stats(w, mean, cov)
+    assert (best_mean[0] - 0.001) / best_std[0] >= ((means - 0.001) / stds).max()
+    w_min = min_variance_weights(mean, cov, b)
+    assert portfolio_stats(w_min, mean, cov)[1][0] <= stds.min()
+
+
+def test_frontier_is_monotone(stats):
+    mean, cov = stats
+    b = weight_bounds((0, 1), list('ABCDE'))
+    frontier = efficient_frontier(mean, cov, b, n_points=20)
+    for w in frontier:
+        assert_feasible(w, b)
+    means, stds = portfolio_stats(frontier, mean, cov)
+    assert np.all(np.diff(means) > 0)
+    assert np.all(np.diff(stds) >= -1e-10)
+    # a point solved on its own (without warm start) has the same risk
+    w = target_return_weights(mean, cov, means[10], b)
+    assert portfolio_stats(w, mean, cov)[1][0] == pytest.approx(stds[10], rel=1e-6)
+
+
+def test_infeasible_target_raises(stats):
+    mean, cov = stats
+    b = weight_bounds((0, 1), list('ABCDE'))
+    with pytest.raises(ValueError):
+        target_return_weights(mean, cov, mean.max() + 0.01, b)
+    with pytest.raises(ValueError):
+        min_variance_weights(mean, cov, weight_bounds((0, 0.1), list('ABCDE')))
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of missing data policies and versions of ReturnsPanel (analysis.panel)
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from analysis.panel import ReturnsPanel
+
+
+G = np.log(1.1)
+DATES = pd.DatetimeIndex(['2026-01-29', '2026-01-30', '2026-02-02', '2026-02-03',
+                          '2026-03-02'], name='date')
+
+
+@pytest.fixture
+def prices():
+    """A trades on 4 of 5 days, B starts later and skips a day, every
+    observed price is 10% above the previous one of the same symbol"""
+    return pd.DataFrame({'A': [100, 110, np.nan, 121, 133.1],
+                         'B': [np.nan, 50, 55, np.nan, 60.5]}, index=DATES)
+
+
+def test_drop(prices):
+    panel = ReturnsPanel(prices, 'drop')
+    # returns span the dropped days
+    assert list(panel.index) == [DATES[4]]
+    np.testing.assert_allclose(panel.values, [[np.log(133.1/110), np.log(60.5/50)]])
+    assert list(panel.monthly_index) == [pd.Timestamp('2026-03-01')]
+
+
+def test_ffill(prices):
+    panel = ReturnsPanel(prices, 'ffill')
+    # the first return of B is missing, days without trading have zero returns
+    assert list(panel.index) == list(DATES[2:])
+    np.testing.assert_allclose(panel.values, [[0, G], [G, 0], [G, G]])
+    np.testing.assert_allclose(panel.monthly_values, [[G, G], [G, G]])
+
+
+def test_pairwise(prices):
+    panel = ReturnsPanel(prices, 'pairwise')
+    assert list(panel.index) == list(DATES[1:])
+    np.testing.assert_allclose(panel.values, [[G, np.nan], [np.nan, G], [G, np.nan], [G, G]])
+    assert list(panel.monthly_index) == list(pd.to_datetime(['2026-01-01', '2026-02-01',
+                                                             '2026-03-01']))
+    np.testing.assert_allclose(panel.monthly_values, [[G, np.nan], [G, G], [G, G]])
+    mean, cov = panel.stats(monthly=False)
+    np.testing.assert_allclose(mean, panel.returns.mean())
+    np.testing.assert_allclose(cov, panel.returns.cov(), equal_nan=True)
+    # statistics of earlier rows
+    mean, _ = panel.stats(2, monthly=False, end=3)
+    np.testing.assert_allclose(mean, [G, G])
+
+
+def test_unknown_policy(prices):
+    with pytest.raises(ValueError):
+        ReturnsPanel(prices, 'interpolate')
+
+
+def test_version(prices):
+    version = ReturnsPanel(prices).version
+    assert ReturnsPanel(prices.copy()).version == version
+    changed = prices.copy()
+    changed.iloc[1, 0] = 111
+    assert ReturnsPanel(changed).version != version
+    assert ReturnsPanel(prices.rename(columns={'B': 'C'})).version != version
+    shifted = prices.set_axis(DATES + pd.Timedelta(days=1))
+    assert ReturnsPanel(shifted).version != version
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of page parsers (data.parsing) on the benchmark fixtures: both backends
+have to give the same results
+"""
+
+import os
+import pytest
+from data import parsing
+from benchmarks.parsing_benchmark import FIXTURES_DIR, PARSERS
+
+
+def parse_with(backend, parse, content):
+    default = parsing.PARSER
+    parsing.set_parser(backend)
+    try:
+        return parse(content)
+    finally:
+        parsing.set_parser(default)
+
+
+@pytest.mark.parametrize('name', sorted(PARSERS))
+def test_lxml_and_bs4_parity(name):
+    pytest.importorskip('lxml.html')
+    with open(os.path.join(FIXTURES_DIR, name + '.html'), 'rb') as f:
+        content = f.read()
+    parse = PARSERS[name][1]
+    result = parse_with('lxml', parse, content)
+    assert result
+    assert result == parse_with('bs4', parse, content)
+
+
+def test_fixture_contents():
+    def parsed(name):
+        with open(os.path.join(FIXTURES_DIR, name + '.html'), 'rb') as f:
+            return PARSERS[name][1](f.read())
+
+    assert len(parsed('stooq_symbols')) == 150
+    assert parsed('stooq_symbols')[0][1] == 'SPÓŁKA000'
+    assert len(parsed('stooq_last_40')) == 40
+    quote, ranges = parsed('stooq_last_price')
+    assert quote[0] == ['Kurs', '101.50'] and ranges[1] == ['Max/Min', '102.40/99.80']
+    assert len(parsed('bankier_news_list')) == 30
+    assert parsed('bankier_last_page') == 42
+    date, header, text = parsed('bankier_article')
+    assert header == 'Spółka zwiększyła zysk i wypłaci dywidendę'
+    assert '  ' not in text and 'Czytaj także' in text
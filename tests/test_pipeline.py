@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the article harvesting pipeline (data.pipeline) with fixture pages
+served by an offline HTTP client
+"""
+
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+import pytest
+from data import web
+from data.pipeline import harvest_bankier_articles
+from data.storage import read_article_urls, read_article_sync, read_failed_article_urls
+from conftest import BANKIER_LIST_URL
+
+
+@pytest.fixture
+def concurrency(monkeypatch):
+    """Wraps the shared client so that requests take a moment and records the
+    largest number of parallel requests to every host"""
+    active = Counter()
+    largest = Counter()
+    lock = threading.Lock()
+    get = web.get
+
+    def slow_get(url, *args, **kwargs):
+        host = urlsplit(url).netloc
+        with lock:
+            active[host] += 1
+            largest[host] = max(largest[host], active[host])
+        try:
+            time.sleep(0.005)
+            return get(url, *args, **kwargs)
+        finally:
+            with lock:
+                active[host] -= 1
+
+    monkeypatch.setattr(web, 'get', slow_get)
+    return largest
+
+
+def test_harvest_saves_articles(db_dir, offline_site):
+    urls = {symbol: offline_site.add_bankier_symbol(symbol, 23, per_page=10)
+            for symbol in ('AAA', 'BBB')}
+    results, report = harvest_bankier_articles(['AAA', 'BBB'], workers=4, batch_size=10)
+    assert report.errors == []
+    assert dict(report.saved) == {'AAA': 23, 'BBB': 23}
+    for symbol in urls:
+        assert read_article_urls(symbol) == set(urls[symbol])
+
+
+def test_requests_are_limited_per_host(db_dir, offline_site, concurrency):
+    symbols = ['S{}'.format(i) for i in range(12)]
+    for symbol in symbols:
+        offline_site.add_bankier_symbol(symbol, 3, per_page=1)
+    results, report = harvest_bankier_articles(symbols, workers=8, per_host=2, save=False)
+    assert report.errors == []
+    assert sum(report.downloaded.values()) == 36
+    # list pages and articles are both limited
+    assert concurrency['www.bankier.pl'] <= 2
+
+
+def test_interrupted_listing_is_resumed(db_dir, offline_site):
+    urls = offline_site.add_bankier_symbol('AAA', 30, per_page=10)
+    # the third list page is not available - listing stops after two pages
+    offline_site.remove(BANKIER_LIST_URL.format('AAA', 3))
+    _, report = harvest_bankier_articles(['AAA'])
+    assert [stage for stage, *_ in report.errors] == ['list']
+    assert read_article_urls('AAA') == set(urls[:20])
+    assert read_article_sync(['AAA']) == {'AAA': (2, False)}
+    # new articles are published, the first page contains known urls again
+    urls = offline_site.add_bankier_symbol('AAA', 35, per_page=10)
+    _, report = harvest_bankier_articles(['AAA'], {'AAA': read_article_urls('AAA')})
+    assert report.errors == []
+    assert read_article_urls('AAA') == set(urls)
+    assert read_article_sync(['AAA']) == {'AAA': (4, True)}
+    # complete history - paging stops at the first known url
+    urls = offline_site.add_bankier_symbol('AAA', 37, per_page=10)
+    _, report = harvest_bankier_articles(['AAA'], {'AAA': read_article_urls('AAA')})
+    assert dict(report.listed) == {'AAA': 2}
+    assert read_article_urls('AAA') == set(urls)
+
+
+def test_failed_articles_are_retried(db_dir, offline_site):
+    urls = offline_site.add_bankier_symbol('AAA', 5)
+    offline_site.remove(urls[1])
+    offline_site.remove(urls[3])
+    _, report = harvest_bankier_articles(['AAA'])
+    assert sorted(error[2] for error in report.errors) == sorted([urls[1], urls[3]])
+    assert sorted(read_failed_article_urls(['AAA'])['AAA']) == sorted([urls[1], urls[3]])
+    # one of the articles is available again - it's downloaded although
+    # the list of articles stops at known urls
+    offline_site.add_bankier_symbol('AAA', 5)
+    offline_site.remove(urls[3])
+    _, report = harvest_bankier_articles(['AAA'], {'AAA': read_article_urls('AAA')})
+    assert read_article_urls('AAA') == set(urls) - {urls[3]}
+    assert read_failed_article_urls(['AAA']) == {'AAA': [urls[3]]}
+    # after max_attempts failures the article is given up
+    harvest_bankier_articles(['AAA'], {'AAA': read_article_urls('AAA')}, max_attempts=3)
+    assert read_failed_article_urls(['AAA'], max_attempts=3) == {}
+    offline_site.add_bankier_symbol('AAA', 5)
+    _, report = harvest_bankier_articles(['AAA'], {'AAA': read_article_urls('AAA')})
+    assert sum(report.downloaded.values()) == 0
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of reading prices of many symbols at once (data.storage.read_price_panel)
+from price tables and from the consolidated prices table
+"""
+
+import pandas as pd
+import pytest
+from analysis import panel as panel_module
+from analysis.panel import ReturnsPanel
+from core import PortfolioOptimizer
+from data import storage
+from data.storage import save_price_data_to_db, read_price_data_from_db, read_price_panel
+from data.storage import migrate_to_consolidated_prices
+
+
+SYMBOLS = ['AAA', 'BBB', 'CCC']
+
+
+@pytest.fixture
+def stored(db_dir, prices):
+    """Price tables of symbols with different dates"""
+    for i, symbol in enumerate(SYMBOLS):
+        save_price_data_to_db(symbol, prices(200 - 30 * i, seed=i, gaps=5 * i), silent=True)
+
+
+def per_symbol(symbols, column='close'):
+    frame = pd.concat({symbol: read_price_data_from_db(symbol)[column] for symbol in symbols},
+                      axis=1, sort=True)
+    frame.index.name = 'date'
+    return frame
+
+
+def test_read_price_panel_matches_per_symbol_reads(stored):
+    expected = per_symbol(SYMBOLS)
+    from_tables = read_price_panel(SYMBOLS)
+    pd.testing.assert_frame_equal(from_tables, expected, check_freq=False)
+    migrate_to_consolidated_prices(silent=True)
+    assert storage.get_storage('price_data').table_exists('prices')
+    pd.testing.assert_frame_equal(read_price_panel(SYMBOLS), expected, check_freq=False)
+    # a range of dates and many columns
+    both = read_price_panel(['BBB', 'AAA'], start='2026-08-01', column=['close', 'volume'])
+    pd.testing.assert_frame_equal(both['volume'], per_symbol(['BBB', 'AAA'], 'volume')
+                                  .loc['2026-08-01':], check_freq=False, check_names=False)
+
+
+def test_missing_symbols_raise_on_both_paths(stored):
+    with pytest.raises(ValueError, match='XXX'):
+        read_price_panel(['AAA', 'XXX'])
+    with pytest.raises(ValueError, match='XXX'):
+        ReturnsPanel.load(['AAA', 'XXX'])
+    migrate_to_consolidated_prices(silent=True)
+    with pytest.raises(ValueError, match='XXX'):
+        read_price_panel(['AAA', 'XXX'])
+    with pytest.raises(ValueError, match='XXX'):
+        ReturnsPanel.load(['AAA', 'XXX'])
+
+
+def test_add_stocks_reads_consolidated_prices(stored, monkeypatch):
+    cached = ReturnsPanel.load(SYMBOLS, 'pairwise')
+    migrate_to_consolidated_prices(silent=True)
+    calls = []
+    read = panel_module.read_price_panel
+    monkeypatch.setattr(panel_module, 'read_price_panel',
+                        lambda *args, **kwargs: calls.append(args) or read(*args, **kwargs))
+    optimizer = PortfolioOptimizer('test')
+    optimizer.add_stocks(SYMBOLS, missing='pairwise')
+    assert len(calls) == 1
+    pd.testing.assert_frame_equal(optimizer.returns, cached.returns, check_freq=False)
+    assert optimizer.panel.version == cached.version
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of incremental returns of PriceSeries (core.PriceSeries.add_new_prices)
+against a full recalculation
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import core
+from core import PriceSeries
+from data.storage import save_price_data_to_db, read_price_versions
+
+
+COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+
+@pytest.fixture
+def history(db_dir, prices):
+    data = prices(300)
+    save_price_data_to_db('AAA', data.iloc[:250], silent=True)
+    return data
+
+
+def assert_full_recalculation(px):
+    returns = px.data['log_return'].copy()
+    monthly_returns = px.monthly_returns.copy()
+    px.add_returns()
+    px.add_monthly_returns()
+    pd.testing.assert_series_equal(returns, px.data['log_return'], rtol=0, atol=1e-12)
+    pd.testing.assert_series_equal(monthly_returns, px.monthly_returns, rtol=0, atol=1e-12)
+    assert not px.data['log_return'].isnull().any()
+
+
+def test_appended_rows(history):
+    px = PriceSeries('AAA')
+    px.add_new_prices(history.iloc[250:251][COLUMNS])
+    assert_full_recalculation(px)
+    # rows spanning new months
+    px.add_new_prices(history.iloc[251:][COLUMNS])
+    assert len(px.data) == len(history)
+    assert px.monthly_returns.index[-1] == pd.Timestamp('2026-10-01')
+    assert_full_recalculation(px)
+    expected = np.log(history['close']).diff().fillna(0)
+    np.testing.assert_allclose(px.data['log_return'], expected, atol=1e-12)
+
+
+def test_missing_close(history):
+    px = PriceSeries('AAA')
+    new_rows = history.iloc[250:260][COLUMNS].copy()
+    new_rows.iloc[3, new_rows.columns.get_loc('close')] = np.nan
+    px.add_new_prices(new_rows)
+    # returns next to the missing close are 0
+    assert (px.data['log_return'].iloc[253:255] == 0).all()
+    assert px.data['log_return'].iloc[255] != 0
+    assert_full_recalculation(px)
+    # the incremental result passes the check against a full recalculation
+    px.add_new_prices(history.iloc[260:][COLUMNS], verify=True)
+
+
+def test_row_inserted_mid_history(history):
+    # a day missing in the stored history, e.g. downloaded later
+    stored = history.iloc[:250].drop(history.index[100])
+    save_price_data_to_db('AAA', stored, silent=True, mode='rebuild')
+    px = PriceSeries('AAA')
+    assert len(px.data) == 249
+    px.add_new_prices(history.iloc[[100]][COLUMNS])
+    assert px.data.index.is_monotonic_increasing
+    assert_full_recalculation(px)
+    np.testing.assert_allclose(px.data['log_return'],
+                               np.log(history['close'].iloc[:250]).diff().fillna(0),
+                               atol=1e-12)
+
+
+def test_verify_detects_stale_returns(history):
+    px = PriceSeries('AAA')
+    # a corrupted return in the month of new prices is not recalculated
+    px.data.iloc[-1, px.data.columns.get_loc('log_return')] += 0.1
+    px.monthly_returns.iloc[-1] += 0.1
+    with pytest.raises(ValueError):
+        px.add_new_prices(history.iloc[250:251][COLUMNS], verify=True)
+
+
+def test_update_without_new_rows(history, monkeypatch):
+    px = PriceSeries('AAA')
+    version = read_price_versions(['AAA'])['AAA']
+    # the last downloaded price is already stored
+    monkeypatch.setattr(core, 'download_last_price',
+                        lambda symbol: history.iloc[249:250][COLUMNS])
+    px.update_prices(date_offset=0)
+    assert read_price_versions(['AAA'])['AAA'] == version
+    assert len(px.data) == 250
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of value at risk and conditional value at risk (analysis.risk) against
+a direct calculation of every window
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import norm
+from analysis.risk import rolling_var_cvar, var_cvar
+
+
+LEVELS = (0.9, 0.99)
+
+
+@pytest.fixture
+def returns():
+    """Returns of symbols with gaps, a late listing and too few observations"""
+    rng = np.random.default_rng(11)
+    index = pd.bdate_range(end='2026-10-16', periods=120)
+    data = pd.DataFrame(rng.standard_t(4, (120, 4)) * 0.02, index=index,
+                        columns=['A', 'B', 'C', 'D'])
+    data.iloc[::7, 0] = np.nan
+    data.iloc[:70, 1] = np.nan
+    data.iloc[:100, 2] = np.nan
+    data.iloc[50:55, 3] = np.nan
+    return data
+
+
+def measures(window, level, method):
+    """VaR and CVaR of one window of observations"""
+    if method == 'historical':
+        k = max(int(np.ceil((1 - level) * len(window))), 1)
+        worst = np.sort(window)[:k]
+        return -worst[-1], -worst.mean()
+    mean, std = window.mean(), window.std(ddof=1)
+    u = norm.ppf(1 - level)
+    return -(mean + u * std), -(mean - std * norm.pdf(u) / (1 - level))
+
+
+def brute_force(data, window, method):
+    """Rolling measures calculated separately for every symbol and window"""
+    expected = {}
+    for symbol in data:
+        observed = data[symbol].dropna()
+        for level in LEVELS:
+            var = pd.Series(np.nan, index=data.index)
+            cvar = pd.Series(np.nan, index=data.index)
+            for end in range(window, len(observed)+1):
+                date = observed.index[end-1]
+                var[date], cvar[date] = measures(observed.values[end-window:end], level,
+                                                 method)
+            expected[('VaR', level, symbol)] = var
+            expected[('CVaR', level, symbol)] = cvar
+    return pd.DataFrame(expected)
+
+
+@pytest.mark.parametrize('method, window', [('historical', 1), ('historical', 7),
+                                            ('historical', 30), ('parametric', 7),
+                                            ('parametric', 30)])
+def test_rolling_measures_of_every_window(returns, method, window):
+    result = rolling_var_cvar(returns, window, LEVELS, method)
+    expected = brute_force(returns, window, method)
+    for column in expected:
+        np.testing.assert_allclose(result[column], expected[column], rtol=1e-9, atol=1e-12,
+                                   err_msg=str(column))
+
+
+@pytest.mark.parametrize('method', ['historical', 'parametric'])
+def test_windows_with_fewer_observations(returns, method):
+    # C has only 20 returns, dates before the window fills are NaN
+    result = rolling_var_cvar(returns, 30, LEVELS, method)
+    assert result[('VaR', 0.9, 'C')].isna().all()
+    assert result[('CVaR', 0.99, 'C')].isna().all()
+    first = returns['B'].dropna().index[29]
+    assert result.loc[:first, ('VaR', 0.9, 'B')].isna().sum() == len(result.loc[:first]) - 1
+    # a window longer than the whole history
+    result = rolling_var_cvar(returns, 200, LEVELS, method)
+    assert result.isna().all().all()
+
+
+@pytest.mark.parametrize('method', ['historical', 'parametric'])
+def test_whole_sample(returns, method):
+    result = var_cvar(returns, LEVELS, method)
+    for symbol in returns:
+        for level in LEVELS:
+            var, cvar = measures(returns[symbol].dropna().values, level, method)
+            assert result.loc[symbol, ('VaR', level)] == pytest.approx(var)
+            assert result.loc[symbol, ('CVaR', level)] == pytest.approx(cvar)
+
+
+def test_series_and_unknown_method(returns):
+    series = returns['A'].rename('A')
+    result = rolling_var_cvar(series, 10, LEVELS)
+    pd.testing.assert_frame_equal(result, rolling_var_cvar(returns[['A']], 10, LEVELS))
+    with pytest.raises(ValueError):
+        rolling_var_cvar(returns, 10, method='gaussian')
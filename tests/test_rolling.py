@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of rolling statistics of panels of returns (analysis.rolling)
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from analysis.rolling import ewma_volatility, weighted_rolling_std, decay_weights
+
+
+@pytest.fixture
+def returns():
+    rng = np.random.default_rng(5)
+    index = pd.bdate_range(end='2026-10-16', periods=300)
+    data = pd.DataFrame(rng.normal(0, 0.02, (300, 3)), index=index, columns=['A', 'B', 'C'])
+    data.iloc[:40, 1] = np.nan
+    data.iloc[100, 2] = np.nan
+    return data
+
+
+def test_ewma_volatility_recursion(returns):
+    lam = 0.94
+    result = ewma_volatility(returns, lam)
+    for symbol in returns:
+        column = returns[symbol]
+        first = column.first_valid_index()
+        assert result[symbol][:first].iloc[:-1].isnull().all()
+        values = column[first:].fillna(0).values
+        variance = values[0]**2
+        expected = [variance]
+        for r in values[1:]:
+            variance = lam * variance + (1 - lam) * r**2
+            expected.append(variance)
+        np.testing.assert_allclose(result[symbol][first:], np.sqrt(expected), rtol=1e-12)
+
+
+def test_ewma_volatility_has_no_look_ahead(returns):
+    result = ewma_volatility(returns)
+    changed = returns.copy()
+    changed.iloc[10:] *= 3
+    np.testing.assert_array_equal(ewma_volatility(changed).iloc[:10], result.iloc[:10])
+    warm_up = ewma_volatility(returns['A'], min_periods=21)
+    assert warm_up.iloc[:20].isnull().all()
+    np.testing.assert_allclose(warm_up.iloc[20:], result['A'].iloc[20:])
+
+
+@pytest.mark.parametrize('decay', ['lin', 'exp', [1, 1, 2, 2, 4, 4, 8, 8, 16, 16]])
+def test_weighted_rolling_std(returns, decay):
+    window = 10
+    result = weighted_rolling_std(returns, window, decay, lam=0.9)
+    weights = decay_weights(window, decay, lam=0.9)
+    for symbol in returns:
+        values = returns[symbol].values
+        expected = np.full(len(values), np.nan)
+        for end in range(window, len(values) + 1):
+            x = values[end-window:end]
+            if np.isnan(x).any():
+                continue
+            mean = weights @ x
+            expected[end-1] = np.sqrt(weights @ (x - mean)**2 / (1 - (weights**2).sum()))
+        np.testing.assert_allclose(result[symbol].values, expected, rtol=1e-8, atol=1e-12)
+    # equal weights give the sample standard deviation
+    equal = weighted_rolling_std(returns, window, np.ones(window))
+    pd.testing.assert_frame_equal(equal, returns.rolling(window).std(), check_exact=False,
+                                  rtol=1e-8)
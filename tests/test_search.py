@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the full-text search of articles (data.storage.search_articles)
+"""
+
+from data.formatting import articles_to_frame, light_stem
+from data.storage import save_articles_to_db, search_articles, _fts_query
+
+
+def save_articles(symbol, articles):
+    rows = [[date, header, content, 'https://www.bankier.pl/wiadomosc/{}-{}.html'.format(symbol, i)]
+            for i, (date, header, content) in enumerate(articles)]
+    save_articles_to_db(articles_to_frame(rows), symbol, silent=True)
+
+
+def test_light_stem():
+    for word in ('dywidenda', 'dywidendy', 'dywidendę', 'dywidendami', 'dywidendach'):
+        assert light_stem(word) == 'dywidend'
+    assert light_stem('zysk') == 'zysk'
+    assert light_stem('akcje') == 'akcj'
+
+
+def test_query_syntax():
+    assert _fts_query('Dywidenda') == '("dywidenda" OR "dywidend"*)'
+    assert _fts_query('dywid*') == '"dywid"*'
+    assert _fts_query('kgh') == '"kgh"'
+
+
+def test_inflected_forms_match(db_dir):
+    save_articles('AAA', [
+        ('2026-01-05 10:00', 'Walne zgromadzenie', 'Spółka wypłaci dywidendę w czerwcu.'),
+        ('2026-01-04 10:00', 'Wyniki kwartalne', 'Zarząd nie zarekomenduje dywidendy.'),
+        ('2026-01-03 10:00', 'Dywidenda rekordowa', 'Akcjonariusze dostaną pieniądze.'),
+        ('2026-01-02 10:00', 'Nowy kontrakt', 'Spółka podpisała umowę z klientem.'),
+    ])
+    hits = search_articles('dywidenda')
+    assert len(hits) == 3
+    assert set(hits['header']) == {'Walne zgromadzenie', 'Wyniki kwartalne',
+                                   'Dywidenda rekordowa'}
+    assert len(search_articles('dywidendy')) == 3
+    # all words have to be found
+    assert list(search_articles('dywidenda spółki')['header']) == ['Walne zgromadzenie']
+    assert search_articles('dywidenda kontrakt').empty
+
+
+def test_ranking(db_dir):
+    save_articles('AAA', [
+        ('2026-01-05 10:00', 'Wyniki kwartalne', 'Zarząd rozważa wypłatę dywidendy.'),
+        ('2026-01-04 10:00', 'Dywidendy w tym roku', 'Zarząd przedstawił plany.'),
+        ('2026-01-03 10:00', 'Walne zgromadzenie', 'Zarząd proponuje, aby dywidenda wyniosła '
+                                                   '2 zł. Dywidenda będzie rekordowa.'),
+    ])
+    save_articles('BBB', [
+        ('2026-01-02 10:00', 'Kontrakt', 'Spółka nie wypłaci dywidendy.'),
+    ])
+    hits = search_articles('dywidenda', symbols=['AAA'])
+    # exact forms rank higher than other inflected forms
+    assert hits['header'].iloc[0] == 'Walne zgromadzenie'
+    # a match in the header ranks higher than the same match in the content
+    assert list(hits['header'].iloc[1:]) == ['Dywidendy w tym roku', 'Wyniki kwartalne']
+    assert hits['rank'].is_monotonic_increasing
+    hits = search_articles('dywidendy', until='2026-01-04 23:00')
+    assert set(hits['symbol']) == {'AAA', 'BBB'}
+    assert len(hits) == 3
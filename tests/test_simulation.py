@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of Monte-Carlo simulations of portfolios (analysis.simulation)
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from analysis.simulation import simulate_portfolio
+
+
+@pytest.fixture
+def history():
+    """Monthly log returns of 3 correlated assets"""
+    rng = np.random.default_rng(2)
+    returns = rng.normal(0.008, 0.04, (120, 3)) + rng.normal(0, 0.03, (120, 1))
+    returns[:5, 2] = np.nan
+    return pd.DataFrame(returns, columns=['A', 'B', 'C'])
+
+
+@pytest.mark.parametrize('method', ['normal', 't', 'bootstrap'])
+def test_same_seed_gives_same_results_in_any_number_of_processes(history, method):
+    params = dict(n_paths=2500, horizon=6, method=method, batch_size=1000, seed=7)
+    weights = [0.5, 0.3, 0.2]
+    single = simulate_portfolio(history, weights, processes=1, **params)
+    pool = simulate_portfolio(history, weights, processes=2, **params)
+    np.testing.assert_array_equal(single.returns, pool.returns)
+    np.testing.assert_array_equal(single.drawdowns, pool.drawdowns)
+    pd.testing.assert_frame_equal(single.mean_path, pool.mean_path)
+    other = simulate_portfolio(history, weights, processes=1, **dict(params, seed=8))
+    assert not np.array_equal(single.returns, other.returns)
+
+
+@pytest.mark.parametrize('method', ['normal', 't'])
+def test_distribution_of_paths(method):
+    mean, std, horizon = 0.01, 0.05, 12
+    result = simulate_portfolio(np.zeros((10, 1)), [1], n_paths=40000, horizon=horizon,
+                                method=method, batch_size=15000, processes=1, seed=1,
+                                mean=[mean], factor=[[std]])
+    assert result.returns.shape == (40000,)
+    assert result.drawdowns.shape == (40000,)
+    assert ((result.drawdowns >= 0) & (result.drawdowns < 1)).all()
+    # cumulative log returns of one asset are sums of independent returns
+    path = result.mean_path
+    assert list(path.index) == list(range(1, horizon+1))
+    steps = np.arange(1, horizon+1)
+    np.testing.assert_allclose(path['mean'], mean * steps, atol=0.002)
+    np.testing.assert_allclose(path['std'], std * np.sqrt(steps), rtol=0.03)
+    np.testing.assert_allclose(np.log1p(result.returns).mean(), mean * horizon, atol=0.002)
+    summ = result.summary()
+    assert summ['n_paths'] == 40000
+    assert summ['VaR_0.99'] > summ['VaR_0.95']
+    assert summ['CVaR_0.95'] > summ['VaR_0.95']
+    assert summ['worst_max_drawdown'] >= summ['median_max_drawdown']
+
+
+def test_bootstrap_of_the_whole_history():
+    # blocks as long as history can only start at its beginning
+    returns = np.log1p(np.array([[0.1, -0.05], [-0.2, 0.1], [0.05, 0.0]]))
+    held = simulate_portfolio(returns, [0.5, 0.5], n_paths=10, horizon=3, method='bootstrap',
+                              block_size=3, rebalance=False, processes=1, seed=0)
+    values = 0.5 * np.prod(np.exp(returns), axis=0)
+    np.testing.assert_allclose(held.returns, values.sum() - 1)
+    rebalanced = simulate_portfolio(returns, [0.5, 0.5], n_paths=10, horizon=3,
+                                    method='bootstrap', block_size=3, processes=1, seed=0)
+    np.testing.assert_allclose(rebalanced.returns, np.prod(1 + np.expm1(returns).mean(axis=1)) - 1)
+    # the worst drawdown is the second period loss of the rebalanced portfolio
+    np.testing.assert_allclose(rebalanced.drawdowns, 0.05)
+
+
+def test_invalid_parameters(history):
+    with pytest.raises(ValueError):
+        simulate_portfolio(history, [1/3]*3, method='garch')
+    with pytest.raises(ValueError):
+        simulate_portfolio(history, [1/3]*3, method='t', df=2)
+    with pytest.raises(ValueError):
+        simulate_portfolio(history.iloc[:8], [1/3]*3, method='bootstrap', block_size=6)
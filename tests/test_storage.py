@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the shared SQLite storage layer (data.storage)
+"""
+
+import os
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+from data.storage import SQLiteStorage, get_storage, save_price_data_to_db
+from data.storage import read_price_data_from_db
+
+
+def test_connection_per_thread(db_dir):
+    db = SQLiteStorage(str(db_dir / 'test.db'))
+    main = db.connection
+    assert db.connection is main
+    connections = []
+
+    def worker():
+        connections.append(db.connection)
+        connections.append(db.connection)
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # the same connection within a thread, a different one in every thread
+    assert all(connections[i] is connections[i+1] for i in range(0, 6, 2))
+    assert len({id(conn) for conn in connections + [main]}) == 4
+    db.close()
+
+
+def test_get_storage_is_shared(db_dir):
+    assert get_storage('price_data') is get_storage('price_data')
+    assert get_storage('price_data').path == os.path.join(str(db_dir), 'price_data.db')
+
+
+def _count(db, table='t'):
+    return db.connection.execute('SELECT COUNT(*) FROM "{}"'.format(table)).fetchone()[0]
+
+
+def test_nested_transaction_rollback(db_dir):
+    db = SQLiteStorage(str(db_dir / 'test.db'))
+    db.connection.execute('CREATE TABLE t (x INTEGER)')
+    with pytest.raises(RuntimeError):
+        with db.transaction() as conn:
+            conn.execute('INSERT INTO t VALUES (1)')
+            with db.transaction() as inner:
+                inner.execute('INSERT INTO t VALUES (2)')
+            raise RuntimeError
+    # the inner transaction is a part of the outer one - nothing is saved
+    assert _count(db) == 0
+    # an error raised in the inner transaction rolls back the whole one too
+    with pytest.raises(RuntimeError):
+        with db.transaction() as conn:
+            conn.execute('INSERT INTO t VALUES (1)')
+            with db.transaction() as inner:
+                inner.execute('INSERT INTO t VALUES (2)')
+                raise RuntimeError
+    assert _count(db) == 0
+    # the storage is usable after rollbacks
+    with db.transaction() as conn:
+        conn.execute('INSERT INTO t VALUES (3)')
+    assert _count(db) == 1
+    db.close()
+
+
+def test_nested_transaction_commits_once(db_dir):
+    db = SQLiteStorage(str(db_dir / 'test.db'))
+    db.connection.execute('CREATE TABLE t (x INTEGER)')
+    seen = []
+
+    def count_in_other_thread():
+        seen.append(_count(db))
+
+    with db.transaction() as conn:
+        with db.transaction() as inner:
+            inner.execute('INSERT INTO t VALUES (1)')
+        # the inner block has ended but nothing is committed yet
+        thread = threading.Thread(target=count_in_other_thread)
+        thread.start()
+        thread.join()
+    assert seen == [0]
+    assert _count(db) == 1
+    db.close()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+def test_fork_resets_connections(db_dir):
+    db = SQLiteStorage(str(db_dir / 'test.db'))
+    db.connection.execute('CREATE TABLE t (x INTEGER)')
+    parent = db.connection
+    pid = os.fork()
+    if pid == 0:
+        # child process - connections of the parent must not be reused
+        code = 1
+        try:
+            if db.connection is not parent:
+                with db.transaction() as conn:
+                    conn.execute('INSERT INTO t VALUES (1)')
+                code = 0
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert db.connection is parent
+    assert _count(db) == 1
+    db.close()
+
+
+def test_write_frame_replace_and_append(db_dir):
+    db = SQLiteStorage(str(db_dir / 'test.db'))
+    frame = pd.DataFrame({'a': [1.5, 2.5], 'b': ['x', None]},
+                         index=pd.DatetimeIndex(['2026-01-01', '2026-01-02'], name='date'))
+    db.write_frame('t', frame, 'date')
+    db.write_frame('t', frame, 'date', if_exists='append')
+    assert _count(db) == 4
+    db.write_frame('t', frame, 'date')
+    read = db.read_sql('SELECT * FROM t', index_col='date')
+    assert len(read) == 2
+    assert read['a'].tolist() == [1.5, 2.5]
+    assert read['b'].iloc[0] == 'x' and pd.isnull(read['b'].iloc[1])
+    db.close()
+
+
+def test_write_frame_is_part_of_transaction(db_dir):
+    db = SQLiteStorage(str(db_dir / 'test.db'))
+    frame = pd.DataFrame({'a': [1.0]}, index=pd.Index([1], name='id'))
+    db.write_frame('t', frame, 'id')
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.write_frame('t', frame, 'id', if_exists='append')
+            raise RuntimeError
+    assert _count(db) == 1
+    db.close()
+
+
+def test_price_write_modes(db_dir, prices):
+    data = prices(10)
+    save_price_data_to_db('AAA', data, silent=True)
+    changed = data.iloc[-3:] * 2
+    new = prices(12).iloc[-2:] * 3
+    new.index = new.index + pd.offsets.BDay(5)
+    # append keeps existing rows
+    save_price_data_to_db('AAA', pd.concat([changed, new]), silent=True, mode='append')
+    stored = read_price_data_from_db('AAA')
+    assert len(stored) == 12
+    np.testing.assert_allclose(stored['close'].iloc[:10], data['close'])
+    # upsert overwrites existing rows
+    save_price_data_to_db('AAA', changed, silent=True, mode='upsert')
+    stored = read_price_data_from_db('AAA')
+    assert len(stored) == 12
+    np.testing.assert_allclose(stored.loc[changed.index, 'close'], changed['close'])
+    # rebuild replaces the whole table
+    save_price_data_to_db('AAA', data.iloc[:4], silent=True, mode='rebuild')
+    stored = read_price_data_from_db('AAA')
+    pd.testing.assert_frame_equal(stored, data.iloc[:4], check_freq=False)
+    with pytest.raises(ValueError):
+        save_price_data_to_db('AAA', data, silent=True, mode='merge')
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of summaries of returns (analysis.summary) against pandas
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from analysis import summary
+from analysis.summary import summarize_returns, clear_summary_cache
+
+
+@pytest.fixture
+def returns():
+    rng = np.random.default_rng(1)
+    dates = pd.bdate_range(end='2026-10-16', periods=1400)
+    series = {}
+    for symbol, n in [('AAA', 1400), ('BBB', 800), ('CCC', 300), ('DDD', 3)]:
+        values = rng.standard_t(4, n) * 0.02 + 0.0005
+        series[symbol] = pd.Series(values, index=dates[-n:])
+    clear_summary_cache()
+    yield series
+    clear_summary_cache()
+
+
+def test_matches_pandas(returns):
+    summ = summarize_returns(returns)
+    for symbol, ret in returns.items():
+        row = summ.loc[symbol]
+        assert row['n_observations'] == len(ret)
+        assert row['ret_1d'] == pytest.approx(ret.iloc[-1])
+        for name, w in summary.WINDOWS.items():
+            expected = ret.tail(w).sum() if len(ret) >= w else np.nan
+            assert row['ret_' + name] == pytest.approx(expected, nan_ok=True)
+        for name in ['5d', '21d', '252d']:
+            w = summary.WINDOWS[name]
+            expected = ret.tail(w).std() if len(ret) >= w else np.nan
+            assert row['std_' + name] == pytest.approx(expected, nan_ok=True)
+        for name in ['252d', '3y']:
+            tail = ret.tail(summary.WINDOWS[name])
+            assert row['skew_' + name] == pytest.approx(tail.skew(), nan_ok=True)
+            assert row['kurt_' + name] == pytest.approx(tail.kurt(), nan_ok=True)
+        assert row['max_1d_ret'] == pytest.approx(ret.max())
+        assert row['n_above_3_sigma'] == (ret > ret.mean() + 3*ret.std()).sum()
+
+
+def test_memo_keeps_latest_summary_per_symbol(returns, monkeypatch):
+    summarize_returns(returns)
+    assert list(summary._summaries) == list(returns)
+    extended = returns['AAA']
+    extended = pd.concat([extended, pd.Series([0.01], index=[extended.index[-1] + pd.offsets.BDay()])])
+    summ = summarize_returns({'AAA': extended})
+    assert summ.loc['AAA', 'ret_1d'] == pytest.approx(0.01)
+    # the new summary replaced the old one
+    assert len(summary._summaries) == len(returns)
+    monkeypatch.setattr(summary, 'MAX_SUMMARIES', 2)
+    summarize_returns({'BBB': returns['BBB']})
+    assert list(summary._summaries) == ['AAA', 'BBB']
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of concurrent price updates of many symbols
+(core.PriceSeries.update_prices_for_all_stocks)
+"""
+
+import pandas as pd
+import pytest
+import requests
+import core
+from core import PriceSeries
+from data.storage import save_price_data_to_db, read_price_data_from_db
+
+
+SYMBOLS = ['S{}'.format(i) for i in range(6)]
+
+
+@pytest.fixture
+def series(db_dir, prices):
+    history = {symbol: prices(100, end='2026-10-15', seed=i) for i, symbol in enumerate(SYMBOLS)}
+    for symbol, data in history.items():
+        save_price_data_to_db(symbol, data, silent=True)
+    px = PriceSeries(SYMBOLS[0])
+    px.symbols = [(symbol, symbol) for symbol in SYMBOLS]
+    return px, history
+
+
+def test_failed_download_does_not_stop_others(series, monkeypatch):
+    px, history = series
+
+    def download_last_price(symbol):
+        if symbol == 'S3':
+            raise requests.Timeout('timed out')
+        row = history[symbol].iloc[-1:] * 1.01
+        row.index = pd.DatetimeIndex([pd.Timestamp('2026-10-16')], name='date')
+        return row
+
+    monkeypatch.setattr(core, 'download_last_price', download_last_price)
+    px.update_prices_for_all_stocks(date_offset=0, workers=3)
+    status = px.update_status['status']
+    assert status['S3'] == 'connection error'
+    assert (status.drop('S3') == 'updated').all()
+    for symbol in SYMBOLS:
+        dates = read_price_data_from_db(symbol).index
+        assert (pd.Timestamp('2026-10-16') in dates) == (symbol != 'S3')
+    assert sorted(px.downloaded) == sorted(set(SYMBOLS) - {'S3'})
+
+
+def test_prices_are_saved_when_update_is_interrupted(series, monkeypatch):
+    px, history = series
+
+    def download_last_price(symbol):
+        if symbol == 'S5':
+            raise KeyboardInterrupt
+        row = history[symbol].iloc[-1:]
+        row.index = pd.DatetimeIndex([pd.Timestamp('2026-10-16')], name='date')
+        return row
+
+    monkeypatch.setattr(core, 'download_last_price', download_last_price)
+    with pytest.raises(KeyboardInterrupt):
+        px.update_prices_for_all_stocks(date_offset=0, workers=1)
+    for symbol in SYMBOLS[:5]:
+        assert pd.Timestamp('2026-10-16') in read_price_data_from_db(symbol).index
+    assert set(px.update_status.index) == set(SYMBOLS[:5])
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the shared HTTP client (data.web) and of scraping functions that use
+it, served by a local server or by an offline client with fixture pages
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+from data.web import HTTPClient
+from data.gathering import download_bankier_article_urls, download_stooq_symbols
+from data.gathering import download_bankier_article
+from conftest import stooq_table_page
+
+
+class LocalServer():
+    """HTTP server on localhost. Responses of a path are (status, headers,
+    body) tuples returned in order (the last one is repeated), headers of
+    all requests are recorded"""
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append((self.path, dict(self.headers)))
+                responses = server.routes[self.path]
+                status, headers, body = responses.pop(0) if len(responses) > 1 else responses[0]
+                if callable(status):
+                    status, headers, body = status(self.headers)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}'.format(self.httpd.server_address[1])
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = LocalServer()
+    yield server
+    server.close()
+
+
+def test_etag_revalidation(server, tmp_path):
+    def page(headers):
+        if headers.get('If-None-Match') == '"v1"':
+            return 304, {'ETag': '"v1"'}, b''
+        return 200, {'ETag': '"v1"', 'Content-Type': 'text/html'}, b'<p>list</p>'
+
+    server.routes['/list'] = [(page, None, None)]
+    client = HTTPClient(cache_dir=str(tmp_path), backoff=0)
+    first = client.get(server.url + '/list', cache=True)
+    second = client.get(server.url + '/list', cache=True)
+    assert first.content == second.content == b'<p>list</p>'
+    assert second.status_code == 200
+    # the second request asked the server and got 304 Not Modified
+    assert len(server.requests) == 2
+    assert server.requests[1][1]['If-None-Match'] == '"v1"'
+
+
+def test_changed_page_replaces_cached_one(server, tmp_path):
+    server.routes['/list'] = [(200, {'ETag': '"v1"'}, b'old'), (200, {'ETag': '"v2"'}, b'new')]
+    client = HTTPClient(cache_dir=str(tmp_path), backoff=0)
+    assert client.get(server.url + '/list', cache=True).content == b'old'
+    assert client.get(server.url + '/list', cache=True).content == b'new'
+    assert HTTPClient(cache_dir=str(tmp_path), offline=True).get(
+        server.url + '/list').content == b'new'
+
+
+def test_retries_on_server_errors(server, tmp_path):
+    server.routes['/page'] = [(503, {}, b''), (500, {}, b''), (200, {}, b'ok')]
+    client = HTTPClient(cache_dir=str(tmp_path), retries=3, backoff=0)
+    response = client.get(server.url + '/page')
+    assert response.status_code == 200
+    assert response.content == b'ok'
+    assert len(server.requests) == 3
+    # retries are limited
+    server.routes['/down'] = [(503, {}, b'')]
+    response = HTTPClient(cache_dir=str(tmp_path), retries=2, backoff=0).get(server.url + '/down')
+    assert response.status_code == 503
+    assert len(server.requests) == 3 + 3
+
+
+def test_record_and_replay_offline(server, tmp_path):
+    server.routes['/page'] = [(200, {'Content-Type': 'text/html'}, b'recorded')]
+    HTTPClient(cache_dir=str(tmp_path), record=True).get(server.url + '/page')
+    offline = HTTPClient(cache_dir=str(tmp_path), offline=True)
+    assert offline.get(server.url + '/page').content == b'recorded'
+    assert len(server.requests) == 1
+    with pytest.raises(requests.ConnectionError):
+        offline.get(server.url + '/other')
+
+
+def test_bankier_scraping_offline(offline_site):
+    urls = offline_site.add_bankier_symbol('ABC', 25, per_page=10)
+    assert download_bankier_article_urls('ABC') == urls
+    date, header, content, url = download_bankier_article(urls[0])
+    assert header == 'ABC article 24'
+    assert url == urls[0]
+    assert 'numer 24' in content
+
+
+def test_stooq_symbols_offline(offline_site):
+    for page in range(1, 3):
+        offline_site.add('https://stooq.pl/t/?i=513&v=0&l={}'.format(page), stooq_table_page(
+            [['S{}{}'.format(page, i), 'Name {}'.format(i), '', '10.5'] for i in range(3)]))
+    symbols = download_stooq_symbols(n_pages=3)
+    assert symbols[:3] == [['S10', 'Name 0'], ['S11', 'Name 1'], ['S12', 'Name 2']]
+    assert len(symbols) == 6 + 2
+    assert symbols[-2:] == [['WIG', 'WIG'], ['WIG20', 'WIG20']]